@@ -4,29 +4,228 @@ This module provides basic CLI entrypoint.
 
 """
 
+import logging
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+import httpx
 import typer
 import uvicorn
+from django.core.cache import caches
 from django.core.management import call_command
 
 from emishows.asgi import app
 from emishows.config import config
-from emishows.events import Calendar, calendars
+from emishows.events import (
+    AsyncCalendar,
+    Calendar,
+    CalendarMirror,
+    ChangeFeed,
+    CircuitBreaker,
+    ICSCache,
+    Retry,
+    SearchCache,
+    SharedCounter,
+    SharedSearchCache,
+    StaleResults,
+    URLStore,
+    async_calendars,
+    calendars,
+    feeds,
+    ics_caches,
+    mirrors,
+)
+
+logger = logging.getLogger(__name__)
 
 cli = typer.Typer()
 
 
+def changes() -> SharedCounter:
+    """Returns the counter of writes made by all processes."""
+
+    key = f"calendar:{config.emitimes_calendar}:changes"
+    return SharedCounter(caches["default"], key)
+
+
+def search_cache() -> SearchCache:
+    """Returns a search cache shared by all processes if it can be."""
+
+    bucket = timedelta(seconds=config.cache_bucket)
+    if config.cache_url:
+        return SharedSearchCache(
+            caches["default"],
+            name=config.emitimes_calendar,
+            ttl=config.cache_ttl,
+            bucket=bucket,
+        )
+    # the default backend is local to the process then, and a local cache
+    # can drop just the windows that a write changes
+    return SearchCache(
+        maxsize=config.cache_size, ttl=config.cache_ttl, bucket=bucket
+    )
+
+
 def create_calendar() -> None:
+    url = f"http://{config.emitimes_host}:{config.emitimes_port}"
+    cache = search_cache()
+    limits = httpx.Limits(
+        max_connections=config.emitimes_max_connections,
+        max_keepalive_connections=config.emitimes_max_keepalive_connections,
+    )
+    timeout = httpx.Timeout(
+        config.emitimes_timeout,
+        connect=config.emitimes_connect_timeout,
+        pool=config.emitimes_pool_timeout,
+    )
+    # calendars are discovered on first use, not here
+    store = URLStore(config.emitimes_url_store)
+    retry = Retry(
+        attempts=config.emitimes_discovery_attempts,
+        backoff=config.emitimes_discovery_backoff,
+    )
+    # both clients talk to the same server, so they fail over together
+    breaker = CircuitBreaker(
+        threshold=config.emitimes_breaker_threshold,
+        reset=config.emitimes_breaker_reset,
+    )
+    stale = StaleResults(
+        searches=config.emitimes_stale_searches,
+        events=config.emitimes_stale_events,
+        ttl=config.emitimes_stale_ttl,
+    )
     calendars["emitimes"] = Calendar(
-        url=f"http://{config.emitimes_host}:{config.emitimes_port}",
+        url=url,
         name=config.emitimes_calendar,
         user=config.emitimes_user,
         password=config.emitimes_password,
+        cache=cache,
+        limits=limits,
+        timeout=timeout,
+        http2=config.emitimes_http2,
+        chunk_size=config.ics_chunk_size,
+        store=store,
+        retry=retry,
+        breaker=breaker,
+        stale=stale,
     )
+    async_calendars["emitimes"] = AsyncCalendar(
+        url=url,
+        name=config.emitimes_calendar,
+        user=config.emitimes_user,
+        password=config.emitimes_password,
+        cache=cache,
+        limits=limits,
+        timeout=timeout,
+        http2=config.emitimes_http2,
+        store=store,
+        retry=retry,
+        breaker=breaker,
+        stale=stale,
+    )
+    counter = changes()
+    calendars["emitimes"].listeners.append(counter.notify)
+    async_calendars["emitimes"].listeners.append(counter.notify)
+
+
+def create_ics_cache() -> None:
+    cache = ICSCache(
+        calendars["emitimes"],
+        ttl=config.ics_snapshot_ttl,
+        backend=caches["default"],
+        changes=changes(),
+    )
+    async_calendars["emitimes"].listeners.append(cache.notify)
+    ics_caches["emitimes"] = cache
+
+
+def create_mirror() -> None:
+    if config.sync_interval <= 0:
+        return
+    mirror = CalendarMirror(
+        calendars["emitimes"],
+        past=timedelta(days=config.sync_past_days),
+        future=timedelta(days=config.sync_future_days),
+        interval=config.sync_interval,
+        changes=changes(),
+        backend=caches["default"],
+    )
+    async_calendars["emitimes"].listeners.append(mirror.notify)
+    # clients are pushed the changes that the mirror finds
+    feed = ChangeFeed()
+    mirror.listeners.append(feed.publish)
+    mirror.start()
+    mirrors["emitimes"] = mirror
+    feeds["emitimes"] = feed
+
+
+def create_materializer() -> None:
+    # models can be imported only after Django is set up
+    from emishows.app.occurrences import OccurrenceMaterializer, materializers
+
+    if config.occurrences_interval <= 0:
+        return
+    materializer = OccurrenceMaterializer(
+        calendars["emitimes"],
+        past=timedelta(days=config.occurrences_past_days),
+        future=timedelta(days=config.occurrences_future_days),
+        interval=config.occurrences_interval,
+        backend=caches["default"],
+    )
+    async_calendars["emitimes"].listeners.append(materializer.notify)
+    materializer.start()
+    materializers["emitimes"] = materializer
 
 
 def setup() -> None:
-    call_command("migrate", "--no-input")
     create_calendar()
+    create_ics_cache()
+    create_mirror()
+    create_materializer()
+
+
+def migrate() -> bool:
+    """Applies migrations and returns whether they succeeded."""
+
+    try:
+        call_command("migrate", "--no-input")
+    except Exception:
+        logger.exception("Migrations failed.")
+        return False
+    return True
+
+
+def share_metrics() -> bool:
+    """Lets worker processes report metrics through a shared directory.
+
+    Returns whether the directory was created and should be removed.
+    """
+
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if path is None:
+        path = tempfile.mkdtemp(prefix="emishows-metrics-")
+        # workers are started with the environment of this process
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = path
+        return True
+    # files left by earlier runs would be added to the new values
+    for name in os.listdir(path):
+        if name.endswith(".db"):
+            os.remove(os.path.join(path, name))
+    return False
+
+
+def create_app():
+    """Sets up the current process and returns the ASGI app.
+
+    Used as an app factory, so that each worker process creates its own
+    clients and background threads after it starts. Other servers can use
+    it too, e.g. gunicorn with "emishows.__main__:create_app()".
+    """
+
+    setup()
+    return app
 
 
 @cli.command()
@@ -35,10 +234,32 @@ def main(
         default="0.0.0.0", help="Host to run the server on"
     ),
     port: int = typer.Option(default=35000, help="Port to run the server on"),
+    workers: int = typer.Option(
+        default=1, min=1, help="Number of worker processes"
+    ),
+    migrations: bool = typer.Option(
+        False,
+        "--migrate/--no-migrate",
+        help="Apply migrations before starting workers. "
+        "By default they are left to 'emishows-manage migrate'.",
+    ),
 ):
     """Command line interface for emishows."""
-    setup()
-    uvicorn.run(app, host=host, port=port)
+    # once, before any worker can use the database
+    if migrations and not migrate():
+        raise typer.Exit(code=1)
+    shared = workers > 1 and share_metrics()
+    try:
+        uvicorn.run(
+            "emishows.__main__:create_app",
+            factory=True,
+            host=host,
+            port=port,
+            workers=workers,
+        )
+    finally:
+        if shared:
+            shutil.rmtree(os.environ.pop("PROMETHEUS_MULTIPROC_DIR"))
 
 
 if __name__ == "__main__":
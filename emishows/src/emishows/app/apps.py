@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+from emishows.metrics import time_query
+
+
+def instrument_connection(sender, connection, **kwargs) -> None:
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
 
 
 class Config(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "emishows.app"
+
+    def ready(self) -> None:
+        connection_created.connect(instrument_connection)
@@ -0,0 +1,95 @@
+"""Async views for the hottest read paths.
+
+DRF views are synchronous, so these are plain Django views that use
+AsyncCalendar and don't hold a worker thread while waiting for CalDAV.
+Everything else that blocks, like the database and the mirror, is run
+with sync_to_async.
+
+"""
+
+from datetime import datetime
+from itertools import islice
+from typing import Any, Dict, Iterable, Optional
+from uuid import UUID
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework.exceptions import ValidationError
+
+from emishows.app.renderers import JSONRenderer, StreamingJSONRenderer
+from emishows.app.serializers import BaseEventParamsSerializer
+from emishows.app.views import TimetableViewSet
+from emishows.events import CalendarError, async_calendars, mirrors
+from emishows.events import Event as CalendarEvent
+
+
+def _json(data, status: int = 200) -> HttpResponse:
+    return HttpResponse(
+        JSONRenderer().render(data),
+        status=status,
+        content_type="application/json",
+    )
+
+
+async def _search(
+    from_date: datetime,
+    to_date: datetime,
+    limit: Optional[int] = None,
+    filters: Optional[Dict[str, Any]] = None,
+) -> Iterable[CalendarEvent]:
+    """Works like emishows.app.schedule.search with AsyncCalendar."""
+
+    mirror = mirrors.get("emitimes")
+    if mirror is not None:
+        # mirrored occurrences are already sorted by start
+        events = await sync_to_async(mirror.search)(
+            from_date, to_date, filters
+        )
+        if events is not None:
+            return events[:limit]
+    # expanded while the response is sent, so memory doesn't grow with
+    # the window
+    calendar = async_calendars["emitimes"]
+    return await calendar.iter_search(from_date, to_date, limit, filters)
+
+
+async def timetable(request):
+    try:
+        from_date, to_date = TimetableViewSet.parse_window(request.GET)
+        limit = TimetableViewSet.parse_limit(request.GET)
+        filters = TimetableViewSet.parse_filters(request.GET)
+    except ValidationError as e:
+        return _json(e.detail, status=400)
+
+    batch_size = TimetableViewSet.batch_size
+    search_occurrences = sync_to_async(TimetableViewSet.search_occurrences)
+    occurrences = await search_occurrences(from_date, to_date)
+    if occurrences is not None:
+        occurrences = occurrences.filter(
+            **{f"event__{key}": value for key, value in filters.items()}
+        )
+        items = TimetableViewSet.iter_serialize_occurrences(
+            occurrences[:limit], batch_size
+        )
+    else:
+        try:
+            calendar_events = await _search(from_date, to_date, limit, filters)
+        except CalendarError:
+            return _json(["Unable to retrieve events."], status=400)
+        # the calendar filters by the show and type stamped on events
+        items = TimetableViewSet.iter_serialize(
+            calendar_events, batch_size, filters
+        )
+        items = islice(items, limit)
+    # events are loaded from the database while the body is sent, in the
+    # thread that the handler iterates streamed content in
+    content = StreamingJSONRenderer().render_stream(items)
+    return StreamingHttpResponse(content, content_type="application/json")
+
+
+async def event_params(request, id: UUID):
+    try:
+        event = await async_calendars["emitimes"].get(id)
+    except CalendarError:
+        return _json(["Unable to retrieve event parameters."], status=400)
+    return _json(BaseEventParamsSerializer(event).data)
@@ -0,0 +1,83 @@
+"""Status of the services emishows depends on.
+
+Each check returns None when the dependency is usable or a short reason
+why it isn't. Checks don't retry, so that probes answer quickly.
+
+"""
+
+import logging
+from typing import Callable, Dict, Optional
+
+from django.core.cache import caches
+from django.db import DatabaseError, connection
+from django.db.migrations.executor import MigrationExecutor
+
+from emishows.events import CalendarError, calendars
+
+Check = Callable[[], Optional[str]]
+
+
+def check_database() -> Optional[str]:
+    try:
+        connection.ensure_connection()
+        executor = MigrationExecutor(connection)
+        plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+    except DatabaseError:
+        return "Can't connect to database."
+    if plan:
+        # migrations may still be running in the background
+        return f"{len(plan)} migrations not applied."
+    return None
+
+
+def check_calendar() -> Optional[str]:
+    calendar = calendars.get("emitimes")
+    if calendar is None:
+        return "Calendar not configured."
+    try:
+        calendar.resolve(attempts=1)
+        calendar.ctag()
+    except CalendarError as e:
+        return str(e)
+    return None
+
+
+def check_cache() -> Optional[str]:
+    backend = caches["default"]
+    try:
+        backend.set("health", True, timeout=10)
+        if backend.get("health") is None:
+            return "Cache doesn't keep values."
+    except Exception:
+        # backends raise their own client errors
+        return "Can't connect to cache."
+    return None
+
+
+checks: Dict[str, Check] = {
+    "database": check_database,
+    "calendar": check_calendar,
+    "cache": check_cache,
+}
+
+
+def readiness() -> Dict[str, Optional[str]]:
+    """Runs all checks and returns their results by name."""
+
+    return {name: check() for name, check in checks.items()}
+
+
+class ProbeLogFilter(logging.Filter):
+    """Drops logs of failed readiness probes.
+
+    Probes are expected to fail while starting, that's not a server error.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        request = getattr(record, "request", None)
+        match = getattr(request, "resolver_match", None)
+        return not (
+            getattr(record, "status_code", None) == 503
+            and match is not None
+            and match.url_name == "ready"
+        )
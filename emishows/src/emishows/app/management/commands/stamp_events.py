@@ -0,0 +1,63 @@
+"""Copies show and type of stored events into their calendar objects.
+
+Events saved before searches could filter by show and type don't carry
+them in the calendar, so filtered searches miss them until this is run.
+
+"""
+
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from emishows.app.models import Event
+from emishows.app.serializers import stamp
+from emishows.events import CalendarError, calendars
+
+
+class Command(BaseCommand):
+    help = "Stamps show and type of all events into the calendar."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Number of events fetched from the calendar at a time.",
+        )
+
+    def handle(self, *args, batch_size: int, **options):
+        if "emitimes" not in calendars:
+            from emishows.__main__ import create_calendar
+
+            create_calendar()
+        calendar = calendars["emitimes"]
+
+        stamped, failed = 0, 0
+        events = Event.objects.order_by("id").iterator(chunk_size=batch_size)
+        while batch := list(islice(events, batch_size)):
+            try:
+                current = calendar.get_many_tagged(
+                    (event.id for event in batch), allow_stale=False
+                )
+            except CalendarError as e:
+                raise CommandError("Unable to retrieve events.") from e
+            params = [
+                {**current[event.id][0].dict(), **stamp(event)}
+                for event in batch
+                if event.id in current
+                and stamp(event)
+                != {
+                    "show": current[event.id][0].show,
+                    "type": current[event.id][0].type,
+                }
+            ]
+            etags = {uid: etag for uid, (_, etag) in current.items()}
+            result = calendar.update_many(params, etags)
+            stamped += len(result.succeeded)
+            failed += len(result.failed)
+            for uid, error in result.failed.items():
+                self.stderr.write(f"Event {uid}: {error}")
+
+        self.stdout.write(f"Stamped {stamped} events, {failed} failed.")
+        if failed:
+            raise CommandError("Some events were not stamped.")
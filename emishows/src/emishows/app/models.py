@@ -23,3 +23,24 @@ class Event(models.Model):
         if self.show is None:
             return f"Event {self.id}"
         return f"Event {self.id} ('{self.show.title}')"
+
+
+class Occurrence(models.Model):
+    """Single occurrence of an event, materialized from the calendar."""
+
+    event = models.ForeignKey(
+        Event, on_delete=models.CASCADE, related_name="occurrences"
+    )
+    start = models.DateTimeField()
+    start_timezone = models.CharField(max_length=64)
+    end = models.DateTimeField()
+    end_timezone = models.CharField(max_length=64)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["start", "end"]),
+            models.Index(fields=["end"]),
+        ]
+
+    def __str__(self):
+        return f"Occurrence of event {self.event_id} at {self.start}"
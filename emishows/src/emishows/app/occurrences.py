@@ -0,0 +1,273 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from uuid import UUID, uuid4
+
+from caldav.lib.error import DAVError
+from django.core.cache.backends.base import BaseCache
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q, QuerySet
+
+from emishows.app.models import Event, Occurrence
+from emishows.events import Calendar, CalendarError
+from emishows.events import Event as CalendarEvent
+from emishows.metrics import CACHE_LOOKUPS
+from emishows.utils import utcnow
+
+logger = logging.getLogger(__name__)
+
+Window = Tuple[datetime, datetime]
+
+
+def overlapping(
+    queryset: QuerySet, from_date: datetime, to_date: datetime
+) -> QuerySet:
+    """Filters occurrences like emishows.events.index.overlaps does."""
+
+    return queryset.filter(
+        Q(start__lt=to_date) & (Q(end__gt=from_date) | Q(start__gte=from_date))
+    )
+
+
+class OccurrenceMaterializer:
+    """Keeps the Occurrence table in sync with the calendar.
+
+    Occurrences over a rolling horizon are written to the database, so that
+    timetable queries become indexed range scans. Written events are
+    re-materialized individually, everything else is refreshed when the
+    calendar changes or the horizon moves. Processes sharing a cache
+    ``backend`` also share the table state and take turns rebuilding it.
+    """
+
+    def __init__(
+        self,
+        calendar: Calendar,
+        past: timedelta = timedelta(days=7),
+        future: timedelta = timedelta(days=180),
+        interval: float = 300,
+        batch_size: int = 1000,
+        backend: Optional[BaseCache] = None,
+    ) -> None:
+        self.calendar = calendar
+        self.past = past
+        self.future = future
+        self.interval = interval
+        self.batch_size = batch_size
+        self.backend = backend
+        # how long a process stays the one that rebuilds the table
+        self.lease = max(3 * interval, 60)
+        self.ctag: Optional[str] = None
+        self._span: Optional[Window] = None
+        self._token = uuid4().hex
+        self._pending: Set[UUID] = set()
+        self._pending_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.RLock()
+        self._thread: Optional[threading.Thread] = None
+        calendar.listeners.append(self.notify)
+
+    @property
+    def ready(self) -> bool:
+        return self._span is not None
+
+    @property
+    def pending(self) -> bool:
+        return bool(self._pending)
+
+    def notify(self, uid: UUID) -> None:
+        self._add_pending(uid)
+        if connection.in_atomic_block:
+            # a flush before the event's row is committed can't see it, so
+            # flush it again afterwards
+            transaction.on_commit(lambda: self._add_pending(uid))
+
+    def _add_pending(self, uid: UUID) -> None:
+        with self._pending_lock:
+            self._pending.add(uid)
+        self._wakeup.set()
+
+    def _take_pending(self) -> List[UUID]:
+        with self._pending_lock:
+            return list(self._pending)
+
+    def _discard_pending(self, uids: Iterable[UUID]) -> None:
+        with self._pending_lock:
+            self._pending.difference_update(uids)
+
+    def _key(self, name: str) -> str:
+        return f"occurrences:{self.calendar.name}:{name}"
+
+    def _lead(self) -> bool:
+        """Returns whether this process should rebuild the table.
+
+        Processes sharing a backend elect one of them with a lease, the
+        others only re-materialize their own writes.
+        """
+
+        if self.backend is None:
+            return True
+        key = self._key("leader")
+        if self.backend.add(key, self._token, timeout=self.lease):
+            return True
+        if self.backend.get(key) == self._token:
+            self.backend.touch(key, timeout=self.lease)
+            return True
+        return False
+
+    def _load_state(self) -> None:
+        if self.backend is not None:
+            state = self.backend.get(self._key("state"))
+            if state is not None:
+                self._span, self.ctag = state
+
+    def _save_state(self) -> None:
+        if self.backend is not None:
+            state = (self._span, self.ctag)
+            self.backend.set(self._key("state"), state, timeout=None)
+
+    def _horizon(self) -> Window:
+        now = utcnow()
+        return now - self.past, now + self.future
+
+    @staticmethod
+    def _occurrences(events: Iterable[CalendarEvent]) -> List[Occurrence]:
+        events = list(events)
+        existing = set(
+            Event.objects.filter(
+                id__in={event.uid for event in events}
+            ).values_list("id", flat=True)
+        )
+        # events that are not in the database yet are picked up later
+        return [
+            Occurrence(
+                event_id=event.uid,
+                start=event.start,
+                start_timezone=event.start.tzinfo.key,
+                end=event.end,
+                end_timezone=event.end.tzinfo.key,
+            )
+            for event in events
+            if event.uid in existing
+        ]
+
+    def refresh(self, force: bool = False) -> bool:
+        """Rebuild all occurrences if the calendar or horizon changed.
+
+        Returns whether the table was rebuilt.
+        """
+
+        with self._lock:
+            self._load_state()
+            if not self._lead():
+                return False
+            span = self._horizon()
+            ctag = self.calendar.ctag()
+            moved = self._span is None
+            moved = moved or span[0] - self._span[0] > timedelta(hours=1)
+            if not force and not moved and ctag == self.ctag:
+                return False
+            pending = self._take_pending()
+            objects = self.calendar._search(*span)
+            events = self.calendar._expand_events(objects, *span)
+            occurrences = self._occurrences(events)
+            with transaction.atomic():
+                Occurrence.objects.all().delete()
+                Occurrence.objects.bulk_create(
+                    occurrences, batch_size=self.batch_size
+                )
+            self._discard_pending(pending)
+            self._span, self.ctag = span, ctag
+            self._save_state()
+            return True
+
+    def flush(self) -> None:
+        """Re-materialize events written since the last flush."""
+
+        with self._lock:
+            uids = self._take_pending()
+            if not uids:
+                return
+            self._load_state()
+            if self._span is None:
+                return
+            # later changes by others show up as a different tag
+            ctag = self.calendar.ctag()
+            urls = [self.calendar._event_url(uid) for uid in uids]
+            try:
+                objects = self.calendar.calendar.calendar_multiget(urls)
+            except DAVError as e:
+                raise CalendarError("Can't retrieve events.") from e
+            # missing resources come back with no calendar data
+            objects = [obj for obj in objects if obj.data is not None]
+            events = self.calendar._expand_events(objects, *self._span)
+            occurrences = self._occurrences(events)
+            with transaction.atomic():
+                Occurrence.objects.filter(event_id__in=uids).delete()
+                Occurrence.objects.bulk_create(
+                    occurrences, batch_size=self.batch_size
+                )
+            self._discard_pending(uids)
+            materialized = {occurrence.event_id for occurrence in occurrences}
+            # events without rows yet are left to a refresh, which happens
+            # only if the tag differs
+            if materialized.issuperset(event.uid for event in events):
+                self.ctag = ctag
+                self._save_state()
+
+    def covers(self, from_date: datetime, to_date: datetime) -> bool:
+        span = self._span
+        if span is None:
+            return False
+        return span[0] <= from_date and to_date <= span[1]
+
+    def search(
+        self, from_date: datetime, to_date: datetime
+    ) -> Optional[QuerySet]:
+        """Returns occurrences in the window or None if it can't answer."""
+
+        if self.pending:
+            try:
+                self.flush()
+            except CalendarError:
+                CACHE_LOOKUPS.labels("occurrences", "miss").inc()
+                return None
+        if not self.covers(from_date, to_date):
+            CACHE_LOOKUPS.labels("occurrences", "miss").inc()
+            return None
+        CACHE_LOOKUPS.labels("occurrences", "hit").inc()
+        queryset = Occurrence.objects.select_related("event__show")
+        return overlapping(queryset, from_date, to_date).order_by("start")
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wakeup.clear()
+            try:
+                # flush first, so own writes don't trigger a full refresh
+                self.flush()
+                self.refresh()
+            except Exception:
+                logger.exception("Occurrence materialization failed.")
+            finally:
+                close_old_connections()
+            self._wakeup.wait(self.interval)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="occurrence-materializer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+materializers: Dict[str, OccurrenceMaterializer] = {}
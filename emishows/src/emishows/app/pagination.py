@@ -0,0 +1,9 @@
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """Keyset pagination over the primary key."""
+
+    ordering = "id"
+    page_size_query_param = "page_size"
+    max_page_size = 1000
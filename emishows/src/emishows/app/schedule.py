@@ -0,0 +1,57 @@
+"""Occurrences of all events, as the timetable sees them.
+
+Mirrored occurrences are used whenever they cover the window, so that
+checking for conflicts doesn't scan the calendar again.
+
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from emishows.events import Calendar, calendars, mirrors
+from emishows.events import Event as CalendarEvent
+from emishows.events.index import conflicts
+
+# recurring events are checked for conflicts only this far ahead
+HORIZON = timedelta(days=180)
+# servers may read local times without VTIMEZONE as UTC, so search wider
+MARGIN = timedelta(days=1)
+
+
+def search(
+    from_date: datetime,
+    to_date: datetime,
+    limit: Optional[int] = None,
+    filters: Optional[Dict[str, Any]] = None,
+) -> Iterable[CalendarEvent]:
+    """Returns occurrences in the window, optionally by show or type."""
+
+    mirror = mirrors.get("emitimes")
+    if mirror is not None:
+        # mirrored occurrences are already sorted by start
+        events = mirror.search(from_date, to_date, filters)
+        if events is not None:
+            return events[:limit]
+    calendar = calendars["emitimes"]
+    if limit is None:
+        return calendar.search(from_date, to_date, filters=filters)
+    return calendar.iter_search(from_date, to_date, limit, filters)
+
+
+def find_conflicts(
+    event: CalendarEvent, horizon: timedelta = HORIZON
+) -> List[Tuple[CalendarEvent, CalendarEvent]]:
+    """Returns occurrences of the event paired with overlapping ones.
+
+    Other occurrences are searched only within the span of the event's
+    own, and stored occurrences of the same event are ignored, since
+    they are about to be replaced.
+    """
+
+    occurrences = Calendar.expand(event, event.start, event.start + horizon)
+    if not occurrences:
+        return []
+    from_date = min(occurrence.start for occurrence in occurrences)
+    to_date = max(occurrence.end for occurrence in occurrences)
+    others = search(from_date - MARGIN, to_date + MARGIN)
+    return conflicts(occurrences, others)
@@ -1,18 +1,37 @@
 import json
 from datetime import datetime
 from json import JSONDecodeError
-from uuid import uuid4
+from typing import Dict, List, Optional
+from uuid import UUID, uuid4
 from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
-from django.db import transaction
+from django.db import DatabaseError, transaction
+from django.db.models import Manager
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
+from rest_framework.fields import empty
 
+from emishows.app.encoders import encode_params, format_datetime
+from emishows.app.exceptions import Conflict, PreconditionFailed
 from emishows.app.models import Event, Show
-from emishows.events import CalendarError, calendars
+from emishows.app.schedule import find_conflicts
+from emishows.events import (
+    BulkResult,
+    CalendarConflictError,
+    CalendarError,
+    calendars,
+)
+from emishows.events import Event as CalendarEvent
+from emishows.metrics import SERIALIZATION_DURATION, timer
 from emishows.utils import parse_datetime_with_timezone
 
 
+def stamp(event: Event) -> Dict[str, int]:
+    """Returns the fields of an event that are copied to the calendar."""
+
+    return {"show": event.show_id, "type": event.type}
+
+
 class ShowSerializer(serializers.ModelSerializer):
     class Meta:
         model = Show
@@ -32,7 +51,7 @@ class DateTimeField(serializers.DateTimeField):
 
     @staticmethod
     def _format(dt: datetime) -> str:
-        return f"{dt.strftime('%Y-%m-%dT%H:%M:%S')} {dt.tzinfo}"
+        return format_datetime(dt)
 
     def to_representation(self, value):
         if not isinstance(value, datetime):
@@ -69,13 +88,21 @@ class EventParamsSerializer(BaseEventParamsSerializer):
     def _get_id(self):
         return self.context["id"]
 
-    def to_representation(self, instance):
+    def _get_event(self):
+        prefetched = self.context.get("params")
+        if prefetched is not None:
+            return prefetched.get(self._get_id())
         try:
-            event = calendars["emitimes"].get(self._get_id())
+            return calendars["emitimes"].get(self._get_id())
         except CalendarError as e:
             raise ValidationError(
                 "Unable to retrieve event parameters."
             ) from e
+
+    def to_representation(self, instance):
+        event = self._get_event()
+        if event is None:
+            return None
         return {
             "start": self.fields["start"].to_representation(event.start),
             "end": self.fields["end"].to_representation(event.end),
@@ -83,10 +110,23 @@ class EventParamsSerializer(BaseEventParamsSerializer):
         }
 
     def update(self, instance, validated_data):
+        # the version of the event that the client retrieved, if any
+        etag = self.context.get("etag")
         try:
-            calendars["emitimes"].update(self._get_id(), **validated_data)
+            event, saved_etag = calendars["emitimes"].update_tagged(
+                self._get_id(), etag, **validated_data
+            )
+        except CalendarConflictError as e:
+            if etag is not None:
+                raise PreconditionFailed() from e
+            raise Conflict(
+                "Event parameters were modified concurrently."
+            ) from e
         except CalendarError as e:
             raise ValidationError("Unable to save event parameters.") from e
+        # the response shows the saved event, without fetching it again
+        self.context["params"] = {event.uid: event}
+        self.context["etags"] = {event.uid: saved_etag}
         return instance
 
     def create(self, validated_data):
@@ -96,6 +136,8 @@ class EventParamsSerializer(BaseEventParamsSerializer):
                 start=validated_data["start"],
                 end=validated_data["end"],
                 rules=validated_data.get("rules"),
+                show=validated_data.get("show"),
+                type=validated_data.get("type"),
             )
         except CalendarError as e:
             raise ValidationError("Unable to save event parameters.") from e
@@ -108,18 +150,179 @@ class BaseEventSerializer(serializers.ModelSerializer):
         model = Event
         fields = ["id", "show", "type"]
 
+    def _get_show(self, instance):
+        # shows are shared by many events, so serialize each one only once
+        shows = self.context.setdefault("shows", {})
+        show = shows.get(instance.show_id)
+        if show is None:
+            show = ShowSerializer(instance.show).data
+            shows[instance.show_id] = show
+        return show
+
     def to_representation(self, instance):
         response = super().to_representation(instance)
-        response["show"] = ShowSerializer(instance.show).data
+        response["show"] = self._get_show(instance)
         return response
 
 
+class EventListSerializer(serializers.ListSerializer):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # outcome of the last bulk write
+        self.saved_params: Dict[UUID, CalendarEvent] = {}
+        self.failures: Dict[UUID, dict] = {}
+        # ids of the events in the order of the items
+        self.ids: List[UUID] = []
+        self._instances: Optional[Dict[str, Event]] = None
+
+    def get_instance(self, data) -> Optional[Event]:
+        """Returns the event that an item of the data updates."""
+
+        if self._instances is None:
+            self._instances = {
+                str(instance.id): instance for instance in self.instance or []
+            }
+        uid = data.get("id") if isinstance(data, dict) else None
+        return self._instances.get(str(uid))
+
+    def _get_params(self, events: List[Event]) -> Dict[UUID, CalendarEvent]:
+        params = {
+            event.id: self.saved_params[event.id]
+            for event in events
+            if event.id in self.saved_params
+        }
+        try:
+            params.update(
+                calendars["emitimes"].get_many(
+                    event.id for event in events if event.id not in params
+                )
+            )
+        except CalendarError as e:
+            raise ValidationError(
+                "Unable to retrieve event parameters."
+            ) from e
+        return params
+
+    def to_representation(self, data):
+        events = data.all() if isinstance(data, Manager) else data
+        events = list(events)
+        params = self._get_params(events)
+        with timer("serialize", SERIALIZATION_DURATION.labels("events")):
+            return [
+                self.child.encode(event, params.get(event.id))
+                for event in events
+            ]
+
+    def _record(self, result: BulkResult) -> None:
+        self.saved_params.update(result.succeeded)
+        for uid, error in result.failed.items():
+            self.failures[uid] = {"params": [str(error)]}
+
+    def create(self, validated_data):
+        calendar = calendars["emitimes"]
+        events, params = [], []
+        for item in validated_data:
+            item = dict(item)
+            uid = uuid4()
+            change = item.pop("params")
+            events.append(Event(id=uid, **item))
+            params.append({"uid": uid, **change, **stamp(events[-1])})
+        self.ids = [event.id for event in events]
+
+        result = None
+        try:
+            with transaction.atomic():
+                Event.objects.bulk_create(events)
+                result = calendar.add_many(params)
+                Event.objects.filter(id__in=result.failed).delete()
+        except DatabaseError:
+            # rows were rolled back, so drop the saved parameters too
+            if result is not None:
+                calendar.delete_many(result.succeeded)
+            raise
+
+        self._record(result)
+        return [event for event in events if event.id in result.succeeded]
+
+    def update(self, instances, validated_data):
+        calendar = calendars["emitimes"]
+        self.ids = [instance.id for instance in instances]
+        changes, restamped = {}, set()
+        for instance, item in zip(instances, validated_data):
+            show = item["show"].id if "show" in item else instance.show_id
+            fields = {"show": show, "type": item.get("type", instance.type)}
+            if "params" in item:
+                changes[instance.id] = {**item["params"], **fields}
+            elif fields != stamp(instance):
+                # stamp moved events again, so filtered searches find them
+                changes[instance.id] = fields
+                restamped.add(instance.id)
+        try:
+            # merged with the changes and saved, so it must be current
+            previous = calendar.get_many_tagged(changes, allow_stale=False)
+        except CalendarError as e:
+            raise ValidationError(
+                "Unable to retrieve event parameters."
+            ) from e
+
+        params = []
+        for uid, change in changes.items():
+            if uid not in previous and uid in restamped:
+                continue
+            if uid not in previous:
+                self.failures[uid] = {
+                    "params": ["Event parameters not found."]
+                }
+                continue
+            params.append({**previous[uid][0].dict(), **change})
+
+        updated, originals = [], {}
+        for instance, item in zip(instances, validated_data):
+            if instance.id in self.failures:
+                continue
+            originals[instance.id] = (instance.show, instance.type)
+            instance.show = item.get("show", instance.show)
+            instance.type = item.get("type", instance.type)
+            updated.append(instance)
+
+        result = None
+        try:
+            with transaction.atomic():
+                Event.objects.bulk_update(updated, ["show", "type"])
+                # the changes were merged with these versions
+                result = calendar.update_many(
+                    params,
+                    {uid: etag for uid, (_, etag) in previous.items()},
+                )
+                for instance in updated:
+                    if instance.id in result.failed:
+                        instance.show, instance.type = originals[instance.id]
+                Event.objects.bulk_update(
+                    [i for i in updated if i.id in result.failed],
+                    ["show", "type"],
+                )
+        except DatabaseError:
+            # rows were rolled back, so restore the old parameters too
+            if result is not None:
+                calendar.update_many(
+                    previous[uid][0].dict() for uid in result.succeeded
+                )
+            raise
+
+        self._record(result)
+        return [i for i in updated if i.id not in result.failed]
+
+
 class EventSerializer(BaseEventSerializer):
     params = EventParamsSerializer(allow_null=True)
 
+    # event that the item being validated updates, under a list serializer
+    item: Optional[Event] = None
+
     class Meta:
         model = Event
         fields = ["id", "show", "type", "params"]
+        list_serializer_class = EventListSerializer
 
     def _set_context(self, uid):
         self.fields["params"].context["id"] = uid
@@ -130,10 +333,79 @@ class EventSerializer(BaseEventSerializer):
             raise ValidationError("Params can't be null.")
         return value
 
+    def run_validation(self, data=empty):
+        # the instance of a child of a list serializer is the whole list
+        if isinstance(self.parent, EventListSerializer):
+            self.item = self.parent.get_instance(data)
+        return super().run_validation(data)
+
+    def _get_instance(self) -> Optional[Event]:
+        if isinstance(self.parent, EventListSerializer):
+            return self.item
+        return self.instance
+
+    def _check_conflicts(self, params) -> None:
+        instance = self._get_instance()
+        uid = instance.id if instance is not None else uuid4()
+        try:
+            missing = {"start", "end", "rules"}.difference(params)
+            if instance is not None and missing:
+                previous = calendars["emitimes"].get(uid)
+                params = {**previous.dict(), **params}
+            if params["start"] >= params["end"]:
+                raise ValidationError(
+                    {"params": ["Start must be before end."]}
+                )
+            event = CalendarEvent(**{**params, "uid": uid})
+            pairs = find_conflicts(event)
+        except CalendarError as e:
+            raise ValidationError(
+                {"params": ["Unable to check for conflicts."]}
+            ) from e
+        # report only the first overlap with each event
+        overlaps = {}
+        for occurrence, other in pairs:
+            overlaps.setdefault(other.uid, (occurrence, other))
+        if overlaps:
+            fmt = DateTimeField._format
+            raise ValidationError(
+                {
+                    "params": [
+                        f"Overlaps with event {other.uid} "
+                        f"from {fmt(other.start)} to {fmt(other.end)}."
+                        for _, other in overlaps.values()
+                    ]
+                }
+            )
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        if self.context.get("reject_conflicts") and attrs.get("params"):
+            self._check_conflicts(attrs["params"])
+        return attrs
+
+    def encode(self, instance: Event, params: Optional[CalendarEvent]) -> dict:
+        """Returns the same data as to_representation for known params.
+
+        Used for lists, so that fields aren't looked up for each event.
+        """
+
+        response = {
+            "id": str(instance.id),
+            "show": self._get_show(instance),
+            "type": self.fields["type"].to_representation(instance.type),
+            "params": None if params is None else encode_params(params),
+        }
+        if params is None:
+            response["errors"] = {"params": ["Event parameters not found."]}
+        return response
+
     def to_representation(self, instance):
         self._set_context(instance.id)
         response = super().to_representation(instance)
         response["params"] = self.fields["params"].to_representation(None)
+        if response["params"] is None:
+            response["errors"] = {"params": ["Event parameters not found."]}
         return response
 
     @transaction.atomic
@@ -145,7 +417,7 @@ class EventSerializer(BaseEventSerializer):
 
         params = validated_data.pop("params", {})
         event = Event.objects.create(**validated_data)
-        self.fields["params"].create(params)
+        self.fields["params"].create({**params, **stamp(event)})
         return event
 
     @transaction.atomic
@@ -154,12 +426,17 @@ class EventSerializer(BaseEventSerializer):
         self._set_context(uid)
 
         new_params = validated_data.pop("params", {})
-        old_params = self.fields["params"].to_representation(None)
+        previous = stamp(instance)
 
         instance.id = uid
         instance.show = validated_data.get("show", instance.show)
         instance.type = validated_data.get("type", instance.type)
         instance.save()
 
-        self.fields["params"].update(old_params, new_params)
+        # searches filter by show and type, so keep them in sync, and
+        # conditional updates are checked by the calendar
+        changed = new_params or stamp(instance) != previous
+        if changed or self.context.get("etag") is not None:
+            new_params = {**new_params, **stamp(instance)}
+            self.fields["params"].update(instance, new_params)
         return instance
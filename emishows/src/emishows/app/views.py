@@ -1,21 +1,51 @@
-from datetime import datetime
-from typing import Optional
-from zoneinfo import ZoneInfoNotFoundError
+import os
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from uuid import UUID
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 from django.db import transaction
-from django.http import StreamingHttpResponse
-from rest_framework import views, viewsets
+from django.db.models import QuerySet
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    generate_latest,
+    multiprocess,
+)
+from rest_framework import serializers, status, views, viewsets
+from rest_framework.decorators import action
 from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
+from emishows.app.encoders import encode_params, format_datetime
+from emishows.app.exceptions import PreconditionFailed
+from emishows.app.health import readiness
 from emishows.app.models import Event, Show
+from emishows.app.occurrences import materializers
+from emishows.app.schedule import search
 from emishows.app.serializers import (
-    BaseEventParamsSerializer,
     BaseEventSerializer,
+    DateTimeField,
     EventSerializer,
     ShowSerializer,
 )
-from emishows.events import CalendarError, calendars
+from emishows.compression import negotiate
+from emishows.events import (
+    CalendarConflictError,
+    CalendarError,
+    ICSSnapshot,
+    calendars,
+    ics_caches,
+)
+from emishows.events import Event as CalendarEvent
+from emishows.events import index
+from emishows.metrics import SERIALIZATION_DURATION, timer
 from emishows.utils import (
     parse_datetime_with_timezone,
     utcnow,
@@ -28,54 +58,362 @@ class ShowViewSet(viewsets.ModelViewSet):
 
 
 class EventViewSet(viewsets.ModelViewSet):
-    queryset = Event.objects.all()
+    queryset = Event.objects.select_related("show")
     serializer_class = EventSerializer
     filterset_fields = ["show", "type"]
+    # ETag of the event saved by an update
+    saved_etag: Optional[str] = None
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        param = self.request.query_params.get("reject_conflicts")
+        if param is not None:
+            field = serializers.BooleanField()
+            try:
+                context["reject_conflicts"] = field.run_validation(param)
+            except ValidationError as e:
+                raise ValidationError(
+                    "reject_conflicts must be a boolean."
+                ) from e
+        etag = self.if_match()
+        if etag is not None:
+            context["etag"] = etag
+        return context
+
+    def if_match(self) -> Optional[str]:
+        """Returns the calendar ETag that a write is conditional on."""
+
+        etag = self.request.headers.get("If-Match")
+        # compressed responses carry weakened tags, but the calendar only
+        # knows the strong ones
+        if etag is not None and etag.startswith("W/"):
+            etag = etag[2:]
+        return etag
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        try:
+            params, etag = calendars["emitimes"].get_tagged(instance.id)
+        except CalendarError as e:
+            raise ValidationError(
+                "Unable to retrieve event parameters."
+            ) from e
+        context = self.get_serializer_context()
+        context["params"] = {instance.id: params}
+        serializer = self.get_serializer(instance, context=context)
+        # clients send the tag back in If-Match to update or delete only
+        # the version they retrieved
+        headers = {"ETag": etag} if etag is not None else None
+        return Response(serializer.data, headers=headers)
+
+    def update(self, request, *args, **kwargs):
+        response = super().update(request, *args, **kwargs)
+        # clients can make another conditional write without a GET
+        if self.saved_etag is not None:
+            response.headers["ETag"] = self.saved_etag
+        return response
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        etags = serializer.context.get("etags", {})
+        self.saved_etag = etags.get(serializer.instance.id)
 
     @transaction.atomic
     def perform_destroy(self, instance: Event):
         uid = instance.id
+        etag = self.if_match()
         super().perform_destroy(instance)
         try:
-            calendars["emitimes"].delete(uid)
+            calendars["emitimes"].delete(uid, etag=etag)
+        except CalendarConflictError as e:
+            raise PreconditionFailed() from e
         except CalendarError as e:
             raise ValidationError("Unable to delete event params.") from e
 
+    @staticmethod
+    def _bulk_ids(data) -> List[UUID]:
+        if isinstance(data, list):
+            data = [
+                item.get("id") if isinstance(item, dict) else item
+                for item in data
+            ]
+        field = serializers.ListField(child=serializers.UUIDField())
+        return field.run_validation(data)
+
+    @staticmethod
+    def _bulk_response(
+        serializer, success_status: int, created: bool = False
+    ) -> Response:
+        # results follow the items, failures point to theirs by index
+        saved = {item["id"]: item for item in serializer.data}
+        data = []
+        for index, uid in enumerate(serializer.ids):
+            if uid not in serializer.failures:
+                data.append(saved[str(uid)])
+                continue
+            failure = {"index": index, "errors": serializer.failures[uid]}
+            # ids of events that weren't created mean nothing to clients
+            if not created:
+                failure["id"] = str(uid)
+            data.append(failure)
+        if serializer.failures:
+            return Response(data, status=status.HTTP_207_MULTI_STATUS)
+        return Response(data, status=success_status)
+
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return self._bulk_response(
+            serializer, status.HTTP_201_CREATED, created=True
+        )
+
+    @bulk.mapping.patch
+    def bulk_update(self, request):
+        ids = self._bulk_ids(request.data)
+        instances = self.get_queryset().in_bulk(ids)
+        missing = [str(uid) for uid in ids if uid not in instances]
+        if missing:
+            raise ValidationError({"id": [f"Events not found: {missing}."]})
+        serializer = self.get_serializer(
+            [instances[uid] for uid in ids],
+            data=request.data,
+            many=True,
+            partial=True,
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return self._bulk_response(serializer, status.HTTP_200_OK)
+
+    @bulk.mapping.delete
+    def bulk_destroy(self, request):
+        ids = self._bulk_ids(request.data)
+        instances = self.get_queryset().in_bulk(ids)
+        result = calendars["emitimes"].delete_many(instances)
+        # events that are still in the calendar keep their rows, along with
+        # their materialized occurrences
+        Event.objects.filter(id__in=result.succeeded).delete()
+
+        data = []
+        for index, uid in enumerate(ids):
+            if uid in result.succeeded:
+                data.append({"id": str(uid)})
+            elif uid in result.failed:
+                errors = {"params": [str(result.failed[uid])]}
+                data.append({"index": index, "id": str(uid), "errors": errors})
+            else:
+                errors = {"id": ["Event not found."]}
+                data.append({"index": index, "id": str(uid), "errors": errors})
+        if any("errors" in item for item in data):
+            return Response(data, status=status.HTTP_207_MULTI_STATUS)
+        return Response(data, status=status.HTTP_200_OK)
+
 
 class TimetableViewSet(viewsets.ViewSet):
-    def list(self, request):
-        from_date = self.request.query_params.get("from")
-        to_date = self.request.query_params.get("to")
+    # events are loaded from the database this many occurrences at a time
+    batch_size = 100
+
+    @action(detail=False)
+    def conflicts(self, request):
+        from_date, to_date = self.parse_window(self.request.query_params)
+        pairs = index.conflicts(self.search(from_date, to_date))
+        ids = {event.uid for pair in pairs for event in pair}
+        events = Event.objects.select_related("show").in_bulk(ids)
+        context = {"shows": {}}
+        serialized = {
+            uid: BaseEventSerializer(event, context=context).data
+            for uid, event in events.items()
+        }
+        field = DateTimeField()
+        data = [
+            {
+                "start": field.to_representation(max(a.start, b.start)),
+                "end": field.to_representation(min(a.end, b.end)),
+                "events": [
+                    {**serialized[event.uid], "params": encode_params(event)}
+                    for event in (a, b)
+                ],
+            }
+            for a, b in pairs
+            # occurrences of events missing in the database can't be shown
+            if a.uid in serialized and b.uid in serialized
+        ]
+        return Response(data)
+
+    @action(detail=False)
+    def free(self, request):
+        from_date, to_date = self.parse_window(self.request.query_params)
+        duration = self.parse_duration(self.request.query_params)
+        slots = index.gaps(
+            self.search(from_date, to_date), from_date, to_date, duration
+        )
+        field = DateTimeField()
+        data = [
+            {
+                "start": field.to_representation(start),
+                "end": field.to_representation(end),
+            }
+            for start, end in slots
+        ]
+        return Response(data)
+
+    @classmethod
+    def parse_window(cls, params) -> Tuple[datetime, datetime]:
+        from_date = params.get("from")
+        to_date = params.get("to")
 
         now = utcnow()
 
         try:
-            from_date = self.parse_datetime(from_date, now)
+            from_date = cls.parse_datetime(from_date, now)
         except (ValueError, ZoneInfoNotFoundError) as e:
             raise ValidationError("from_date is not a valid datetime.") from e
 
         try:
-            to_date = self.parse_datetime(to_date, now)
+            to_date = cls.parse_datetime(to_date, now)
         except (ValueError, ZoneInfoNotFoundError) as e:
             raise ValidationError("to_date is not a valid datetime.") from e
 
-        calendar_events = calendars["emitimes"].search(from_date, to_date)
-        ids = set(event.uid for event in calendar_events)
+        return from_date, to_date
 
-        queryset = Event.objects.filter(id__in=ids)
-        serialized_events_map = {
-            event.id: BaseEventSerializer(event).data for event in queryset
-        }
+    @staticmethod
+    def parse_limit(params) -> Optional[int]:
+        limit = params.get("limit")
+        if limit is None:
+            return None
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if limit <= 0:
+            raise ValidationError("limit must be a positive integer.")
+        return limit
 
-        out = []
-        for event in calendar_events:
-            data = {
-                **serialized_events_map[event.uid],
-                "params": BaseEventParamsSerializer(event).data,
-            }
-            out.append(data)
+    @staticmethod
+    def parse_duration(params) -> timedelta:
+        duration = params.get("duration")
+        if duration is None:
+            return timedelta(0)
+        field = serializers.DurationField(min_value=timedelta(0))
+        try:
+            return field.run_validation(duration)
+        except ValidationError as e:
+            raise ValidationError("duration must be a valid duration.") from e
+
+    @staticmethod
+    def parse_filters(params) -> Dict[str, int]:
+        filters = {}
+        if params.get("show") is not None:
+            field = serializers.IntegerField()
+            try:
+                filters["show"] = field.run_validation(params["show"])
+            except ValidationError as e:
+                raise ValidationError("show must be an integer.") from e
+        if params.get("type") is not None:
+            field = serializers.ChoiceField(Event.Type.choices)
+            try:
+                filters["type"] = field.run_validation(params["type"])
+            except ValidationError as e:
+                raise ValidationError(
+                    "type must be a valid event type."
+                ) from e
+        return filters
+
+    @staticmethod
+    def iter_serialize(
+        calendar_events: Iterable[CalendarEvent],
+        batch_size: int = 100,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> Iterator[dict]:
+        context = {"shows": {}}
+        serialized_events_map = {}
+        calendar_events = iter(calendar_events)
+        while batch := list(islice(calendar_events, batch_size)):
+            ids = set(event.uid for event in batch)
+            ids.difference_update(serialized_events_map)
+
+            queryset = Event.objects.select_related("show").filter(id__in=ids)
+            events = list(queryset.filter(**(filters or {})))
+
+            with timer(
+                "serialize", SERIALIZATION_DURATION.labels("timetable")
+            ):
+                for event in events:
+                    serialized_events_map[event.id] = BaseEventSerializer(
+                        event, context=context
+                    ).data
+
+                serialized = [
+                    {
+                        **serialized_events_map[event.uid],
+                        "params": encode_params(event),
+                    }
+                    for event in batch
+                    # the response may be partially sent already, so skip
+                    # occurrences of events that are missing in the database
+                    if event.uid in serialized_events_map
+                ]
+            yield from serialized
+
+    @staticmethod
+    def iter_serialize_occurrences(
+        occurrences: QuerySet, batch_size: int = 100
+    ) -> Iterator[dict]:
+        context = {"shows": {}}
+        serialized_events_map = {}
+        for occurrence in occurrences.iterator(chunk_size=batch_size):
+            event = occurrence.event
+            with timer(
+                "serialize", SERIALIZATION_DURATION.labels("timetable")
+            ):
+                if event.id not in serialized_events_map:
+                    serialized_events_map[event.id] = BaseEventSerializer(
+                        event, context=context
+                    ).data
+                start = occurrence.start.astimezone(
+                    ZoneInfo(occurrence.start_timezone)
+                )
+                end = occurrence.end.astimezone(
+                    ZoneInfo(occurrence.end_timezone)
+                )
+                item = {
+                    **serialized_events_map[event.id],
+                    "params": {
+                        "start": format_datetime(start),
+                        "end": format_datetime(end),
+                        "rules": None,
+                    },
+                }
+            yield item
+
+    @staticmethod
+    def search_occurrences(
+        from_date: datetime, to_date: datetime
+    ) -> Optional[QuerySet]:
+        materializer = materializers.get("emitimes")
+        if materializer is None:
+            return None
+        return materializer.search(from_date, to_date)
+
+    @classmethod
+    def serialize(
+        cls,
+        calendar_events: List[CalendarEvent],
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> List[dict]:
+        return list(
+            cls.iter_serialize(calendar_events, cls.batch_size, filters)
+        )
 
-        return Response(out)
+    @staticmethod
+    def search(
+        from_date: datetime,
+        to_date: datetime,
+        limit: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> Iterable[CalendarEvent]:
+        return search(from_date, to_date, limit, filters)
 
     @staticmethod
     def parse_datetime(
@@ -86,7 +424,30 @@ class TimetableViewSet(viewsets.ViewSet):
         return parse_datetime_with_timezone(dt)
 
 
+def _ics_snapshot(request) -> Optional[ICSSnapshot]:
+    cache = ics_caches.get("emitimes")
+    if cache is None:
+        return None
+    try:
+        return cache.get()
+    except CalendarError as e:
+        raise ValidationError("Unable to retrieve calendar.") from e
+
+
+def _ics_etag(request) -> Optional[str]:
+    snapshot = _ics_snapshot(request)
+    return snapshot.etag if snapshot is not None else None
+
+
+def _ics_last_modified(request) -> Optional[datetime]:
+    snapshot = _ics_snapshot(request)
+    return snapshot.last_modified if snapshot is not None else None
+
+
 class ICSView(views.APIView):
+    @method_decorator(
+        condition(etag_func=_ics_etag, last_modified_func=_ics_last_modified)
+    )
     def get(self, request):
         calendar = calendars["emitimes"]
         filename = f"{calendar.name}.ics"
@@ -94,4 +455,38 @@ class ICSView(views.APIView):
             "Content-Type": "text/calendar; charset=utf-8",
             "Content-Disposition": f'attachment; filename="{filename}"',
         }
-        return StreamingHttpResponse(calendar.ics(), headers=headers)
+        snapshot = _ics_snapshot(request)
+        if snapshot is None:
+            return StreamingHttpResponse(calendar.ics(), headers=headers)
+        encoding = negotiate(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if encoding is None:
+            response = HttpResponse(snapshot.content, headers=headers)
+        else:
+            response = HttpResponse(snapshot.encode(encoding), headers=headers)
+            response.headers["Content-Encoding"] = encoding
+            response.headers["ETag"] = f"W/{snapshot.etag}"
+        patch_vary_headers(response, ("Accept-Encoding",))
+        return response
+
+
+def metrics(request):
+    registry = REGISTRY
+    # each worker process writes its values to files there
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    content = generate_latest(registry)
+    return HttpResponse(content, content_type=CONTENT_TYPE_LATEST)
+
+
+def ready(request):
+    results = readiness()
+    ready = all(result is None for result in results.values())
+    data = {
+        "ready": ready,
+        "checks": {
+            name: {"ok": result is None, "detail": result}
+            for name, result in results.items()
+        },
+    }
+    return JsonResponse(data, status=200 if ready else 503)
@@ -1,7 +1,14 @@
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+
+from emishows.handlers import StreamingASGIHandler
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "emishows.settings")
 
-app = get_asgi_application()
+django.setup(set_prefix=False)
+
+# Django has to be set up before anything importing models
+from emishows.push import PushRouter  # noqa: E402
+
+app = PushRouter(StreamingASGIHandler())
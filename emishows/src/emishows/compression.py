@@ -0,0 +1,130 @@
+import zlib
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+import brotli
+import zstandard
+
+
+class Compressor(ABC):
+    """Incremental compressor for a single stream."""
+
+    @abstractmethod
+    def compress(self, data: bytes) -> bytes:
+        pass
+
+    @abstractmethod
+    def flush(self) -> bytes:
+        """Returns output for everything compressed so far."""
+
+        pass
+
+    @abstractmethod
+    def finish(self) -> bytes:
+        pass
+
+
+class GzipCompressor(Compressor):
+    def __init__(self, level: int = 6) -> None:
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliCompressor(Compressor):
+    def __init__(self, quality: int = 5) -> None:
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdCompressor(Compressor):
+    def __init__(self, level: int = 3) -> None:
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+# streamed content is flushed after at least this many bytes
+FLUSH_SIZE = 32 * 1024
+
+# ordered by preference
+COMPRESSORS: Dict[str, Callable[[], Compressor]] = {
+    "zstd": ZstdCompressor,
+    "br": BrotliCompressor,
+    "gzip": GzipCompressor,
+}
+
+
+def _parse_accept_encoding(header: str) -> Dict[str, float]:
+    accepted = {}
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name.lower()] = quality
+    return accepted
+
+
+def negotiate(header: str) -> Optional[str]:
+    """Returns the best supported encoding for an Accept-Encoding value."""
+
+    accepted = _parse_accept_encoding(header)
+    best, best_quality = None, 0.0
+    for encoding in COMPRESSORS:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    compressor = COMPRESSORS[encoding]()
+    return compressor.compress(data) + compressor.finish()
+
+
+def compress_sequence(
+    sequence: Iterable[bytes], encoding: str, flush_size: int = FLUSH_SIZE
+) -> Iterator[bytes]:
+    compressor = COMPRESSORS[encoding]()
+    pending = 0
+    for data in sequence:
+        chunk = compressor.compress(data)
+        pending += len(data)
+        # flush now and then, so that streamed data reaches clients promptly
+        # without compressing each small chunk on its own
+        if pending >= flush_size:
+            chunk += compressor.flush()
+            pending = 0
+        if chunk:
+            yield chunk
+    yield compressor.finish()
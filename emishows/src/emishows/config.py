@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 from pydantic import BaseModel
 
@@ -15,6 +16,66 @@ class Config(BaseModel):
     emitimes_calendar: str = os.getenv(
         "EMISHOWS_EMITIMES_CALENDAR", "emitimes"
     )
+    emitimes_max_connections: int = int(
+        os.getenv("EMISHOWS_EMITIMES_MAX_CONNECTIONS", 10)
+    )
+    emitimes_max_keepalive_connections: int = int(
+        os.getenv("EMISHOWS_EMITIMES_MAX_KEEPALIVE_CONNECTIONS", 10)
+    )
+    emitimes_timeout: float = float(os.getenv("EMISHOWS_EMITIMES_TIMEOUT", 10))
+    emitimes_connect_timeout: float = float(
+        os.getenv("EMISHOWS_EMITIMES_CONNECT_TIMEOUT", 3)
+    )
+    emitimes_pool_timeout: float = float(
+        os.getenv("EMISHOWS_EMITIMES_POOL_TIMEOUT", 5)
+    )
+    emitimes_breaker_threshold: int = int(
+        os.getenv("EMISHOWS_EMITIMES_BREAKER_THRESHOLD", 5)
+    )
+    emitimes_breaker_reset: float = float(
+        os.getenv("EMISHOWS_EMITIMES_BREAKER_RESET", 30)
+    )
+    emitimes_stale_searches: int = int(
+        os.getenv("EMISHOWS_EMITIMES_STALE_SEARCHES", 256)
+    )
+    emitimes_stale_events: int = int(
+        os.getenv("EMISHOWS_EMITIMES_STALE_EVENTS", 10000)
+    )
+    emitimes_stale_ttl: float = float(
+        os.getenv("EMISHOWS_EMITIMES_STALE_TTL", 86400)
+    )
+    emitimes_http2: bool = (
+        os.getenv("EMISHOWS_EMITIMES_HTTP2", "false").lower() == "true"
+    )
+    emitimes_url_store: str = os.getenv(
+        "EMISHOWS_EMITIMES_URL_STORE",
+        os.path.join(tempfile.gettempdir(), "emishows", "calendars.json"),
+    )
+    emitimes_discovery_attempts: int = int(
+        os.getenv("EMISHOWS_EMITIMES_DISCOVERY_ATTEMPTS", 3)
+    )
+    emitimes_discovery_backoff: float = float(
+        os.getenv("EMISHOWS_EMITIMES_DISCOVERY_BACKOFF", 0.5)
+    )
+    ics_chunk_size: int = int(os.getenv("EMISHOWS_ICS_CHUNK_SIZE", 65536))
+    ics_snapshot_ttl: float = float(os.getenv("EMISHOWS_ICS_SNAPSHOT_TTL", 30))
+    cache_size: int = int(os.getenv("EMISHOWS_CACHE_SIZE", 128))
+    cache_ttl: float = float(os.getenv("EMISHOWS_CACHE_TTL", 60))
+    cache_bucket: int = int(os.getenv("EMISHOWS_CACHE_BUCKET", 86400))
+    cache_url: str = os.getenv("EMISHOWS_CACHE_URL", "")
+    sync_interval: float = float(os.getenv("EMISHOWS_SYNC_INTERVAL", 30))
+    sync_past_days: int = int(os.getenv("EMISHOWS_SYNC_PAST_DAYS", 7))
+    sync_future_days: int = int(os.getenv("EMISHOWS_SYNC_FUTURE_DAYS", 60))
+    occurrences_interval: float = float(
+        os.getenv("EMISHOWS_OCCURRENCES_INTERVAL", 300)
+    )
+    occurrences_past_days: int = int(
+        os.getenv("EMISHOWS_OCCURRENCES_PAST_DAYS", 7)
+    )
+    occurrences_future_days: int = int(
+        os.getenv("EMISHOWS_OCCURRENCES_FUTURE_DAYS", 180)
+    )
+    page_size: int = int(os.getenv("EMISHOWS_PAGE_SIZE", 100))
 
 
 config = Config()
@@ -0,0 +1,27 @@
+from typing import Dict
+
+from emishows.events.aio import AsyncCalendar
+from emishows.events.cache import (
+    SearchCache,
+    SharedCounter,
+    SharedSearchCache,
+)
+from emishows.events.calendar import Calendar
+from emishows.events.discovery import Retry, URLStore
+from emishows.events.errors import (
+    CalendarConflictError,
+    CalendarError,
+    CalendarUnavailableError,
+)
+from emishows.events.feed import Change, ChangeFeed
+from emishows.events.ics import ICSCache, ICSSnapshot
+from emishows.events.index import OccurrenceIndex
+from emishows.events.models import BulkResult, Event
+from emishows.events.resilience import CircuitBreaker, StaleResults
+from emishows.events.sync import CalendarMirror
+
+calendars: Dict[str, Calendar] = {}
+async_calendars: Dict[str, AsyncCalendar] = {}
+mirrors: Dict[str, CalendarMirror] = {}
+ics_caches: Dict[str, ICSCache] = {}
+feeds: Dict[str, ChangeFeed] = {}
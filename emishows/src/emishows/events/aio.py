@@ -0,0 +1,514 @@
+import asyncio
+import logging
+from datetime import datetime
+from itertools import islice
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+from urllib.parse import urljoin
+from uuid import UUID
+from weakref import WeakKeyDictionary
+
+import httpx
+import icalendar
+from caldav.elements import cdav
+
+from emishows.events import dav as davxml
+from emishows.events.cache import SearchCache
+from emishows.events.calendar import Calendar
+from emishows.events.discovery import Discovery, Retry, URLStore, find_href
+from emishows.events.errors import (
+    CalendarConflictError,
+    CalendarError,
+    CalendarUnavailableError,
+)
+from emishows.events.flight import AsyncSingleFlight
+from emishows.events.index import clip, matches, select
+from emishows.events.models import Event
+from emishows.events.resilience import (
+    AsyncBreakerTransport,
+    CircuitBreaker,
+    StaleResults,
+    covering,
+    search_key,
+)
+from emishows.metrics import AsyncInstrumentedTransport, timed, timed_iter
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncCalendar:
+    """Calendar client for asyncio code.
+
+    Talks CalDAV directly over a pooled httpx.AsyncClient, so concurrent
+    requests share a few keep-alive connections instead of threads.
+    Parsing, expanding series and the search cache, which may be shared
+    over the network, are run in threads to keep the event loop free.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        name: str,
+        user: Optional[str] = None,
+        password: Optional[str] = None,
+        cache: Optional[SearchCache] = None,
+        limits: httpx.Limits = httpx.Limits(
+            max_connections=10, max_keepalive_connections=10
+        ),
+        timeout: httpx.Timeout = httpx.Timeout(10),
+        http2: bool = False,
+        store: Optional[URLStore] = None,
+        retry: Retry = Retry(),
+        breaker: Optional[CircuitBreaker] = None,
+        stale: Optional[StaleResults] = None,
+    ) -> None:
+        self.url = url
+        self.name = name
+        self.user = user
+        self.password = password
+        self.cache = cache
+        self.breaker = breaker
+        self.stale = stale
+        self.limits = limits
+        self.timeout = timeout
+        self.http2 = http2
+        self.listeners: List[Callable[[UUID], None]] = []
+        self.flights = AsyncSingleFlight()
+        # whether the server accepts If-Match: * for existing events
+        self.wildcard_match = True
+        self._writes = 0
+        self.discovery = Discovery(url, name, user, store, retry)
+        self._clients: WeakKeyDictionary = WeakKeyDictionary()
+
+    def _client(self) -> httpx.AsyncClient:
+        # connections can't be shared between event loops
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            auth = (self.user, self.password) if self.user else None
+            transport = AsyncInstrumentedTransport(
+                httpx.AsyncHTTPTransport(
+                    verify=davxml.ssl_context(),
+                    limits=self.limits,
+                    http2=self.http2,
+                )
+            )
+            if self.breaker is not None:
+                transport = AsyncBreakerTransport(transport, self.breaker)
+            client = httpx.AsyncClient(
+                auth=auth, timeout=self.timeout, transport=transport
+            )
+            self._clients[loop] = client
+        return client
+
+    async def _request(
+        self,
+        method: str,
+        url: str,
+        content: Optional[bytes] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> httpx.Response:
+        try:
+            return await self._client().request(
+                method, url, content=content, headers=headers
+            )
+        except httpx.HTTPError as e:
+            raise CalendarUnavailableError(
+                "Can't connect to calendar server."
+            ) from e
+
+    async def _propfind(self, url: str, query: bytes) -> str:
+        headers = {**davxml.XML_HEADERS, "Depth": "0"}
+        response = await self._request("PROPFIND", url, query, headers)
+        if response.status_code >= 500:
+            raise CalendarUnavailableError("Can't discover calendar.")
+        if response.status_code != 207:
+            raise CalendarError("Can't discover calendar.")
+        return find_href(url, response.content)
+
+    @property
+    def ready(self) -> bool:
+        return self.discovery.url is not None
+
+    async def calendar_url(self, attempts: Optional[int] = None) -> str:
+        return await self.discovery.aresolve(self._propfind, attempts)
+
+    async def _event_url(self, uid: UUID) -> str:
+        return urljoin(await self.calendar_url(), f"{uid}.ics")
+
+    async def _report(self, query: bytes) -> List[davxml.DAVResource]:
+        headers = {**davxml.XML_HEADERS, "Depth": "1"}
+        response = await self._request(
+            "REPORT", await self.calendar_url(), query, headers
+        )
+        if response.status_code == 404 and self.discovery.stored:
+            # the stored URL is outdated, so look it up again next time
+            self.discovery.forget()
+        if response.status_code >= 500:
+            raise CalendarUnavailableError("Can't retrieve events.")
+        if response.status_code != 207:
+            raise CalendarError("Can't retrieve events.")
+        return await asyncio.to_thread(
+            davxml.parse_multistatus, response.content
+        )
+
+    async def _get(self, uid: UUID) -> Tuple[bytes, Optional[str]]:
+        response = await self._request("GET", await self._event_url(uid))
+        if response.status_code >= 500:
+            raise CalendarUnavailableError("Can't retrieve event.")
+        if response.status_code != 200:
+            raise CalendarError("Can't retrieve event.")
+        return response.content, response.headers.get("ETag")
+
+    async def _put(
+        self,
+        uid: UUID,
+        data: bytes,
+        headers: Dict[str, str],
+        conflict: str = "Event was modified concurrently.",
+    ) -> Event:
+        response = await self._request(
+            "PUT",
+            await self._event_url(uid),
+            data,
+            {**davxml.ICS_HEADERS, **headers},
+        )
+        if response.status_code == 412:
+            raise CalendarConflictError(conflict)
+        if response.status_code not in (200, 201, 204):
+            raise CalendarError("Can't save event.")
+        return Calendar._decode(data)
+
+    async def _invalidate(self, event: Event) -> None:
+        if self.cache is not None:
+            calendar = Calendar._new_calendar(**event.dict())
+            await asyncio.to_thread(self.cache.invalidate, event.uid, calendar)
+
+    def _notify(self, uid: UUID) -> None:
+        self._writes += 1
+        for listener in self.listeners:
+            listener(uid)
+
+    async def _coalesce(
+        self, key: Hashable, function: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        # reads started before a write may miss it, so later reads don't
+        # join them
+        return await self.flights.do((self._writes, key), function)
+
+    def _remember(self, event: Event) -> Event:
+        if self.stale is not None:
+            self.stale.set_event(event)
+        return event
+
+    @timed("add")
+    async def add(self, **kwargs) -> Event:
+        event = Calendar._validate(**kwargs)
+        event = await self._put(
+            event.uid,
+            await asyncio.to_thread(Calendar._encode, event),
+            {"If-None-Match": "*"},
+            conflict="Event already exists.",
+        )
+        await self._invalidate(event)
+        self._remember(event)
+        self._notify(event.uid)
+        return event
+
+    @timed("update")
+    async def update(
+        self, uid: UUID, etag: Optional[str] = None, **kwargs
+    ) -> Event:
+        if kwargs.keys() >= {"start", "end", "rules"}:
+            data = await asyncio.to_thread(self._encode_new, uid, **kwargs)
+        else:
+            data, current = await self._get(uid)
+            data = await asyncio.to_thread(
+                self._encode_changed, data, **kwargs
+            )
+            etag = etag or current
+        event = await self._replace(uid, data, etag)
+        await self._invalidate(event)
+        self._remember(event)
+        self._notify(uid)
+        return event
+
+    @staticmethod
+    def _encode_new(uid: UUID, **kwargs) -> bytes:
+        return Calendar._encode(Calendar._validate(uid=uid, **kwargs))
+
+    @staticmethod
+    def _encode_changed(data: bytes, **kwargs) -> bytes:
+        calendar = Calendar._parse(data)
+        return Calendar._update_calendar(calendar, **kwargs).to_ical()
+
+    async def _replace(
+        self, uid: UUID, data: bytes, etag: Optional[str] = None
+    ) -> Event:
+        # like Calendar._replace
+        if etag is None and not self.wildcard_match:
+            _, etag = await self._get(uid)
+        try:
+            return await self._put(uid, data, {"If-Match": etag or "*"})
+        except CalendarConflictError:
+            if etag is not None:
+                raise
+        # raises if the event doesn't exist
+        _, etag = await self._get(uid)
+        self.wildcard_match = False
+        return await self._put(uid, data, {"If-Match": etag} if etag else {})
+
+    @timed("get")
+    async def get(self, uid: UUID, allow_stale: bool = True) -> Event:
+        return await self._coalesce(
+            ("get", uid, allow_stale),
+            lambda: self._get_event(uid, allow_stale),
+        )
+
+    async def _get_event(self, uid: UUID, allow_stale: bool) -> Event:
+        try:
+            data, _ = await self._get(uid)
+        except CalendarUnavailableError:
+            if allow_stale and self.stale is not None:
+                event = self.stale.get_event(uid)
+                if event is not None:
+                    return event
+            raise
+        return self._remember(Calendar._decode(data))
+
+    @timed("get_many")
+    async def get_many(
+        self, uids: Iterable[UUID], allow_stale: bool = True
+    ) -> Dict[UUID, Event]:
+        uids = list(dict.fromkeys(uids))
+        if not uids:
+            return {}
+        try:
+            hrefs = [
+                httpx.URL(await self._event_url(uid)).path for uid in uids
+            ]
+            resources = await self._report(davxml.multiget_query(hrefs))
+        except CalendarUnavailableError:
+            if allow_stale and self.stale is not None:
+                stale = self.stale.get_events(uids)
+                if stale is not None:
+                    return stale
+            raise
+        out = {}
+        for resource in resources:
+            data = resource.props.get(cdav.CalendarData.tag)
+            if not resource.found or data is None:
+                continue
+            event = self._remember(Calendar._decode(data))
+            out[event.uid] = event
+        return out
+
+    @timed("delete")
+    async def delete(self, uid: UUID, etag: Optional[str] = None) -> None:
+        headers = {"If-Match": etag} if etag else None
+        response = await self._request(
+            "DELETE", await self._event_url(uid), headers=headers
+        )
+        if response.status_code == 404:
+            raise CalendarError("Can't retrieve event.")
+        if response.status_code == 412:
+            raise CalendarConflictError("Event was modified concurrently.")
+        if response.status_code not in (200, 204):
+            raise CalendarError("Can't delete event.")
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.invalidate, uid)
+        if self.stale is not None:
+            self.stale.delete_event(uid)
+        self._notify(uid)
+
+    def _stale_search(
+        self,
+        from_date: datetime,
+        to_date: datetime,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> Optional[List[icalendar.Calendar]]:
+        if self.stale is None:
+            return None
+        return self.stale.find_search(
+            covering("async-search", from_date, to_date, False, filters)
+        )
+
+    async def _search(
+        self,
+        from_date: datetime,
+        to_date: datetime,
+        filters: Optional[Dict[str, Any]] = None,
+        fallback: bool = True,
+    ) -> List[icalendar.Calendar]:
+        # series are expanded here, like in Calendar
+        query = davxml.date_search_query(
+            from_date, to_date, False, Calendar._properties(filters or {})
+        )
+        try:
+            resources = await self._report(query)
+        except CalendarUnavailableError:
+            if fallback:
+                stale = self._stale_search(from_date, to_date, filters)
+                if stale is not None:
+                    return stale
+            raise
+        calendars = await asyncio.to_thread(self._parse_calendars, resources)
+        if self.stale is not None:
+            key = search_key(
+                "async-search", from_date, to_date, False, filters
+            )
+            self.stale.set_search(key, calendars)
+        return calendars
+
+    @staticmethod
+    def _parse_calendars(
+        resources: List[davxml.DAVResource],
+    ) -> List[icalendar.Calendar]:
+        calendars = []
+        for resource in resources:
+            data = resource.props.get(cdav.CalendarData.tag)
+            if data is None:
+                continue
+            try:
+                calendars.append(icalendar.Calendar.from_ical(data))
+            except ValueError:
+                # one bad object shouldn't fail every search
+                logger.warning("Skipping malformed object %s.", resource.href)
+        return calendars
+
+    def _store(
+        self,
+        calendars: List[icalendar.Calendar],
+        window: Tuple[datetime, datetime],
+        generation: int,
+    ) -> List[Event]:
+        events = Calendar._expand_calendars(calendars, *window)
+        self.cache.set(window, events, generation)
+        return events
+
+    async def _search_cached(
+        self, from_date: datetime, to_date: datetime
+    ) -> List[Event]:
+        cached = await asyncio.to_thread(self.cache.get, from_date, to_date)
+        if cached is not None:
+            return cached
+        generation = await asyncio.to_thread(lambda: self.cache.generation)
+        window = self.cache.window(from_date, to_date)
+        try:
+            calendars = await self._search(*window, fallback=False)
+        except CalendarUnavailableError:
+            # stale results aren't cached, so they aren't served as fresh
+            stale = self._stale_search(from_date, to_date)
+            if stale is None:
+                raise
+            return await asyncio.to_thread(
+                Calendar._expand_calendars, stale, from_date, to_date
+            )
+        events = await asyncio.to_thread(
+            self._store, calendars, window, generation
+        )
+        return clip(events, from_date, to_date)
+
+    @timed("search")
+    async def search(
+        self,
+        from_date: datetime,
+        to_date: datetime,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> List[Event]:
+        events = await self._coalesce(
+            search_key("search", from_date, to_date, True, filters),
+            lambda: self._search_events(from_date, to_date, filters),
+        )
+        # callers may change their lists
+        return list(events)
+
+    async def _search_events(
+        self,
+        from_date: datetime,
+        to_date: datetime,
+        filters: Optional[Dict[str, Any]],
+    ) -> List[Event]:
+        if self.cache is not None:
+            if not filters:
+                return await self._search_cached(from_date, to_date)
+            cached = await asyncio.to_thread(
+                self.cache.get, from_date, to_date
+            )
+            if cached is not None:
+                return select(cached, filters)
+        calendars = await self._search(from_date, to_date, filters=filters)
+        events = await asyncio.to_thread(
+            Calendar._expand_calendars, calendars, from_date, to_date
+        )
+        return select(events, filters)
+
+    @timed_iter("iter_search")
+    async def iter_search(
+        self,
+        from_date: datetime,
+        to_date: datetime,
+        limit: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> Iterator[Event]:
+        if self.cache is not None:
+            if filters:
+                cached = await asyncio.to_thread(
+                    self.cache.get, from_date, to_date
+                )
+            else:
+                # misses fill the cache like search does
+                cached = await self._coalesce(
+                    search_key("search", from_date, to_date, True, None),
+                    lambda: self._search_cached(from_date, to_date),
+                )
+            if cached is not None:
+                cached = sorted(
+                    select(cached, filters), key=lambda event: event.start
+                )
+                return islice(cached, limit)
+        # like in Calendar.iter_search
+        calendars = await self._coalesce(
+            search_key("query", from_date, to_date, False, filters),
+            lambda: self._search(from_date, to_date, filters),
+        )
+        events = Calendar._merge_calendars(calendars, from_date, to_date)
+        if filters:
+            events = (event for event in events if matches(event, filters))
+        return islice(events, limit)
+
+    async def ics(self) -> AsyncIterator[bytes]:
+        url = await self.calendar_url()
+        try:
+            async with self._client().stream("GET", url) as response:
+                if response.status_code != 200:
+                    raise CalendarError("Can't retrieve calendar.")
+                async for chunk in response.aiter_bytes():
+                    yield chunk
+        except httpx.HTTPError as e:
+            raise CalendarError("Can't retrieve calendar.") from e
+
+    @timed("download")
+    async def download(self) -> bytes:
+        """Returns the whole calendar, sharing concurrent downloads."""
+
+        async def download() -> bytes:
+            return b"".join([chunk async for chunk in self.ics()])
+
+        return await self._coalesce(("ics",), download)
+
+    async def aclose(self) -> None:
+        for client in list(self._clients.values()):
+            await client.aclose()
+        self._clients.clear()
@@ -0,0 +1,249 @@
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+from typing import (
+    FrozenSet,
+    Generic,
+    Hashable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+from uuid import UUID
+
+import icalendar
+import recurring_ical_events
+from django.core.cache.backends.base import BaseCache
+
+from emishows.events.index import clip
+from emishows.events.models import Event
+from emishows.metrics import CACHE_LOOKUPS
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+Window = Tuple[datetime, datetime]
+
+
+class LRUCache(Generic[K, V]):
+    """Thread-safe LRU mapping with bounded size and optional TTL."""
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[K, Tuple[float, V]]" = OrderedDict()
+        self._lock = Lock()
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl is not None and time.monotonic() - stored_at > self.ttl
+
+    def get(self, key: K) -> Optional[V]:
+        with self._lock:
+            try:
+                stored_at, value = self._data[key]
+            except KeyError:
+                return None
+            if self._expired(stored_at):
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: K, value: V) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: K) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def items(self) -> List[Tuple[K, V]]:
+        with self._lock:
+            return [
+                (key, value)
+                for key, (stored_at, value) in self._data.items()
+                if not self._expired(stored_at)
+            ]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class CachedWindow(NamedTuple):
+    events: List[Event]
+    uids: FrozenSet[UUID]
+
+
+class SearchCache:
+    """Cache of expanded event occurrences keyed by bucket-aligned windows.
+
+    Nearly identical windows share one entry. On writes only the windows
+    that contain occurrences of the changed event are dropped.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 128,
+        ttl: Optional[float] = 60,
+        bucket: timedelta = timedelta(days=1),
+    ) -> None:
+        self.bucket = bucket
+        self._generation = 0
+        self._windows: LRUCache[Window, CachedWindow] = LRUCache(maxsize, ttl)
+        # makes invalidations and stores of fetched results atomic
+        self._lock = Lock()
+
+    def _floor(self, dt: datetime) -> datetime:
+        size = self.bucket.total_seconds()
+        ts = dt.timestamp()
+        return datetime.fromtimestamp(ts - ts % size, timezone.utc)
+
+    def _ceil(self, dt: datetime) -> datetime:
+        floor = self._floor(dt)
+        return floor if floor == dt else floor + self.bucket
+
+    def window(self, from_date: datetime, to_date: datetime) -> Window:
+        return self._floor(from_date), self._ceil(to_date)
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(
+        self, from_date: datetime, to_date: datetime
+    ) -> Optional[List[Event]]:
+        cached = self._windows.get(self.window(from_date, to_date))
+        if cached is None:
+            CACHE_LOOKUPS.labels("search", "miss").inc()
+            return None
+        CACHE_LOOKUPS.labels("search", "hit").inc()
+        return clip(cached.events, from_date, to_date)
+
+    def set(
+        self, window: Window, events: List[Event], generation: int
+    ) -> None:
+        uids = frozenset(event.uid for event in events)
+        with self._lock:
+            # results fetched before an invalidation might already be stale
+            if generation != self._generation:
+                return
+            self._windows.set(window, CachedWindow(events, uids))
+
+    def invalidate(
+        self, uid: UUID, calendar: Optional[icalendar.Calendar] = None
+    ) -> None:
+        with self._lock:
+            self._generation += 1
+            for window, cached in self._windows.items():
+                if uid in cached.uids or (
+                    calendar is not None
+                    and recurring_ical_events.of(calendar).between(*window)
+                ):
+                    self._windows.delete(window)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._windows.clear()
+
+
+class SharedCounter:
+    """Counter stored in a Django cache backend, shared between processes.
+
+    The counter never expires, but may still be evicted by the backend,
+    in which case it starts over from zero.
+    """
+
+    def __init__(self, backend: BaseCache, key: str) -> None:
+        self.backend = backend
+        self.key = key
+
+    def value(self) -> int:
+        return self.backend.get(self.key, 0)
+
+    def notify(self, uid: Optional[UUID] = None) -> None:
+        """Calendar listener that counts writes."""
+
+        self.bump()
+
+    def bump(self) -> int:
+        try:
+            return self.backend.incr(self.key)
+        except ValueError:
+            # missing key, someone else may be creating it right now
+            if self.backend.add(self.key, 1, timeout=None):
+                return 1
+            return self.backend.incr(self.key)
+
+
+class SharedSearchCache(SearchCache):
+    """SearchCache stored in a Django cache backend.
+
+    All processes using the same backend and name share cached windows.
+    A write anywhere bumps the shared generation, which is part of every
+    key, so all windows cached before it are dropped at once.
+    """
+
+    def __init__(
+        self,
+        backend: BaseCache,
+        name: str,
+        ttl: Optional[float] = 60,
+        bucket: timedelta = timedelta(days=1),
+    ) -> None:
+        super().__init__(maxsize=0, ttl=ttl, bucket=bucket)
+        self.backend = backend
+        self.name = name
+        self.ttl = ttl
+        self._counter = SharedCounter(backend, f"search:{name}:generation")
+
+    def _key(self, window: Window, generation: int) -> str:
+        start, end = (int(dt.timestamp()) for dt in window)
+        return f"search:{self.name}:{generation}:{start}:{end}"
+
+    @property
+    def generation(self) -> int:
+        return self._counter.value()
+
+    def get(
+        self, from_date: datetime, to_date: datetime
+    ) -> Optional[List[Event]]:
+        key = self._key(self.window(from_date, to_date), self.generation)
+        cached = self.backend.get(key)
+        if cached is None:
+            CACHE_LOOKUPS.labels("search", "miss").inc()
+            return None
+        CACHE_LOOKUPS.labels("search", "hit").inc()
+        return clip(cached.events, from_date, to_date)
+
+    def set(
+        self, window: Window, events: List[Event], generation: int
+    ) -> None:
+        # results fetched before an invalidation land under a stale key
+        uids = frozenset(event.uid for event in events)
+        self.backend.set(
+            self._key(window, generation),
+            CachedWindow(events, uids),
+            timeout=self.ttl,
+        )
+
+    def invalidate(
+        self, uid: UUID, calendar: Optional[icalendar.Calendar] = None
+    ) -> None:
+        self._counter.bump()
+
+    def clear(self) -> None:
+        self._counter.bump()
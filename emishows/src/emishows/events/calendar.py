@@ -0,0 +1,914 @@
+import heapq
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+from uuid import UUID
+from zoneinfo import ZoneInfo
+
+import caldav
+import httpx
+import icalendar
+import recurring_ical_events
+from caldav.elements import cdav, dav
+from caldav.lib.error import DAVError
+from caldav.lib.url import URL
+from pydantic import ValidationError
+
+from emishows.events import codec
+from emishows.events.cache import SearchCache
+from emishows.events.dav import (
+    ICS_HEADERS,
+    XML_HEADERS,
+    DAVResource,
+    GetCTag,
+    HTTPXDAVClient,
+    date_search_query,
+    multiget_query,
+    parse_multistatus,
+    ssl_context,
+    unavailable,
+)
+from emishows.events.discovery import Discovery, Retry, URLStore, find_href
+from emishows.events.errors import (
+    CalendarConflictError,
+    CalendarError,
+    CalendarUnavailableError,
+)
+from emishows.events.flight import SingleFlight
+from emishows.events.index import clip, matches, overlaps, select
+from emishows.events.models import BulkResult, Event
+from emishows.events.resilience import (
+    BreakerTransport,
+    CircuitBreaker,
+    StaleResults,
+    covering,
+    search_key,
+)
+from emishows.metrics import (
+    EXPANSION_DURATION,
+    OCCURRENCES_EXPANDED,
+    InstrumentedTransport,
+    timed,
+    timed_iter,
+    timer,
+)
+from emishows.utils import utcnow
+
+logger = logging.getLogger(__name__)
+
+EVENT_TO_ICALENDAR_NAME_MAPPING = {
+    "uid": "uid",
+    "start": "dtstart",
+    "end": "dtend",
+    "rules": "rrule",
+    "show": "x-emishows-show",
+    "type": "x-emishows-type",
+}
+
+
+class PatchedZoneInfo(ZoneInfo):
+    """ZoneInfo with the ``zone`` attribute that icalendar looks for."""
+
+    @property
+    def zone(self) -> str:
+        return str(self)
+
+
+class Calendar:
+    def __init__(
+        self,
+        url: str,
+        name: str,
+        user: Optional[str] = None,
+        password: Optional[str] = None,
+        cache: Optional[SearchCache] = None,
+        limits: httpx.Limits = httpx.Limits(
+            max_connections=10, max_keepalive_connections=10
+        ),
+        timeout: httpx.Timeout = httpx.Timeout(10),
+        http2: bool = False,
+        chunk_size: int = 65536,
+        store: Optional[URLStore] = None,
+        retry: Retry = Retry(),
+        breaker: Optional[CircuitBreaker] = None,
+        stale: Optional[StaleResults] = None,
+    ) -> None:
+        self.url = url
+        self.name = name
+        self.user = user
+        self.password = password
+        self.cache = cache
+        self.breaker = breaker
+        self.stale = stale
+        self.chunk_size = chunk_size
+        self.max_workers = limits.max_connections or 10
+        self.listeners: List[Callable[[UUID], None]] = []
+        self.flights = SingleFlight()
+        # whether the server accepts If-Match: * for existing events
+        self.wildcard_match = True
+        self._writes = 0
+        transport = InstrumentedTransport(
+            httpx.HTTPTransport(
+                verify=ssl_context(), limits=limits, http2=http2
+            )
+        )
+        if breaker is not None:
+            transport = BreakerTransport(transport, breaker)
+        self.http = httpx.Client(
+            auth=(user, password) if user else None,
+            timeout=timeout,
+            transport=transport,
+        )
+        self.client = HTTPXDAVClient(url=url, client=self.http)
+        self.discovery = Discovery(url, name, user, store, retry)
+        self._calendar: Optional[caldav.Calendar] = None
+
+    def _propfind(self, url: str, query: bytes) -> str:
+        headers = {**XML_HEADERS, "Depth": "0"}
+        try:
+            response = self.http.request(
+                "PROPFIND", url, content=query, headers=headers
+            )
+        except httpx.HTTPError as e:
+            raise CalendarUnavailableError(
+                "Can't connect to calendar server."
+            ) from e
+        if response.status_code >= 500:
+            raise CalendarUnavailableError("Can't discover calendar.")
+        if response.status_code != 207:
+            raise CalendarError("Can't discover calendar.")
+        return find_href(url, response.content)
+
+    @property
+    def ready(self) -> bool:
+        return self._calendar is not None
+
+    def resolve(self, attempts: Optional[int] = None) -> caldav.Calendar:
+        """Discovers the calendar if that wasn't done yet."""
+
+        if self._calendar is None:
+            url = self.discovery.resolve(self._propfind, attempts)
+            self._calendar = caldav.Calendar(client=self.client, url=url)
+        return self._calendar
+
+    @property
+    def calendar(self) -> caldav.Calendar:
+        return self.resolve()
+
+    def forget(self) -> None:
+        """Drops the calendar URL, so it is discovered again."""
+
+        self._calendar = None
+        self.discovery.forget()
+
+    def _check_stored(self) -> None:
+        # a stored URL may be outdated, so look it up again next time
+        if self.discovery.stored:
+            self.forget()
+
+    def _event_url(self, uid: UUID) -> URL:
+        return self.calendar.url.join(f"{uid}.ics")
+
+    @staticmethod
+    def _retrieve_vevent(calendar: icalendar.Calendar) -> icalendar.Event:
+        return calendar.walk("vevent")[0]
+
+    @staticmethod
+    def _patch_incoming_datetime(dt: datetime) -> datetime:
+        if isinstance(dt.tzinfo, ZoneInfo):
+            dt = dt.replace(tzinfo=PatchedZoneInfo(dt.tzinfo.key))
+        return dt
+
+    @staticmethod
+    def _patch_outgoing_datetime(
+        dt: datetime, event: icalendar.Event, key: str
+    ) -> datetime:
+        tzid = event.get(key).params.get("TZID", "Etc/UTC")
+        return dt.replace(tzinfo=codec.zone(tzid))
+
+    @staticmethod
+    def _map_vevent(event: icalendar.Event) -> Event:
+        params = {}
+        for event_key, ical_key in EVENT_TO_ICALENDAR_NAME_MAPPING.items():
+            decoded = event.decoded(ical_key, None)
+            if isinstance(decoded, datetime):
+                decoded = Calendar._patch_outgoing_datetime(
+                    decoded, event, ical_key
+                )
+            params[event_key] = decoded
+        try:
+            return Event(**params)
+        except ValidationError as e:
+            raise CalendarError("Invalid event data.") from e
+
+    @staticmethod
+    def _parse(data: Union[bytes, str]) -> icalendar.Calendar:
+        try:
+            return icalendar.Calendar.from_ical(data)
+        except ValueError as e:
+            raise CalendarError("Invalid event data.") from e
+
+    @staticmethod
+    def _decode(data: Union[bytes, str]) -> Event:
+        try:
+            return codec.decode(data)
+        except codec.UnsupportedContent:
+            calendar = Calendar._parse(data)
+            return Calendar._map_vevent(Calendar._retrieve_vevent(calendar))
+
+    @staticmethod
+    def _encode(event: Event) -> bytes:
+        try:
+            return codec.encode(event)
+        except codec.UnsupportedContent:
+            return Calendar._new_calendar(**event.dict()).to_ical()
+
+    @staticmethod
+    def _validate(**kwargs) -> Event:
+        try:
+            return Event(**kwargs)
+        except ValidationError as e:
+            raise CalendarError("Invalid event data.") from e
+
+    @staticmethod
+    def _map_event(event: caldav.CalendarObjectResource) -> Event:
+        return Calendar._decode(event.data)
+
+    @staticmethod
+    def _update_vevent(
+        vevent: icalendar.Event, event: Event
+    ) -> icalendar.Event:
+        tmp_event = icalendar.Event()
+        for k, v in event.dict().items():
+            if v is not None:
+                ical_key = EVENT_TO_ICALENDAR_NAME_MAPPING[k]
+                if isinstance(v, datetime):
+                    v = Calendar._patch_incoming_datetime(v)
+                tmp_event.add(ical_key, v)
+                vevent[ical_key] = tmp_event[ical_key]
+        return vevent
+
+    @staticmethod
+    def _update_calendar(
+        calendar: icalendar.Calendar, **kwargs
+    ) -> icalendar.Calendar:
+        vevent = Calendar._retrieve_vevent(calendar)
+        try:
+            event = Calendar._map_vevent(vevent).copy(update=kwargs)
+        except ValidationError as e:
+            raise CalendarError("Invalid event data.") from e
+        Calendar._update_vevent(vevent, event)
+        return calendar
+
+    @staticmethod
+    def _new_calendar(**kwargs) -> icalendar.Calendar:
+        calendar = icalendar.Calendar()
+        vevent = icalendar.Event()
+        calendar.add_component(vevent)
+        Calendar._update_vevent(vevent, Calendar._validate(**kwargs))
+        return calendar
+
+    @staticmethod
+    def _expand_calendars(
+        calendars: Iterable[icalendar.Calendar],
+        from_date: datetime,
+        to_date: datetime,
+    ) -> List[Event]:
+        out = []
+        with timer("expand", EXPANSION_DURATION):
+            for calendar in calendars:
+                calendar = recurring_ical_events.of(calendar)
+                for vevent in calendar.between(from_date, to_date):
+                    out.append(Calendar._map_vevent(vevent))
+        OCCURRENCES_EXPANDED.inc(len(out))
+        return out
+
+    @staticmethod
+    def _iter_expand(
+        calendar: icalendar.Calendar,
+        from_date: datetime,
+        to_date: datetime,
+        step: timedelta = timedelta(days=1),
+        max_step: timedelta = timedelta(days=64),
+    ) -> Iterator[Event]:
+        """Yields occurrences of a single calendar object by start.
+
+        The window is expanded in growing steps, so consumers that stop
+        early don't pay for expanding the rest of it.
+        """
+
+        calendar = recurring_ical_events.of(calendar)
+        start = from_date
+        while True:
+            stop = min(start + step, to_date)
+            with timer("expand", EXPANSION_DURATION):
+                events = (
+                    Calendar._map_vevent(vevent)
+                    for vevent in calendar.between(start, stop)
+                )
+                # occurrences that started in a previous step were yielded
+                chunk = [
+                    event
+                    for event in events
+                    if overlaps(event, from_date, to_date)
+                    and (start == from_date or event.start >= start)
+                    and (stop == to_date or event.start < stop)
+                ]
+                chunk.sort(key=lambda event: event.start)
+            OCCURRENCES_EXPANDED.inc(len(chunk))
+            yield from chunk
+            if stop >= to_date:
+                return
+            start, step = stop, min(step * 2, max_step)
+
+    @staticmethod
+    def _merge_calendars(
+        calendars: Iterable[icalendar.Calendar],
+        from_date: datetime,
+        to_date: datetime,
+    ) -> Iterator[Event]:
+        return heapq.merge(
+            *(
+                Calendar._iter_expand(calendar, from_date, to_date)
+                for calendar in calendars
+            ),
+            key=lambda event: event.start,
+        )
+
+    @staticmethod
+    def _expand_events(
+        events: List[caldav.CalendarObjectResource],
+        from_date: datetime,
+        to_date: datetime,
+    ) -> List[Event]:
+        return Calendar._expand_calendars(
+            (event.icalendar_instance for event in events), from_date, to_date
+        )
+
+    @staticmethod
+    def expand(
+        event: Event, from_date: datetime, to_date: datetime
+    ) -> List[Event]:
+        """Returns occurrences of an event that doesn't have to be stored."""
+
+        calendar = Calendar._new_calendar(**event.dict())
+        return Calendar._expand_calendars([calendar], from_date, to_date)
+
+    def _notify(self, uid: UUID) -> None:
+        self._writes += 1
+        for listener in self.listeners:
+            listener(uid)
+
+    def _coalesce(self, key: Hashable, function: Callable[[], Any]) -> Any:
+        # reads started before a write may miss it, so later reads don't
+        # join them
+        return self.flights.do((self._writes, key), function)
+
+    def _invalidate(self, event: Event) -> None:
+        if self.cache is not None:
+            calendar = self._new_calendar(**event.dict())
+            self.cache.invalidate(event.uid, calendar)
+
+    @timed("add")
+    def add(self, **kwargs) -> Event:
+        event = self._validate(**kwargs)
+        event, _ = self._put(
+            event.uid,
+            self._encode(event),
+            {"If-None-Match": "*"},
+            conflict="Event already exists.",
+        )
+        self._invalidate(event)
+        self._remember(event)
+        self._notify(event.uid)
+        return event
+
+    def update(self, uid: UUID, etag: Optional[str] = None, **kwargs) -> Event:
+        """Updates an event with a single conditional PUT when possible.
+
+        The event is fetched first only for partial updates, which are
+        then conditional on the fetched ETag. Without an ETag, the event
+        still has to exist, so deleted events aren't created again.
+        """
+
+        return self.update_tagged(uid, etag, **kwargs)[0]
+
+    @timed("update")
+    def update_tagged(
+        self, uid: UUID, etag: Optional[str] = None, **kwargs
+    ) -> Tuple[Event, Optional[str]]:
+        """Updates an event like ``update``, returning its new ETag too.
+
+        Servers that change the stored data don't have to return one.
+        """
+
+        if kwargs.keys() >= {"start", "end", "rules"}:
+            data = self._encode(self._validate(uid=uid, **kwargs))
+        else:
+            data, current = self._get(uid)
+            calendar = self._update_calendar(self._parse(data), **kwargs)
+            data = calendar.to_ical()
+            etag = etag or current
+        event, etag = self._replace(uid, data, etag)
+        self._invalidate(event)
+        self._remember(event)
+        self._notify(uid)
+        return event, etag
+
+    def _get(self, uid: UUID) -> Tuple[bytes, Optional[str]]:
+        try:
+            response = self.http.get(str(self._event_url(uid)))
+        except httpx.HTTPError as e:
+            raise CalendarUnavailableError("Can't retrieve event.") from e
+        if response.status_code >= 500:
+            raise CalendarUnavailableError("Can't retrieve event.")
+        if response.status_code != 200:
+            raise CalendarError("Can't retrieve event.")
+        return response.content, response.headers.get("ETag")
+
+    def _remember(self, event: Event) -> Event:
+        if self.stale is not None:
+            self.stale.set_event(event)
+        return event
+
+    def _forget(self, uid: UUID) -> None:
+        if self.stale is not None:
+            self.stale.delete_event(uid)
+
+    def get(self, uid: UUID, allow_stale: bool = True) -> Event:
+        """Returns an event.
+
+        While the server is unavailable the last retrieved version of
+        the event is returned, unless ``allow_stale`` is false.
+        Concurrent gets of the same event share one request.
+        """
+
+        return self.get_tagged(uid, allow_stale)[0]
+
+    @timed("get")
+    def get_tagged(
+        self, uid: UUID, allow_stale: bool = True
+    ) -> Tuple[Event, Optional[str]]:
+        """Returns an event with its ETag, like ``get``.
+
+        Stale versions of the event have no ETag.
+        """
+
+        return self._coalesce(
+            ("get", uid, allow_stale),
+            lambda: self._get_event(uid, allow_stale),
+        )
+
+    def _get_event(
+        self, uid: UUID, allow_stale: bool
+    ) -> Tuple[Event, Optional[str]]:
+        try:
+            data, etag = self._get(uid)
+        except CalendarUnavailableError:
+            if allow_stale and self.stale is not None:
+                event = self.stale.get_event(uid)
+                if event is not None:
+                    return event, None
+            raise
+        return self._remember(self._decode(data)), etag
+
+    @timed("get_many")
+    def get_many(
+        self, uids: Iterable[UUID], allow_stale: bool = True
+    ) -> Dict[UUID, Event]:
+        """Returns the events that exist, like ``get``.
+
+        Stale versions are returned only if all of the events were
+        retrieved before, since missing ones can't be told apart from
+        deleted ones.
+        """
+
+        tagged = self._get_many(uids, allow_stale)
+        return {uid: event for uid, (event, _) in tagged.items()}
+
+    @timed("get_many")
+    def get_many_tagged(
+        self, uids: Iterable[UUID], allow_stale: bool = True
+    ) -> Dict[UUID, Tuple[Event, Optional[str]]]:
+        """Returns the events that exist with their ETags, like ``get_many``.
+
+        Stale versions of the events have no ETags.
+        """
+
+        return self._get_many(uids, allow_stale)
+
+    def _get_many(
+        self, uids: Iterable[UUID], allow_stale: bool
+    ) -> Dict[UUID, Tuple[Event, Optional[str]]]:
+        uids = list(dict.fromkeys(uids))
+        if not uids:
+            return {}
+        try:
+            resources = self._multiget(uids)
+        except CalendarUnavailableError:
+            if allow_stale and self.stale is not None:
+                stale = self.stale.get_events(uids)
+                if stale is not None:
+                    return {uid: (event, None) for uid, event in stale.items()}
+            raise
+        out = {}
+        for resource in resources:
+            data = resource.props.get(cdav.CalendarData.tag)
+            # missing resources come back with no calendar data
+            if not resource.found or data is None:
+                continue
+            event = self._remember(self._decode(data))
+            out[event.uid] = (event, resource.props.get(dav.GetEtag.tag))
+        return out
+
+    def _multiget(self, uids: List[UUID]) -> List[DAVResource]:
+        # caldav's multiget drops the ETags, so the query is sent here
+        query = multiget_query(self._event_url(uid).path for uid in uids)
+        headers = {**XML_HEADERS, "Depth": "1"}
+        try:
+            response = self.http.request(
+                "REPORT",
+                str(self.calendar.url),
+                content=query,
+                headers=headers,
+            )
+        except httpx.HTTPError as e:
+            raise CalendarUnavailableError("Can't retrieve events.") from e
+        if response.status_code >= 500:
+            raise CalendarUnavailableError("Can't retrieve events.")
+        if response.status_code != 207:
+            self._check_stored()
+            raise CalendarError("Can't retrieve events.")
+        return parse_multistatus(response.content)
+
+    @timed("delete")
+    def delete(self, uid: UUID, etag: Optional[str] = None) -> None:
+        self._delete(uid, etag)
+        if self.cache is not None:
+            self.cache.invalidate(uid)
+        self._forget(uid)
+        self._notify(uid)
+
+    def _put(
+        self,
+        uid: UUID,
+        data: bytes,
+        headers: Optional[Dict[str, str]] = None,
+        conflict: str = "Event was modified concurrently.",
+    ) -> Tuple[Event, Optional[str]]:
+        try:
+            response = self.http.put(
+                str(self._event_url(uid)),
+                content=data,
+                headers={**ICS_HEADERS, **(headers or {})},
+            )
+        except httpx.HTTPError as e:
+            raise CalendarError("Can't save event.") from e
+        if response.status_code == 412:
+            raise CalendarConflictError(conflict)
+        if response.status_code not in (200, 201, 204):
+            raise CalendarError("Can't save event.")
+        return self._decode(data), response.headers.get("ETag")
+
+    def _replace(
+        self, uid: UUID, data: bytes, etag: Optional[str] = None
+    ) -> Tuple[Event, Optional[str]]:
+        """Saves an event that has to exist, conditional on ``etag``.
+
+        Without an ETag any version matches. Some servers, like Radicale,
+        reject If-Match: * for existing events, so the current ETag is
+        retrieved for them instead.
+        """
+
+        if etag is None and not self.wildcard_match:
+            _, etag = self._get(uid)
+        try:
+            return self._put(uid, data, {"If-Match": etag or "*"})
+        except CalendarConflictError:
+            if etag is not None:
+                raise
+        # raises if the event doesn't exist
+        _, etag = self._get(uid)
+        self.wildcard_match = False
+        return self._put(uid, data, {"If-Match": etag} if etag else {})
+
+    def _delete(self, uid: UUID, etag: Optional[str] = None) -> None:
+        headers = {"If-Match": etag} if etag else None
+        try:
+            response = self.http.delete(
+                str(self._event_url(uid)), headers=headers
+            )
+        except httpx.HTTPError as e:
+            raise CalendarError("Can't delete event.") from e
+        if response.status_code == 404:
+            raise CalendarError("Can't retrieve event.")
+        if response.status_code == 412:
+            raise CalendarConflictError("Event was modified concurrently.")
+        if response.status_code not in (200, 204):
+            raise CalendarError("Can't delete event.")
+
+    def _run_many(
+        self, function: Callable[[UUID], Optional[Event]], uids: List[UUID]
+    ) -> BulkResult:
+        # requests run concurrently over the pooled connections
+        with ThreadPoolExecutor(self.max_workers) as executor:
+            futures = {uid: executor.submit(function, uid) for uid in uids}
+        succeeded, failed = {}, {}
+        for uid, future in futures.items():
+            try:
+                succeeded[uid] = future.result()
+            except CalendarError as e:
+                failed[uid] = e
+            except Exception as e:
+                # other errors fail only their event too, so the events that
+                # were saved are still reported and can be compensated
+                logger.warning(
+                    "Unexpected error for event %s.", uid, exc_info=e
+                )
+                error = CalendarError("Unexpected calendar error.")
+                error.__cause__ = e
+                failed[uid] = error
+        if succeeded and self.cache is not None:
+            # cheaper than checking every cached window for every event
+            self.cache.clear()
+        for uid, event in succeeded.items():
+            if event is None:
+                self._forget(uid)
+            else:
+                self._remember(event)
+            self._notify(uid)
+        return BulkResult(succeeded, failed)
+
+    def _save_many(
+        self,
+        events: Iterable[Dict[str, Any]],
+        save: Callable[[UUID, bytes], Tuple[Event, Optional[str]]],
+    ) -> BulkResult:
+        data, failed = {}, {}
+        for kwargs in events:
+            try:
+                data[kwargs["uid"]] = self._encode(self._validate(**kwargs))
+            except CalendarError as e:
+                failed[kwargs["uid"]] = e
+        result = self._run_many(
+            lambda uid: save(uid, data[uid])[0],
+            list(data),
+        )
+        result.failed.update(failed)
+        return result
+
+    @timed("add_many")
+    def add_many(self, events: Iterable[Dict[str, Any]]) -> BulkResult:
+        """Saves many new events concurrently, reporting each outcome."""
+
+        return self._save_many(
+            events,
+            lambda uid, data: self._put(
+                uid, data, {"If-None-Match": "*"}, "Event already exists."
+            ),
+        )
+
+    @timed("update_many")
+    def update_many(
+        self,
+        events: Iterable[Dict[str, Any]],
+        etags: Optional[Dict[UUID, Optional[str]]] = None,
+    ) -> BulkResult:
+        """Replaces parameters of many events concurrently.
+
+        Each event has to exist and, if ``etags`` has one for it, still
+        be in that version.
+        """
+
+        etags = etags or {}
+        return self._save_many(
+            events, lambda uid, data: self._replace(uid, data, etags.get(uid))
+        )
+
+    @timed("delete_many")
+    def delete_many(self, uids: Iterable[UUID]) -> BulkResult:
+        return self._run_many(self._delete, list(dict.fromkeys(uids)))
+
+    @staticmethod
+    def _properties(filters: Dict[str, Any]) -> Dict[str, str]:
+        return {
+            EVENT_TO_ICALENDAR_NAME_MAPPING[key].upper(): str(value)
+            for key, value in filters.items()
+        }
+
+    def _query(
+        self,
+        from_date: datetime,
+        to_date: datetime,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> List[caldav.CalendarObjectResource]:
+        # series are expanded here, since servers expanding them return
+        # occurrences in UTC instead of the time zones of the events
+        query = date_search_query(
+            from_date, to_date, False, self._properties(filters or {})
+        )
+        try:
+            return self.calendar.search(query, caldav.Event)
+        except DAVError as e:
+            if unavailable(e):
+                # the URL is fine, the server just didn't answer
+                raise CalendarUnavailableError("Can't retrieve events.") from e
+            self._check_stored()
+            raise CalendarError("Can't retrieve events.") from e
+
+    def _stale_search(
+        self,
+        from_date: datetime,
+        to_date: datetime,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> Optional[List[caldav.CalendarObjectResource]]:
+        if self.stale is None:
+            return None
+        return self.stale.find_search(
+            covering("search", from_date, to_date, False, filters)
+        )
+
+    def _search(
+        self,
+        from_date: datetime,
+        to_date: datetime,
+        filters: Optional[Dict[str, Any]] = None,
+        fallback: bool = True,
+    ) -> List[caldav.CalendarObjectResource]:
+        """Queries the server, falling back to stale results.
+
+        While the server is unavailable, the last result of a search
+        that covered the window is returned instead.
+        """
+
+        try:
+            events = self._query(from_date, to_date, filters)
+        except CalendarUnavailableError:
+            if fallback:
+                stale = self._stale_search(from_date, to_date, filters)
+                if stale is not None:
+                    return stale
+            raise
+        if self.stale is not None:
+            key = search_key("search", from_date, to_date, False, filters)
+            self.stale.set_search(key, events)
+        return events
+
+    def _search_cached(
+        self, from_date: datetime, to_date: datetime
+    ) -> List[Event]:
+        cached = self.cache.get(from_date, to_date)
+        if cached is not None:
+            return cached
+        generation = self.cache.generation
+        window = self.cache.window(from_date, to_date)
+        try:
+            events = self._search(*window, fallback=False)
+        except CalendarUnavailableError:
+            # stale results aren't cached, so they aren't served as fresh
+            stale = self._stale_search(from_date, to_date)
+            if stale is None:
+                raise
+            return self._expand_events(stale, from_date, to_date)
+        events = self._expand_events(events, *window)
+        self.cache.set(window, events, generation)
+        return clip(events, from_date, to_date)
+
+    @timed("search")
+    def search(
+        self,
+        from_date: datetime,
+        to_date: datetime,
+        expand: bool = True,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> List[Event]:
+        """Returns occurrences in the window.
+
+        ``filters`` map event fields, like show or type, to values. They
+        are sent to the server as property filters, so only matching
+        events are transferred and expanded. Concurrent identical
+        searches share one query and expansion.
+        """
+
+        events = self._coalesce(
+            search_key("search", from_date, to_date, expand, filters),
+            lambda: self._search_events(from_date, to_date, expand, filters),
+        )
+        # callers may change their lists
+        return list(events)
+
+    def _search_events(
+        self,
+        from_date: datetime,
+        to_date: datetime,
+        expand: bool,
+        filters: Optional[Dict[str, Any]],
+    ) -> List[Event]:
+        if not expand:
+            events = self._search(from_date, to_date, filters=filters)
+            return select((self._map_event(e) for e in events), filters)
+        if self.cache is not None:
+            if not filters:
+                return self._search_cached(from_date, to_date)
+            # cached windows hold all events, so filter them here
+            cached = self.cache.get(from_date, to_date)
+            if cached is not None:
+                return select(cached, filters)
+        events = self._search(from_date, to_date, filters=filters)
+        # the server matches substrings, so check the exact values
+        return select(self._expand_events(events, from_date, to_date), filters)
+
+    @timed_iter("iter_search")
+    def iter_search(
+        self,
+        from_date: datetime,
+        to_date: datetime,
+        limit: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> Iterator[Event]:
+        """Yields occurrences in the window by start, expanding lazily."""
+
+        if self.cache is not None:
+            if filters:
+                cached = self.cache.get(from_date, to_date)
+            else:
+                # misses fill the cache like search does, so repeated
+                # reads don't query the server again
+                cached = self._coalesce(
+                    search_key("search", from_date, to_date, True, None),
+                    lambda: self._search_cached(from_date, to_date),
+                )
+            if cached is not None:
+                cached = sorted(
+                    select(cached, filters), key=lambda event: event.start
+                )
+                return islice(cached, limit)
+        # concurrent identical searches share one query, but each caller
+        # expands the results lazily on its own
+        events = self._coalesce(
+            search_key("query", from_date, to_date, False, filters),
+            lambda: self._search(from_date, to_date, filters),
+        )
+        calendars = (event.icalendar_instance for event in events)
+        events = self._merge_calendars(calendars, from_date, to_date)
+        if filters:
+            events = (event for event in events if matches(event, filters))
+        return islice(events, limit)
+
+    @timed("upcoming")
+    def upcoming(
+        self,
+        limit: int,
+        from_date: Optional[datetime] = None,
+        horizon: timedelta = timedelta(days=90),
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> List[Event]:
+        """Returns the next ``limit`` occurrences within the horizon."""
+
+        from_date = from_date or utcnow()
+        to_date = from_date + horizon
+        return list(self.iter_search(from_date, to_date, limit, filters))
+
+    @timed("ctag")
+    def ctag(self) -> Optional[str]:
+        """Returns a tag that changes whenever the calendar changes."""
+
+        try:
+            props = self.calendar.get_properties([GetCTag(), dav.SyncToken()])
+        except DAVError as e:
+            self._check_stored()
+            raise CalendarError("Can't retrieve calendar properties.") from e
+        return props.get(GetCTag.tag) or props.get(dav.SyncToken.tag)
+
+    def ics(self) -> Iterator[bytes]:
+        """Streams the whole calendar in iCalendar format."""
+
+        try:
+            with self.http.stream("GET", self.calendar.canonical_url) as r:
+                if r.status_code != 200:
+                    raise CalendarError("Can't retrieve calendar.")
+                yield from r.iter_bytes(self.chunk_size)
+        except httpx.HTTPError as e:
+            raise CalendarError("Can't retrieve calendar.") from e
+
+    @timed("download")
+    def download(self) -> bytes:
+        """Returns the whole calendar, sharing concurrent downloads."""
+
+        return self._coalesce(("ics",), lambda: b"".join(self.ics()))
+
+    def close(self) -> None:
+        self.http.close()
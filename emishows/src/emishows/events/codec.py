@@ -0,0 +1,209 @@
+"""Fast mapping between our Event schema and VEVENT text.
+
+Only the content that we write ourselves is handled here: one VEVENT with
+UID, DTSTART, DTEND, RRULE and the show and type stamps. Anything else
+raises UnsupportedContent, so callers can fall back to the full icalendar
+parser.
+
+"""
+
+import re
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, Optional, Union
+from uuid import UUID
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from icalendar.parser import foldline
+from icalendar.prop import vRecur
+
+from emishows.events.errors import CalendarError
+from emishows.events.models import Event
+
+DATETIME_PATTERN = re.compile(r"(\d{4})(\d{2})(\d{2})T(\d{2})(\d{2})(\d{2})Z?")
+FOLD_PATTERN = re.compile(r"\r?\n[ \t]")
+
+# properties that carry the show and event type of an event
+SHOW = "X-EMISHOWS-SHOW"
+TYPE = "X-EMISHOWS-TYPE"
+
+# components that may appear around our VEVENT without changing its meaning
+IGNORED_COMPONENTS = {"VTIMEZONE", "STANDARD", "DAYLIGHT", "VALARM"}
+
+
+class UnsupportedContent(ValueError):
+    """Content that needs the full icalendar parser."""
+
+
+class VEvent:
+    """Properties of a parsed VEVENT, before validation."""
+
+    __slots__ = ("uid", "start", "end", "rules", "show", "type")
+
+    def __init__(
+        self,
+        uid: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        rules: Optional[Dict[str, Any]] = None,
+        show: Optional[int] = None,
+        type: Optional[int] = None,
+    ) -> None:
+        self.uid = uid
+        self.start = start
+        self.end = end
+        self.rules = rules
+        self.show = show
+        self.type = type
+
+    def to_event(self) -> Event:
+        if self.uid is None or self.start is None or self.end is None:
+            raise UnsupportedContent("Missing properties.")
+        try:
+            uid = UUID(self.uid)
+        except ValueError as e:
+            raise CalendarError("Invalid event data.") from e
+        # values are already typed, so validation can be skipped
+        return Event.construct(
+            uid=uid,
+            start=self.start,
+            end=self.end,
+            rules=self.rules,
+            show=self.show,
+            type=self.type,
+        )
+
+
+@lru_cache(maxsize=None)
+def zone(key: str) -> ZoneInfo:
+    try:
+        return ZoneInfo(key)
+    except (ZoneInfoNotFoundError, ValueError) as e:
+        raise CalendarError("Invalid timezone.") from e
+
+
+def _split(line: str):
+    name, sep, value = line.partition(":")
+    if not sep or '"' in name:
+        raise UnsupportedContent(line)
+    name, *params = name.split(";")
+    parameters = {}
+    for param in params:
+        key, sep, param_value = param.partition("=")
+        if not sep:
+            raise UnsupportedContent(line)
+        parameters[key.upper()] = param_value
+    return name.upper(), parameters, value
+
+
+def _datetime(parameters: Dict[str, str], value: str) -> datetime:
+    if parameters.get("VALUE", "DATE-TIME").upper() != "DATE-TIME":
+        raise UnsupportedContent(value)
+    match = DATETIME_PATTERN.fullmatch(value)
+    if match is None:
+        raise UnsupportedContent(value)
+    tzinfo = zone(parameters.get("TZID", "Etc/UTC"))
+    return datetime(*map(int, match.groups()), tzinfo=tzinfo)
+
+
+def _parse(data: Union[bytes, str]) -> VEvent:
+    if isinstance(data, bytes):
+        data = data.decode()
+    vevent = None
+    stack = []
+    for line in FOLD_PATTERN.sub("", data).splitlines():
+        if not line:
+            continue
+        name, parameters, value = _split(line)
+        if name == "BEGIN":
+            value = value.upper()
+            if value == "VEVENT" and stack == ["VCALENDAR"]:
+                if vevent is not None:
+                    raise UnsupportedContent("Many events.")
+                vevent = VEvent()
+            elif value not in IGNORED_COMPONENTS and stack:
+                raise UnsupportedContent(value)
+            stack.append(value)
+        elif name == "END":
+            if not stack or stack.pop() != value.upper():
+                raise UnsupportedContent(line)
+        elif stack == ["VCALENDAR", "VEVENT"]:
+            if name == "UID":
+                if vevent.uid is not None or "\\" in value:
+                    raise UnsupportedContent(line)
+                vevent.uid = value
+            elif name == "DTSTART":
+                if vevent.start is not None:
+                    raise UnsupportedContent(line)
+                vevent.start = _datetime(parameters, value)
+            elif name == "DTEND":
+                if vevent.end is not None:
+                    raise UnsupportedContent(line)
+                vevent.end = _datetime(parameters, value)
+            elif name == "RRULE":
+                if vevent.rules is not None:
+                    raise UnsupportedContent(line)
+                vevent.rules = dict(vRecur.from_ical(value))
+            elif name == SHOW:
+                if vevent.show is not None:
+                    raise UnsupportedContent(line)
+                vevent.show = int(value)
+            elif name == TYPE:
+                if vevent.type is not None:
+                    raise UnsupportedContent(line)
+                vevent.type = int(value)
+            elif name in ("RECURRENCE-ID", "RDATE", "EXDATE", "DURATION"):
+                raise UnsupportedContent(line)
+    if vevent is None or stack:
+        raise UnsupportedContent("No event.")
+    return vevent
+
+
+def parse(data: Union[bytes, str]) -> VEvent:
+    try:
+        return _parse(data)
+    except UnsupportedContent:
+        raise
+    except ValueError as e:
+        raise UnsupportedContent(str(e)) from e
+
+
+def decode(data: Union[bytes, str]) -> Event:
+    return parse(data).to_event()
+
+
+def _format_datetime(name: str, dt: datetime) -> str:
+    key = getattr(dt.tzinfo, "key", None)
+    if not isinstance(dt.tzinfo, ZoneInfo) or key is None:
+        raise UnsupportedContent(name)
+    value = "%04d%02d%02dT%02d%02d%02d" % (
+        dt.year,
+        dt.month,
+        dt.day,
+        dt.hour,
+        dt.minute,
+        dt.second,
+    )
+    # icalendar marks UTC times with a suffix, so do the same
+    suffix = "Z" if key == "UTC" else ""
+    return f"{name};TZID={key};VALUE=DATE-TIME:{value}{suffix}\r\n"
+
+
+def encode(event: Event) -> bytes:
+    lines = [
+        "BEGIN:VCALENDAR\r\nBEGIN:VEVENT\r\n",
+        _format_datetime("DTSTART", event.start),
+        _format_datetime("DTEND", event.end),
+        f"UID:{event.uid}\r\n",
+    ]
+    if event.rules is not None:
+        if not event.rules:
+            raise UnsupportedContent("Empty rules.")
+        rules = vRecur(event.rules).to_ical().decode()
+        lines.append(foldline(f"RRULE:{rules}") + "\r\n")
+    if event.show is not None:
+        lines.append(f"{SHOW}:{event.show}\r\n")
+    if event.type is not None:
+        lines.append(f"{TYPE}:{event.type}\r\n")
+    lines.append("END:VEVENT\r\nEND:VCALENDAR\r\n")
+    return "".join(lines).encode()
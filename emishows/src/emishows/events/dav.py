@@ -0,0 +1,157 @@
+import ssl
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+import httpx
+from caldav import DAVClient
+from caldav.davclient import DAVResponse
+from caldav.elements import cdav, dav
+from caldav.elements.base import BaseElement
+from caldav.lib import error
+from caldav.lib.python_utilities import to_wire
+from caldav.lib.url import URL
+from lxml import etree
+
+XML_HEADERS = {"Content-Type": 'application/xml; charset="utf-8"'}
+ICS_HEADERS = {"Content-Type": 'text/calendar; charset="utf-8"'}
+
+
+class GetCTag(BaseElement):
+    tag = "{http://calendarserver.org/ns/}getctag"
+
+
+class DAVResource(NamedTuple):
+    href: str
+    status: Optional[str]
+    props: Dict[str, Optional[str]]
+
+    @property
+    def found(self) -> bool:
+        return self.status is None or " 404 " not in self.status
+
+
+@lru_cache(maxsize=None)
+def ssl_context() -> ssl.SSLContext:
+    """Returns an SSL context shared by all clients.
+
+    Loading certificates takes tens of milliseconds, so it's done once.
+    """
+
+    return httpx.create_ssl_context()
+
+
+def serialize(element: BaseElement) -> bytes:
+    return etree.tostring(
+        element.xmlelement(), encoding="utf-8", xml_declaration=True
+    )
+
+
+def principal_query() -> bytes:
+    return serialize(
+        dav.Propfind() + (dav.Prop() + dav.CurrentUserPrincipal())
+    )
+
+
+def home_set_query() -> bytes:
+    return serialize(dav.Propfind() + (dav.Prop() + cdav.CalendarHomeSet()))
+
+
+def date_search_query(
+    start: datetime,
+    end: datetime,
+    expand: bool = True,
+    properties: Optional[Dict[str, str]] = None,
+) -> bytes:
+    """Builds a calendar-query for events in the window.
+
+    With ``properties``, only events with properties containing the given
+    text are returned.
+    """
+
+    data = cdav.CalendarData()
+    if expand:
+        data += cdav.Expand(start, end)
+    query = cdav.CompFilter("VEVENT") + cdav.TimeRange(start, end)
+    for name, value in (properties or {}).items():
+        query += cdav.PropFilter(name) + cdav.TextMatch(value)
+    vcalendar = cdav.CompFilter("VCALENDAR") + query
+    root = cdav.CalendarQuery() + [
+        dav.Prop() + [dav.GetEtag(), data],
+        cdav.Filter() + vcalendar,
+    ]
+    return serialize(root)
+
+
+def multiget_query(hrefs: Iterable[str]) -> bytes:
+    prop = dav.Prop() + [dav.GetEtag(), cdav.CalendarData()]
+    root = cdav.CalendarMultiGet() + prop
+    root += [dav.Href(value=href) for href in hrefs]
+    return serialize(root)
+
+
+def _prop_value(prop: etree._Element) -> Optional[str]:
+    if len(prop) == 0:
+        return prop.text
+    href = prop.find(f".//{dav.Href.tag}")
+    return href.text if href is not None else None
+
+
+def parse_multistatus(content: bytes) -> List[DAVResource]:
+    root = etree.fromstring(content)
+    resources = []
+    for response in root.iter(dav.Response.tag):
+        href = response.findtext(dav.Href.tag)
+        status = response.findtext(dav.Status.tag)
+        props = {}
+        for propstat in response.iter(dav.PropStat.tag):
+            if " 200 " not in (propstat.findtext(dav.Status.tag) or ""):
+                continue
+            for prop in propstat.find(dav.Prop.tag):
+                props[prop.tag] = _prop_value(prop)
+        resources.append(DAVResource(href, status, props))
+    return resources
+
+
+class ServerError(error.DAVError):
+    """The server failed to handle a request."""
+
+
+def unavailable(e: error.DAVError) -> bool:
+    """Returns whether a request failed because of the server."""
+
+    return isinstance(e, ServerError) or isinstance(
+        e.__cause__, httpx.HTTPError
+    )
+
+
+class HTTPXDAVClient(DAVClient):
+    """DAVClient that sends requests through a shared httpx.Client.
+
+    Authentication is left to the httpx client, so no extra login probes
+    are made and connections are kept alive between calls.
+    """
+
+    def __init__(self, url: str, client: httpx.Client) -> None:
+        super().__init__(url=url)
+        self.http = client
+
+    def request(self, url, method="GET", body="", headers={}):
+        headers, _ = self._pre_request(url, body, headers)
+        try:
+            response = self.http.request(
+                method,
+                str(URL.objectify(url)),
+                content=to_wire(body),
+                headers=headers,
+            )
+        except httpx.HTTPError as e:
+            raise error.DAVError(str(e)) from e
+        if response.status_code >= 500:
+            raise ServerError(
+                f"{response.status_code} {response.reason_phrase}"
+            )
+        response = DAVResponse(response)
+        if response.status in (401, 403):
+            raise error.AuthorizationError(url=str(url))
+        return response
@@ -0,0 +1,168 @@
+"""Lazy discovery of calendar URLs.
+
+Finding a calendar takes a few PROPFINDs, so it is done on first use
+instead of at startup, retried with backoff and remembered in a file
+between restarts.
+
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional, Union
+from urllib.parse import urljoin
+
+from emishows.events import dav as davxml
+from emishows.events.errors import CalendarError
+from emishows.events.resilience import failing_fast
+
+Propfind = Callable[[str, bytes], str]
+AsyncPropfind = Callable[[str, bytes], Awaitable[str]]
+
+
+class Retry(NamedTuple):
+    """How many times to try discovery and how long to wait in between."""
+
+    attempts: int = 3
+    backoff: float = 0.5
+
+    def delay(self, attempt: int) -> float:
+        return self.backoff * 2**attempt
+
+
+def find_href(url: str, content: bytes) -> str:
+    """Returns the first URL found in a PROPFIND response."""
+
+    for resource in davxml.parse_multistatus(content):
+        for value in resource.props.values():
+            if value is not None:
+                return urljoin(url, value)
+    raise CalendarError("Can't discover calendar.")
+
+
+class URLStore:
+    """Discovered calendar URLs persisted in a JSON file."""
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, str]:
+        try:
+            with open(self.path) as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _dump(self, data: Dict[str, str]) -> None:
+        # write to a temporary file first, so readers never see half of it
+        temporary = self.path.with_name(f".{self.path.name}.{os.getpid()}")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(temporary, "w") as file:
+                json.dump(data, file)
+            os.replace(temporary, self.path)
+        except OSError:
+            # the store is only an optimization
+            pass
+
+    def get(self, key: str) -> Optional[str]:
+        return self._load().get(key)
+
+    def set(self, key: str, url: str) -> None:
+        with self._lock:
+            data = self._load()
+            data[key] = url
+            self._dump(data)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            data = self._load()
+            if data.pop(key, None) is not None:
+                self._dump(data)
+
+
+class Discovery:
+    """Resolves the URL of a calendar on first use.
+
+    A URL loaded from the store is trusted until ``forget`` is called,
+    which callers do when requests to it fail.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        name: str,
+        user: Optional[str] = None,
+        store: Optional[URLStore] = None,
+        retry: Retry = Retry(),
+    ) -> None:
+        self.base_url = url
+        self.name = name
+        self.store = store
+        self.retry = retry
+        self.key = f"{user or ''}@{url}#{name}"
+        self.url: Optional[str] = None
+        self.stored = False
+        self._lock = threading.Lock()
+
+    def _load(self) -> Optional[str]:
+        if self.url is None and self.store is not None:
+            self.url = self.store.get(self.key)
+            self.stored = self.url is not None
+        return self.url
+
+    def _save(self, url: str) -> str:
+        self.url, self.stored = url, False
+        if self.store is not None:
+            self.store.set(self.key, url)
+        return url
+
+    def _attempts(self, attempts: Optional[int]) -> int:
+        return max(attempts or self.retry.attempts, 1)
+
+    def resolve(
+        self, propfind: Propfind, attempts: Optional[int] = None
+    ) -> str:
+        with self._lock:
+            if self._load() is not None:
+                return self.url
+            attempts = self._attempts(attempts)
+            for attempt in range(attempts):
+                try:
+                    principal = propfind(
+                        self.base_url, davxml.principal_query()
+                    )
+                    home = propfind(principal, davxml.home_set_query())
+                    return self._save(urljoin(home, f"{self.name}/"))
+                except CalendarError as e:
+                    if attempt == attempts - 1 or failing_fast(e):
+                        raise
+                    time.sleep(self.retry.delay(attempt))
+
+    async def aresolve(
+        self, propfind: AsyncPropfind, attempts: Optional[int] = None
+    ) -> str:
+        if self._load() is not None:
+            return self.url
+        attempts = self._attempts(attempts)
+        for attempt in range(attempts):
+            try:
+                principal = await propfind(
+                    self.base_url, davxml.principal_query()
+                )
+                home = await propfind(principal, davxml.home_set_query())
+                return self._save(urljoin(home, f"{self.name}/"))
+            except CalendarError as e:
+                if attempt == attempts - 1 or failing_fast(e):
+                    raise
+                await asyncio.sleep(self.retry.delay(attempt))
+
+    def forget(self) -> None:
+        self.url, self.stored = None, False
+        if self.store is not None:
+            self.store.delete(self.key)
@@ -0,0 +1,10 @@
+class CalendarError(RuntimeError):
+    pass
+
+
+class CalendarConflictError(CalendarError):
+    """The event was changed on the server since it was read."""
+
+
+class CalendarUnavailableError(CalendarError):
+    """The server couldn't be reached or failed to answer."""
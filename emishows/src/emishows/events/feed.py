@@ -0,0 +1,114 @@
+"""Fan-out of calendar changes to asyncio subscribers.
+
+Changes are published from the mirror thread and delivered to queues
+living on event loops, so any number of clients share one upstream
+watch.
+
+"""
+
+import asyncio
+import threading
+from collections import deque
+from typing import Deque, List, NamedTuple, Optional, Set, Tuple
+from uuid import UUID
+
+from emishows.events.models import Event
+
+
+class Change(NamedTuple):
+    """Occurrences of an event within the mirrored horizon.
+
+    Kind is "created", "updated" or "deleted". A "reset" change has no
+    event and means that subscribers should reload everything.
+    """
+
+    kind: str
+    uid: Optional[UUID] = None
+    occurrences: List[Event] = []
+
+
+RESET = Change("reset")
+
+Message = Tuple[int, Change]
+
+
+class Subscription:
+    """Queue of changes consumed on one event loop."""
+
+    def __init__(self, maxsize: int) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.queue: "asyncio.Queue[Message]" = asyncio.Queue(maxsize)
+
+    def put(self, message: Message) -> None:
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # a slow consumer can't catch up, so tell it to start over
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait((message[0], RESET))
+
+    async def get(self) -> Message:
+        return await self.queue.get()
+
+
+class ChangeFeed:
+    """Publishes changes to all subscribers and remembers recent ones.
+
+    Subscribers that reconnect can pass the last sequence number they
+    saw to receive the changes they missed.
+    """
+
+    def __init__(self, history: int = 256, maxsize: int = 256) -> None:
+        self.maxsize = maxsize
+        self.sequence = 0
+        self._history: Deque[Message] = deque(maxlen=history)
+        self._subscriptions: Set[Subscription] = set()
+        self._lock = threading.Lock()
+
+    def publish(self, changes: List[Change]) -> None:
+        """Called from any thread, usually by a mirror."""
+
+        with self._lock:
+            messages = []
+            for change in changes:
+                self.sequence += 1
+                messages.append((self.sequence, change))
+            self._history.extend(messages)
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            for message in messages:
+                try:
+                    subscription.loop.call_soon_threadsafe(
+                        subscription.put, message
+                    )
+                except RuntimeError:
+                    # the loop is closed
+                    self.unsubscribe(subscription)
+                    break
+
+    def subscribe(self, last: Optional[int] = None) -> Subscription:
+        """Must be called on the event loop that consumes changes."""
+
+        subscription = Subscription(self.maxsize)
+        with self._lock:
+            self._subscriptions.add(subscription)
+            if last is None or last == self.sequence:
+                return subscription
+            missed = [
+                message for message in self._history if message[0] > last
+            ]
+            # too old or from before a restart
+            if not missed or missed[0][0] != last + 1:
+                missed = [(self.sequence, RESET)]
+            for message in missed:
+                subscription.put(message)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscriptions)
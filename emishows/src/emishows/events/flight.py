@@ -0,0 +1,105 @@
+"""Coalescing of concurrent identical calendar requests.
+
+When many clients ask for the same data at the same moment, like the
+timetable at the top of the hour, only the first call is sent to the
+server. The others wait for it and share its result.
+
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+from emishows.events.resilience import mark_stale, stale_scope
+from emishows.metrics import CACHE_LOOKUPS
+
+T = TypeVar("T")
+
+# result of a call and the age of stale data it used, if any
+Outcome = Tuple[Any, Optional[float]]
+
+
+def _share(outcome: Outcome) -> Any:
+    value, age = outcome
+    # every caller's response is built from the same data
+    if age is not None:
+        mark_stale(age)
+    return value
+
+
+class SingleFlight:
+    """Runs concurrent calls with the same key once, sharing the result.
+
+    Safe to use from many threads. Exceptions are shared too.
+    """
+
+    def __init__(self) -> None:
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, function: Callable[[], T]) -> T:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            CACHE_LOOKUPS.labels("flight", "hit").inc()
+            return _share(future.result())
+
+        CACHE_LOOKUPS.labels("flight", "miss").inc()
+        try:
+            with stale_scope() as ages:
+                value = function()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result((value, max(ages, default=None)))
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return _share(future.result())
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines.
+
+    The call runs in a task of its own, so a caller that is cancelled
+    doesn't cancel it for the others. Calls are shared only within an
+    event loop.
+    """
+
+    def __init__(self) -> None:
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    @staticmethod
+    async def _run(function: Callable[[], Awaitable[T]]) -> Outcome:
+        with stale_scope() as ages:
+            value = await function()
+        return value, max(ages, default=None)
+
+    async def do(
+        self, key: Hashable, function: Callable[[], Awaitable[T]]
+    ) -> T:
+        key = (asyncio.get_running_loop(), key)
+        task = self._calls.get(key)
+        if task is None:
+            CACHE_LOOKUPS.labels("flight", "miss").inc()
+            task = self._calls[key] = asyncio.ensure_future(
+                self._run(function)
+            )
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            CACHE_LOOKUPS.labels("flight", "hit").inc()
+        return _share(await asyncio.shield(task))
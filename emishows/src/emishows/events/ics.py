@@ -0,0 +1,122 @@
+import hashlib
+import time
+from datetime import datetime
+from threading import Lock
+from typing import Dict, NamedTuple, Optional
+from uuid import UUID
+
+from django.core.cache.backends.base import BaseCache
+
+from emishows.compression import compress
+from emishows.events.cache import SharedCounter
+from emishows.events.calendar import Calendar
+from emishows.utils import utcnow
+
+
+class ICSSnapshot(NamedTuple):
+    ctag: Optional[str]
+    etag: str
+    last_modified: datetime
+    content: bytes
+    encodings: Dict[str, bytes]
+
+    def encode(self, encoding: str) -> bytes:
+        """Returns the content compressed once per snapshot."""
+
+        data = self.encodings.get(encoding)
+        if data is None:
+            data = self.encodings[encoding] = compress(self.content, encoding)
+        return data
+
+
+class ICSCache:
+    """Snapshot of the whole calendar in iCalendar format.
+
+    The snapshot is trusted for ``ttl`` seconds, then revalidated against
+    the collection CTag and downloaded again only if the CTag changed.
+    Writes through the calendar client invalidate it immediately, and so
+    do writes counted by ``changes`` in other processes. With a shared
+    ``backend``, a snapshot downloaded by one process is reused by others.
+    """
+
+    def __init__(
+        self,
+        calendar: Calendar,
+        ttl: float = 30,
+        backend: Optional[BaseCache] = None,
+        changes: Optional[SharedCounter] = None,
+    ) -> None:
+        self.calendar = calendar
+        self.ttl = ttl
+        self.backend = backend
+        self.changes = changes
+        self._seen: Optional[int] = None
+        self._snapshot: Optional[ICSSnapshot] = None
+        self._checked_at = float("-inf")
+        self._generation = 0
+        self._lock = Lock()
+        calendar.listeners.append(self.notify)
+
+    def notify(self, uid: Optional[UUID] = None) -> None:
+        self._generation += 1
+        self._checked_at = float("-inf")
+
+    def fresh(self) -> Optional[ICSSnapshot]:
+        """Returns the snapshot if it can be served without revalidation."""
+
+        if time.monotonic() - self._checked_at > self.ttl:
+            return None
+        if self.changes is not None and self.changes.value() != self._seen:
+            return None
+        return self._snapshot
+
+    @property
+    def _key(self) -> str:
+        return f"ics:{self.calendar.name}"
+
+    def _shared(self, ctag: Optional[str]) -> Optional[ICSSnapshot]:
+        if self.backend is None or ctag is None:
+            return None
+        snapshot = self.backend.get(self._key)
+        if snapshot is None or snapshot.ctag != ctag:
+            return None
+        return snapshot._replace(encodings={})
+
+    def _share(self, snapshot: ICSSnapshot) -> None:
+        if self.backend is not None and snapshot.ctag is not None:
+            # encodings are computed lazily by each process
+            snapshot = snapshot._replace(encodings={})
+            self.backend.set(self._key, snapshot, timeout=None)
+
+    def _download(self, ctag: Optional[str]) -> ICSSnapshot:
+        content = self.calendar.download()
+        etag = f'"{hashlib.sha1(content).hexdigest()}"'
+        old = self._snapshot
+        if old is not None and old.etag == etag:
+            return old._replace(ctag=ctag)
+        return ICSSnapshot(ctag, etag, utcnow(), content, {})
+
+    def get(self) -> ICSSnapshot:
+        snapshot = self.fresh()
+        if snapshot is not None:
+            return snapshot
+        with self._lock:
+            snapshot = self.fresh()
+            if snapshot is not None:
+                return snapshot
+            generation = self._generation
+            checked_at = time.monotonic()
+            seen = self.changes.value() if self.changes is not None else None
+            ctag = self.calendar.ctag()
+            snapshot = self._snapshot
+            if snapshot is None or ctag is None or snapshot.ctag != ctag:
+                snapshot = self._shared(ctag)
+                if snapshot is None:
+                    snapshot = self._download(ctag)
+                    self._share(snapshot)
+            self._snapshot = snapshot
+            # a write during the refresh means the snapshot may be stale
+            if generation == self._generation:
+                self._checked_at = checked_at
+                self._seen = seen
+            return snapshot
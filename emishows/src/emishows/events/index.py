@@ -0,0 +1,108 @@
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from heapq import heappop, heappush
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from emishows.events.models import Event
+
+
+def overlaps(event: Event, from_date: datetime, to_date: datetime) -> bool:
+    if event.start >= to_date:
+        return False
+    return event.end > from_date or event.start >= from_date
+
+
+def clip(
+    events: Iterable[Event], from_date: datetime, to_date: datetime
+) -> List[Event]:
+    return [event for event in events if overlaps(event, from_date, to_date)]
+
+
+def matches(event: Event, filters: Dict[str, Any]) -> bool:
+    return all(getattr(event, key) == value for key, value in filters.items())
+
+
+def select(
+    events: Iterable[Event], filters: Optional[Dict[str, Any]] = None
+) -> List[Event]:
+    """Returns events with fields equal to the values in ``filters``."""
+
+    if not filters:
+        return list(events)
+    return [event for event in events if matches(event, filters)]
+
+
+def conflicts(
+    events: Iterable[Event], others: Optional[Iterable[Event]] = None
+) -> List[Tuple[Event, Event]]:
+    """Returns pairs of overlapping occurrences of different events.
+
+    Occurrences are swept by start while those still running are kept in
+    heaps by end, so this takes O(n log n) plus the number of pairs. With
+    ``others``, only pairs of an occurrence from ``events`` and one from
+    ``others`` are returned, in that order.
+    """
+
+    tagged = [(event, 0) for event in events]
+    tagged.extend((event, 1) for event in others or ())
+    tagged.sort(key=lambda item: item[0].start)
+    running = ([], [])
+    pairs = []
+    for i, (event, tag) in enumerate(tagged):
+        for heap in running:
+            while heap and heap[0][0] <= event.start:
+                heappop(heap)
+        candidates = running[0] if others is None else running[1 - tag]
+        for _, _, other in candidates:
+            if other.uid == event.uid:
+                continue
+            if others is not None and tag == 0:
+                pairs.append((event, other))
+            else:
+                pairs.append((other, event))
+        heappush(running[tag], (event.end, i, event))
+    return pairs
+
+
+def gaps(
+    events: Iterable[Event],
+    from_date: datetime,
+    to_date: datetime,
+    duration: timedelta = timedelta(0),
+) -> List[Tuple[datetime, datetime]]:
+    """Returns free slots in the window at least ``duration`` long."""
+
+    slots = []
+    free = from_date
+    for event in sorted(events, key=lambda event: event.start):
+        if event.start >= to_date:
+            break
+        if event.start > free:
+            slots.append((free, event.start))
+        free = max(free, event.end)
+    if free < to_date:
+        slots.append((free, to_date))
+    return [(start, end) for start, end in slots if end - start >= duration]
+
+
+class OccurrenceIndex:
+    """Occurrences sorted by start, queried by bisection."""
+
+    def __init__(self, events: Iterable[Event] = ()) -> None:
+        self._events = sorted(events, key=lambda event: event.start)
+        self._starts = [event.start for event in self._events]
+        self._max_duration = max(
+            (event.end - event.start for event in self._events),
+            default=timedelta(0),
+        )
+
+    def between(self, from_date: datetime, to_date: datetime) -> List[Event]:
+        lo = bisect_left(self._starts, from_date - self._max_duration)
+        hi = bisect_left(self._starts, to_date)
+        return clip(self._events[lo:hi], from_date, to_date)
+
+    def __iter__(self):
+        return iter(self._events)
+
+    def __len__(self) -> int:
+        return len(self._events)
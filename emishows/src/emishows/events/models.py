@@ -0,0 +1,22 @@
+from datetime import datetime
+from typing import Any, Dict, NamedTuple, Optional
+from uuid import UUID
+
+from pydantic import BaseModel
+
+from emishows.events.errors import CalendarError
+
+
+class Event(BaseModel):
+    uid: UUID
+    start: datetime
+    end: datetime
+    rules: Optional[Dict[str, Any]] = None
+    # stamped into the VEVENT, so that searches can filter by them
+    show: Optional[int] = None
+    type: Optional[int] = None
+
+
+class BulkResult(NamedTuple):
+    succeeded: Dict[UUID, Optional[Event]]
+    failed: Dict[UUID, CalendarError]
@@ -0,0 +1,302 @@
+"""Protection of the API from a slow or unavailable calendar server.
+
+A circuit breaker stops sending requests after repeated failures, so
+callers fail fast instead of waiting for timeouts. Meanwhile reads can
+be answered with the last good results, and the current request is
+flagged as stale.
+
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+from uuid import UUID
+
+import httpx
+
+from emishows.events.cache import LRUCache
+from emishows.events.models import Event
+from emishows.metrics import CACHE_LOOKUPS
+
+# ages are collected in a list, so marks made in other threads or tasks
+# of the same request are seen too
+_stale: ContextVar[Optional[List[float]]] = ContextVar("stale", default=None)
+
+
+def reset_stale() -> None:
+    _stale.set([])
+
+
+def mark_stale(age: float) -> None:
+    """Flags the current request as answered with data of this age."""
+
+    ages = _stale.get()
+    if ages is not None:
+        ages.append(age)
+
+
+def stale_age() -> Optional[float]:
+    """Returns the age of the oldest stale data used, if any."""
+
+    ages = _stale.get()
+    return max(ages) if ages else None
+
+
+@contextmanager
+def stale_scope() -> Iterator[List[float]]:
+    """Collects ages of stale data used within the block separately."""
+
+    token = _stale.set([])
+    try:
+        yield _stale.get()
+    finally:
+        _stale.reset(token)
+
+
+class CircuitOpenError(httpx.TransportError):
+    """Raised instead of sending a request while the circuit is open."""
+
+
+def failing_fast(e: BaseException) -> bool:
+    """Returns whether an error was raised because the circuit is open."""
+
+    return isinstance(e.__cause__, CircuitOpenError)
+
+
+class CircuitBreaker:
+    """Fails fast after ``threshold`` consecutive failures.
+
+    After ``reset`` seconds a single request is let through. If it
+    succeeds the circuit closes, otherwise it stays open for another
+    ``reset`` seconds.
+    """
+
+    def __init__(self, threshold: int = 5, reset: float = 30) -> None:
+        self.threshold = threshold
+        self.reset = reset
+        self.failures = 0
+        self._opened: Optional[float] = None
+        self._probe: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _state(self, now: float) -> str:
+        if self._opened is None:
+            return "closed"
+        if now - self._opened < self.reset:
+            return "open"
+        return "half-open"
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            state = self._state(now)
+            if state == "closed":
+                return True
+            if state == "open":
+                return False
+            # a probe that never finished doesn't block the next one
+            if self._probe is not None and now - self._probe < self.reset:
+                return False
+            self._probe = now
+            return True
+
+    def success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._opened = self._probe = None
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probe = None
+            if self._opened is not None or self.failures >= self.threshold:
+                self._opened = time.monotonic()
+
+
+def _check(breaker: CircuitBreaker, request: httpx.Request) -> None:
+    if not breaker.allow():
+        raise CircuitOpenError(
+            "Calendar server is unavailable.", request=request
+        )
+
+
+def _report(breaker: CircuitBreaker, response: httpx.Response) -> None:
+    if response.status_code >= 500:
+        breaker.failure()
+    else:
+        breaker.success()
+
+
+class BreakerTransport(httpx.BaseTransport):
+    """Transport that sends requests only while the circuit is closed."""
+
+    def __init__(
+        self, transport: httpx.BaseTransport, breaker: CircuitBreaker
+    ) -> None:
+        self.transport = transport
+        self.breaker = breaker
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        _check(self.breaker, request)
+        try:
+            response = self.transport.handle_request(request)
+        except httpx.TransportError:
+            self.breaker.failure()
+            raise
+        _report(self.breaker, response)
+        return response
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class AsyncBreakerTransport(httpx.AsyncBaseTransport):
+    """Async counterpart of BreakerTransport."""
+
+    def __init__(
+        self, transport: httpx.AsyncBaseTransport, breaker: CircuitBreaker
+    ) -> None:
+        self.transport = transport
+        self.breaker = breaker
+
+    async def handle_async_request(
+        self, request: httpx.Request
+    ) -> httpx.Response:
+        _check(self.breaker, request)
+        try:
+            response = await self.transport.handle_async_request(request)
+        except httpx.TransportError:
+            self.breaker.failure()
+            raise
+        _report(self.breaker, response)
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class StaleResults:
+    """Last good results of calendar reads, kept to serve during outages.
+
+    Searches are kept by their window and filters, events by UID.
+    Results older than ``ttl`` seconds are not served at all.
+    """
+
+    def __init__(
+        self,
+        searches: int = 256,
+        events: int = 10000,
+        ttl: Optional[float] = 86400,
+    ) -> None:
+        self._searches: LRUCache[Hashable, Tuple[float, Any]] = LRUCache(
+            searches, ttl
+        )
+        self._events: LRUCache[UUID, Tuple[float, Event]] = LRUCache(
+            events, ttl
+        )
+
+    @staticmethod
+    def _serve(stored: Tuple[float, Any]) -> Any:
+        CACHE_LOOKUPS.labels("stale", "hit").inc()
+        mark_stale(time.time() - stored[0])
+        return stored[1]
+
+    @staticmethod
+    def _miss() -> None:
+        CACHE_LOOKUPS.labels("stale", "miss").inc()
+
+    def set_search(self, key: Hashable, value: Any) -> None:
+        self._searches.set(key, (time.time(), value))
+
+    def find_search(self, match: Callable[[Hashable], bool]) -> Optional[Any]:
+        """Returns the most recently used result with a matching key."""
+
+        for key, stored in reversed(self._searches.items()):
+            if match(key):
+                return self._serve(stored)
+        self._miss()
+        return None
+
+    def set_event(self, event: Event) -> None:
+        self._events.set(event.uid, (time.time(), event))
+
+    def delete_event(self, uid: UUID) -> None:
+        self._events.delete(uid)
+
+    def get_event(self, uid: UUID) -> Optional[Event]:
+        stored = self._events.get(uid)
+        if stored is None:
+            self._miss()
+            return None
+        return self._serve(stored)
+
+    def get_events(self, uids: Iterable[UUID]) -> Optional[Dict[UUID, Event]]:
+        """Returns all of the events, or None if any of them is missing."""
+
+        stored = [self._events.get(uid) for uid in uids]
+        if any(item is None for item in stored):
+            self._miss()
+            return None
+        events = [self._serve(item) for item in stored]
+        return {event.uid: event for event in events}
+
+
+def search_key(
+    kind: str,
+    from_date: datetime,
+    to_date: datetime,
+    expand: bool,
+    filters: Optional[Dict[str, Any]],
+) -> Hashable:
+    return (
+        kind,
+        from_date,
+        to_date,
+        expand,
+        tuple(sorted((filters or {}).items())),
+    )
+
+
+def covering(
+    kind: str,
+    from_date: datetime,
+    to_date: datetime,
+    expand: bool,
+    filters: Optional[Dict[str, Any]],
+) -> Callable[[Hashable], bool]:
+    """Matches searches that returned everything a search would return.
+
+    Unfiltered results can stand in for filtered ones, since callers
+    check filters on the occurrences again.
+    """
+
+    wanted = search_key(kind, from_date, to_date, expand, filters)[4]
+
+    def match(key: Hashable) -> bool:
+        return (
+            key[0] == kind
+            and key[1] <= from_date
+            and to_date <= key[2]
+            and key[3] == expand
+            and key[4] in (wanted, ())
+        )
+
+    return match
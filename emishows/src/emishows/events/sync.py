@@ -0,0 +1,364 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from uuid import UUID, uuid4
+
+import icalendar
+from caldav.elements import dav
+from caldav.lib.error import DAVError
+from caldav.lib.url import URL
+from django.core.cache.backends.base import BaseCache
+
+from emishows.events.cache import SharedCounter
+from emishows.events.calendar import Calendar
+from emishows.events.errors import CalendarError
+from emishows.events.feed import RESET, Change
+from emishows.events.index import OccurrenceIndex, select
+from emishows.events.models import Event
+from emishows.metrics import CACHE_LOOKUPS
+from emishows.utils import utcnow
+
+logger = logging.getLogger(__name__)
+
+Window = Tuple[datetime, datetime]
+
+
+class CalendarMirror:
+    """Local copy of a calendar kept up to date with sync-collection.
+
+    Each sync pulls only the objects changed since the last sync token.
+    Occurrences over a rolling horizon are kept in a sorted index, so that
+    window queries inside the horizon need no network I/O. Listeners get
+    the changes found by each sync. Processes sharing a cache ``backend``
+    elect one of them to sync, the others load the objects it shares.
+    """
+
+    def __init__(
+        self,
+        calendar: Calendar,
+        past: timedelta = timedelta(days=7),
+        future: timedelta = timedelta(days=60),
+        interval: float = 30,
+        changes: Optional[SharedCounter] = None,
+        poll: float = 1,
+        backend: Optional[BaseCache] = None,
+    ) -> None:
+        self.calendar = calendar
+        self.past = past
+        self.future = future
+        self.interval = interval
+        self.changes = changes
+        # how often to look for writes while waiting for the next sync
+        self.poll = poll
+        self.backend = backend
+        # how long a process stays the one that syncs with the server
+        self.lease = max(3 * interval, 60)
+        self.listeners: List[Callable[[List[Change]], None]] = []
+        self.token: Optional[str] = None
+        self._seen: Optional[int] = None
+        self._member = uuid4().hex
+        self._following = False
+        self._data: Dict[str, str] = {}
+        self._objects: Dict[str, icalendar.Calendar] = {}
+        self._index: Optional[OccurrenceIndex] = None
+        self._span: Optional[Window] = None
+        self._dirty = threading.Event()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.RLock()
+        self._thread: Optional[threading.Thread] = None
+        calendar.listeners.append(self.notify)
+
+    @property
+    def ready(self) -> bool:
+        return self._index is not None
+
+    @property
+    def dirty(self) -> bool:
+        return self._dirty.is_set()
+
+    def notify(self, uid: UUID) -> None:
+        self._dirty.set()
+        self._wakeup.set()
+
+    def _check_changes(self) -> None:
+        # writes made by other processes are only visible in the counter
+        if self.changes is not None and self.changes.value() != self._seen:
+            self._dirty.set()
+
+    def _changes(self) -> Tuple[List[URL], List[URL], bool]:
+        """Returns changed and deleted objects and whether it started over."""
+
+        collection = self.calendar.calendar
+        reset = False
+        try:
+            objects = collection.objects_by_sync_token(self.token)
+        except DAVError:
+            if self.token is None:
+                raise
+            # token expired or unknown to the server, start over
+            logger.warning("Sync token rejected, doing full sync.")
+            self.token = None
+            reset = True
+            objects = collection.objects_by_sync_token(None)
+        self.token = objects.sync_token
+        changed, deleted = [], []
+        for obj in objects:
+            if obj.props.get(dav.GetEtag.tag) is None:
+                deleted.append(obj.url)
+            else:
+                changed.append(obj.url)
+        return changed, deleted, reset
+
+    def _key(self, name: str) -> str:
+        return f"mirror:{self.calendar.name}:{name}"
+
+    def _lead(self) -> bool:
+        """Returns whether this process should sync with the server.
+
+        Processes sharing a backend elect one of them with a lease, the
+        others follow the objects that it shares.
+        """
+
+        if self.backend is None:
+            return True
+        key = self._key("leader")
+        if self.backend.add(key, self._member, timeout=self.lease):
+            return True
+        if self.backend.get(key) == self._member:
+            self.backend.touch(key, timeout=self.lease)
+            return True
+        return False
+
+    def _share(self) -> None:
+        if self.backend is not None:
+            snapshot = (self.token, dict(self._data))
+            self.backend.set(self._key("objects"), snapshot, timeout=None)
+            # followers look at the token first, so it goes last
+            self.backend.set(self._key("token"), self.token, timeout=None)
+
+    def _fetch(self, urls: List[URL]) -> Dict[str, Optional[str]]:
+        if not urls:
+            return {}
+        objects = self.calendar.calendar.calendar_multiget(urls)
+        return {str(obj.url): obj.data for obj in objects}
+
+    def _horizon(self) -> Window:
+        now = utcnow()
+        return now - self.past, now + self.future
+
+    def _rebuild(self) -> None:
+        span = self._horizon()
+        objects = self._objects.values()
+        events = self.calendar._expand_calendars(objects, *span)
+        self._index = OccurrenceIndex(events)
+        self._span = span
+
+    @staticmethod
+    def _uid(obj: icalendar.Calendar) -> Optional[UUID]:
+        try:
+            return UUID(str(Calendar._retrieve_vevent(obj)["uid"]))
+        except (IndexError, KeyError, ValueError):
+            return None
+
+    def _diff(
+        self, previous: Dict[str, Optional[icalendar.Calendar]]
+    ) -> List[Change]:
+        changes = []
+        for url, old in previous.items():
+            new = self._objects.get(url)
+            if new is None and old is None:
+                continue
+            if old is None:
+                kind = "created"
+            elif new is None:
+                kind = "deleted"
+            else:
+                kind = "updated"
+            obj = old if new is None else new
+            uid = self._uid(obj)
+            if uid is None:
+                continue
+            occurrences = self.calendar._expand_calendars([obj], *self._span)
+            changes.append(Change(kind, uid, occurrences))
+        return changes
+
+    def _publish(self, changes: List[Change]) -> None:
+        for listener in self.listeners:
+            try:
+                listener(changes)
+            except Exception:
+                logger.exception("Calendar change listener failed.")
+
+    def _apply(
+        self, fetched: Dict[str, Optional[str]], deleted: List[str]
+    ) -> Dict[str, Optional[icalendar.Calendar]]:
+        """Stores changed objects and returns their previous versions."""
+
+        touched = deleted + list(fetched)
+        previous = {url: self._objects.get(url) for url in touched}
+        for url in deleted:
+            self._data.pop(url, None)
+            self._objects.pop(url, None)
+        for url, data in fetched.items():
+            obj = None
+            if data is not None:
+                try:
+                    obj = icalendar.Calendar.from_ical(data)
+                except ValueError:
+                    # one bad object shouldn't take the whole mirror down
+                    logger.warning("Skipping malformed object %s.", url)
+            if obj is None:
+                self._data.pop(url, None)
+                self._objects.pop(url, None)
+            else:
+                self._data[url] = data
+                self._objects[url] = obj
+        return previous
+
+    def _update(
+        self,
+        previous: Dict[str, Optional[icalendar.Calendar]],
+        modified: bool,
+        full: bool,
+        reset: bool = False,
+    ) -> None:
+        if modified or self._index is None:
+            self._rebuild()
+        # the first sync has nothing to compare with
+        if reset:
+            self._publish([RESET])
+        elif not full and previous:
+            self._publish(self._diff(previous))
+
+    def _pull(self) -> bool:
+        token, full = self.token, self.token is None
+        try:
+            changed, deleted, reset = self._changes()
+            fetched = self._fetch(changed)
+        except DAVError as e:
+            self._dirty.set()
+            raise CalendarError("Can't synchronize calendar.") from e
+        if full or reset:
+            self._data.clear()
+            self._objects.clear()
+        previous = self._apply(fetched, [str(url) for url in deleted])
+        modified = full or bool(changed or deleted)
+        if modified or self.token != token:
+            self._share()
+        self._update(previous, modified, full, reset)
+        return modified
+
+    def _follow(self) -> bool:
+        token = self.backend.get(self._key("token"))
+        if token is None or token == self.token:
+            return False
+        snapshot = self.backend.get(self._key("objects"))
+        if snapshot is None:
+            return False
+        token, data = snapshot
+        full = self.token is None
+        fetched = {
+            url: obj for url, obj in data.items() if self._data.get(url) != obj
+        }
+        deleted = [url for url in self._data if url not in data]
+        previous = self._apply(fetched, deleted)
+        self.token = token
+        modified = full or bool(fetched or deleted)
+        self._update(previous, modified, full)
+        return modified
+
+    def sync(self) -> bool:
+        """Pull changes from the server and update the index.
+
+        Processes that don't sync load the objects shared by the one that
+        does instead. Returns whether any objects changed.
+        """
+
+        with self._lock:
+            self._dirty.clear()
+            if self.changes is not None:
+                self._seen = self.changes.value()
+            self._following = not self._lead()
+            if self._following:
+                return self._follow()
+            return self._pull()
+
+    def roll(self) -> None:
+        """Move the horizon forward if it lags behind the clock."""
+
+        with self._lock:
+            if self._span is None:
+                return
+            if self._horizon()[0] - self._span[0] > timedelta(hours=1):
+                self._rebuild()
+
+    def covers(self, from_date: datetime, to_date: datetime) -> bool:
+        span = self._span
+        if span is None:
+            return False
+        return span[0] <= from_date and to_date <= span[1]
+
+    def search(
+        self,
+        from_date: datetime,
+        to_date: datetime,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> Optional[List[Event]]:
+        """Returns occurrences in the window or None if it can't answer."""
+
+        self._check_changes()
+        if self.dirty:
+            try:
+                self.sync()
+            except CalendarError:
+                CACHE_LOOKUPS.labels("mirror", "miss").inc()
+                return None
+        if not self.covers(from_date, to_date):
+            CACHE_LOOKUPS.labels("mirror", "miss").inc()
+            return None
+        CACHE_LOOKUPS.labels("mirror", "hit").inc()
+        return select(self._index.between(from_date, to_date), filters)
+
+    def _run(self) -> None:
+        synced, failed = None, False
+        while not self._stop.is_set():
+            self._wakeup.clear()
+            try:
+                self._check_changes()
+            except Exception:
+                # the shared cache is down, regular syncs still happen
+                pass
+            now = time.monotonic()
+            due = synced is None or now - synced >= self.interval
+            # following needs no requests to the server, so it's done often
+            due = due or self._following
+            # after a failure, wait for the next regular sync
+            if due or (self.dirty and not failed):
+                synced = now
+                try:
+                    self.sync()
+                    self.roll()
+                    failed = False
+                except Exception:
+                    logger.exception("Calendar synchronization failed.")
+                    failed = True
+            self._wakeup.wait(min(self.poll, self.interval))
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="calendar-mirror", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,65 @@
+"""ASGI handler that streams responses built by synchronous code.
+
+Django 4.0 iterates streamed content in the event loop, where content
+that queries the database raises SynchronousOnlyOperation. This handler
+iterates it in the thread the view ran in instead.
+
+"""
+
+from typing import Iterator, List, Optional
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+
+
+def _read(parts: Iterator[bytes], size: int) -> Optional[bytes]:
+    """Returns at least ``size`` bytes unless parts run out first."""
+
+    chunks: List[bytes] = []
+    length = 0
+    for part in parts:
+        chunks.append(part)
+        length += len(part)
+        if length >= size:
+            break
+    if not chunks:
+        return None
+    return b"".join(chunks)
+
+
+class StreamingASGIHandler(ASGIHandler):
+    async def send_response(self, response, send):
+        if not response.streaming:
+            await super().send_response(response, send)
+            return
+        headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode("ascii")
+            if isinstance(value, str):
+                value = value.encode("latin1")
+            headers.append((bytes(header), bytes(value)))
+        for cookie in response.cookies.values():
+            headers.append(
+                (
+                    b"Set-Cookie",
+                    cookie.output(header="").encode("ascii").strip(),
+                )
+            )
+        await send(
+            {
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": headers,
+            }
+        )
+        # parts are read a chunk at a time, so the thread is not switched
+        # for every small part
+        parts = iter(response)
+        read = sync_to_async(_read, thread_sensitive=True)
+        while (body := await read(parts, self.chunk_size)) is not None:
+            await send(
+                {"type": "http.response.body", "body": body, "more_body": True}
+            )
+        await send({"type": "http.response.body"})
+        await sync_to_async(response.close, thread_sensitive=True)()
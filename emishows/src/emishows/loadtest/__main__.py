@@ -0,0 +1,93 @@
+"""Load test entrypoint.
+
+Runs the app against a fake calendar server in this process and writes
+a JSON report with throughput and latency percentiles per endpoint.
+
+"""
+
+import json
+import os
+from pathlib import Path
+
+import django
+import typer
+
+cli = typer.Typer()
+
+
+@cli.command()
+def main(
+    duration: float = typer.Option(
+        default=10, min=0.1, help="Seconds of measured traffic"
+    ),
+    warmup: float = typer.Option(
+        default=2, min=0, help="Seconds of traffic before measuring"
+    ),
+    concurrency: int = typer.Option(
+        default=16, min=1, help="Number of concurrent clients"
+    ),
+    mix: str = typer.Option(
+        default="timetable=5,events=2,event=2,shows=2,ics=1",
+        help="Weights of endpoints: timetable, events, event, shows, ics",
+    ),
+    events: int = typer.Option(
+        default=300, min=1, help="Number of events in the calendar"
+    ),
+    shows: int = typer.Option(default=20, min=1, help="Number of shows"),
+    days: int = typer.Option(
+        default=7, min=1, help="Number of days the events are spread over"
+    ),
+    latency: float = typer.Option(
+        default=0.02, min=0, help="Seconds the calendar server takes to reply"
+    ),
+    jitter: float = typer.Option(
+        default=0.5, min=0, max=1, help="Relative variation of the latency"
+    ),
+    seed: int = typer.Option(default=0, help="Seed of the traffic pattern"),
+    output: Path = typer.Option(
+        default="loadtest.json", help="File to write the report to"
+    ),
+):
+    """Measure the API under load against a fake calendar server.
+
+    The database is a local SQLite file, see EMISHOWS_LOADTEST_DB,
+    unless DJANGO_SETTINGS_MODULE points elsewhere.
+    """
+    os.environ.setdefault(
+        "DJANGO_SETTINGS_MODULE", "emishows.loadtest.settings"
+    )
+    django.setup()
+    from django.conf import settings
+
+    from emishows.loadtest.runner import Options, run, summary
+    from emishows.loadtest.traffic import parse_mix
+
+    try:
+        weights = parse_mix(mix)
+    except ValueError as e:
+        raise typer.BadParameter(str(e), param_hint="--mix") from e
+    database = settings.DATABASES["default"]
+    if database["ENGINE"].endswith("sqlite3"):
+        Path(database["NAME"]).parent.mkdir(parents=True, exist_ok=True)
+
+    report = run(
+        Options(
+            duration=duration,
+            warmup=warmup,
+            concurrency=concurrency,
+            mix=weights,
+            events=events,
+            shows=shows,
+            days=days,
+            latency=latency,
+            jitter=jitter,
+            seed=seed,
+        )
+    )
+    output.write_text(json.dumps(report, indent=2))
+    typer.echo(summary(report))
+    typer.echo(f"Report saved to {output}.")
+
+
+if __name__ == "__main__":
+    cli()
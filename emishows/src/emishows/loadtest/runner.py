@@ -0,0 +1,232 @@
+"""Runs the whole app against a fake calendar server and drives traffic.
+
+Django must be set up before this module is imported. The database is
+the default one of the current settings, migrated and filled with shows
+and events that are stored in the fake calendar too.
+
+"""
+
+import asyncio
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterator, NamedTuple
+from uuid import uuid4
+
+import uvicorn
+from django.core.management import call_command
+
+from emishows.app.models import Event, Show
+from emishows.app.occurrences import materializers
+from emishows.config import config
+from emishows.events import Calendar, async_calendars, calendars
+from emishows.events import Event as CalendarEvent
+from emishows.events import feeds, ics_caches, mirrors
+from emishows.loadtest.server import FakeCalDAV, FakeCalDAVServer
+from emishows.loadtest.traffic import DEFAULT_MIX, Seeded, drive
+
+# registries filled by setting up a worker
+REGISTRIES = (
+    calendars,
+    async_calendars,
+    mirrors,
+    ics_caches,
+    feeds,
+    materializers,
+)
+
+# prefix of labels of the shows created by load tests
+LABEL = "loadtest-"
+
+RULES = [None, {"freq": "daily"}, {"freq": "weekly", "byday": ["MO", "TH"]}]
+
+
+class Options(NamedTuple):
+    duration: float = 10
+    warmup: float = 2
+    concurrency: int = 16
+    mix: Dict[str, float] = DEFAULT_MIX
+    events: int = 300
+    shows: int = 20
+    days: int = 7
+    latency: float = 0.02
+    jitter: float = 0.5
+    seed: int = 0
+
+
+def seed(caldav: FakeCalDAV, options: Options) -> Seeded:
+    """Stores shows and events, a third of them single, the rest series.
+
+    Events are spread over ``days`` days from the start of today. Data
+    left by earlier load tests is removed first.
+    """
+
+    clean()
+    start = datetime.now(timezone.utc).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    shows = Show.objects.bulk_create(
+        Show(label=f"{LABEL}{uuid4().hex}", title=f"Show {i}")
+        for i in range(options.shows)
+    )
+    events = []
+    hours = options.days * 24
+    for i in range(options.events):
+        show = shows[i % len(shows)]
+        event = Event(id=uuid4(), show=show, type=Event.Type.LIVE)
+        begin = start + timedelta(hours=i % hours)
+        caldav.add(
+            Calendar._encode(
+                CalendarEvent(
+                    uid=event.id,
+                    start=begin,
+                    end=begin + timedelta(hours=1),
+                    rules=RULES[i % len(RULES)],
+                    show=show.id,
+                    type=event.type,
+                )
+            )
+        )
+        events.append(event)
+    Event.objects.bulk_create(events)
+    return Seeded(
+        start,
+        options.days,
+        [show.id for show in shows],
+        [event.id for event in events],
+    )
+
+
+def clean() -> None:
+    """Removes shows and events created by load tests."""
+
+    Show.objects.filter(label__startswith=LABEL).delete()
+
+
+@contextmanager
+def connected(caldav: FakeCalDAVServer, store: Path) -> Iterator[None]:
+    """Sets up the process like a worker talking to the fake server.
+
+    Background workers are stopped and the clients dropped afterwards.
+    """
+
+    from emishows.__main__ import setup
+
+    settings = {
+        "emitimes_host": caldav.host,
+        "emitimes_port": caldav.port,
+        "emitimes_calendar": caldav.app.name,
+        "emitimes_url_store": str(store),
+    }
+    previous = {key: getattr(config, key) for key in settings}
+    for key, value in settings.items():
+        setattr(config, key, value)
+    try:
+        setup()
+        yield
+    finally:
+        for worker in (*mirrors.values(), *materializers.values()):
+            worker.stop()
+        for calendar in calendars.values():
+            calendar.close()
+        for registry in REGISTRIES:
+            registry.clear()
+        for key, value in previous.items():
+            setattr(config, key, value)
+
+
+class AppServer:
+    """Serves an ASGI app with uvicorn in a background thread."""
+
+    def __init__(self, app, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.server = uvicorn.Server(
+            uvicorn.Config(
+                app,
+                host=host,
+                port=port,
+                lifespan="off",
+                log_level="warning",
+                access_log=False,
+            )
+        )
+        self._thread = threading.Thread(
+            target=self.server.run, name="uvicorn", daemon=True
+        )
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.servers[0].sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "AppServer":
+        self._thread.start()
+        while not self.server.started:
+            if not self._thread.is_alive():
+                raise RuntimeError("Server failed to start.")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.server.should_exit = True
+        self._thread.join()
+
+
+def run(options: Options = Options(), migrate: bool = True) -> dict:
+    """Runs a load test and returns its report."""
+
+    from emishows.asgi import app
+
+    if migrate:
+        call_command("migrate", "--no-input", verbosity=0)
+    with tempfile.TemporaryDirectory() as directory, FakeCalDAVServer(
+        latency=options.latency, jitter=options.jitter
+    ) as caldav:
+        seeded = seed(caldav.app, options)
+        store = Path(directory) / "calendars.json"
+        try:
+            with connected(caldav, store), AppServer(app) as server:
+                report = asyncio.run(
+                    drive(
+                        server.url,
+                        seeded,
+                        options.duration,
+                        options.concurrency,
+                        options.mix,
+                        options.warmup,
+                        options.seed,
+                    )
+                )
+        finally:
+            clean()
+        report["calendar"] = {
+            "events": options.events,
+            "shows": options.shows,
+            "days": options.days,
+            "latency": options.latency,
+            "jitter": options.jitter,
+            "requests": caldav.app.requests,
+        }
+    return report
+
+
+def summary(report: dict) -> str:
+    """Returns a table of the report for people to read."""
+
+    lines = [
+        f"{'endpoint':<12}{'req/s':>9}{'errors':>8}"
+        f"{'p50':>9}{'p95':>9}{'p99':>9}  (ms)"
+    ]
+    rows = {**report["endpoints"], "total": report["total"]}
+    for name, stats in rows.items():
+        latency = stats.get("latency_ms", {})
+        lines.append(
+            f"{name:<12}{stats['throughput']:>9.1f}{stats['errors']:>8}"
+            + "".join(
+                f"{latency.get(q, float('nan')):>9.1f}"
+                for q in ("p50", "p95", "p99")
+            )
+        )
+    return "\n".join(lines)
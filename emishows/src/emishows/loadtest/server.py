@@ -0,0 +1,411 @@
+"""Fake CalDAV server for load tests.
+
+Serves a single calendar from memory, answering just the requests that
+the calendar clients send, with a configurable delay. Series are never
+expanded by the server and time ranges only skip single events that
+end before or start after them, which is all the clients rely on.
+
+"""
+
+import hashlib
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from socketserver import ThreadingMixIn
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+from urllib.parse import urljoin, urlparse
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import icalendar
+from caldav.elements import cdav, dav
+from lxml import etree
+
+from emishows.events.dav import GetCTag
+
+PRINCIPAL = "/user/"
+
+Response = Callable[[str, List], None]
+
+
+class StoredEvent(NamedTuple):
+    uid: str
+    etag: str
+    data: bytes
+    start: datetime
+    end: datetime
+    recurring: bool
+    properties: Dict[str, str]
+
+    @classmethod
+    def parse(cls, data: bytes) -> "StoredEvent":
+        vevent = icalendar.Calendar.from_ical(data).walk("vevent")[0]
+        start = _utc(vevent.decoded("dtstart"))
+        end = _utc(vevent.decoded("dtend", start))
+        properties = {
+            key: str(value)
+            for key, value in vevent.items()
+            if key.startswith("X-")
+        }
+        etag = f'"{hashlib.sha1(data).hexdigest()}"'
+        return cls(
+            str(vevent["UID"]),
+            etag,
+            data,
+            start,
+            end,
+            "RRULE" in vevent,
+            properties,
+        )
+
+    def matches(
+        self,
+        start: Optional[datetime],
+        end: Optional[datetime],
+        properties: Dict[str, str],
+    ) -> bool:
+        if end is not None and self.start >= end:
+            return False
+        if start is not None and not self.recurring and self.end <= start:
+            return False
+        return all(
+            text in self.properties.get(name, "")
+            for name, text in properties.items()
+        )
+
+
+def _utc(dt: datetime) -> datetime:
+    if not isinstance(dt, datetime):
+        dt = datetime(dt.year, dt.month, dt.day)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    if value is None:
+        return None
+    return datetime.strptime(value, "%Y%m%dT%H%M%SZ").replace(
+        tzinfo=timezone.utc
+    )
+
+
+def _multistatus(responses: Iterable[etree._Element]) -> bytes:
+    root = etree.Element(dav.MultiStatus.tag, nsmap={"D": "DAV:"})
+    root.extend(responses)
+    return etree.tostring(root, xml_declaration=True, encoding="utf-8")
+
+
+def _response(
+    href: str,
+    props: Optional[Dict[str, Optional[str]]] = None,
+    status: str = "200 OK",
+) -> etree._Element:
+    response = etree.Element(dav.Response.tag)
+    etree.SubElement(response, dav.Href.tag).text = href
+    if props is None:
+        etree.SubElement(response, dav.Status.tag).text = f"HTTP/1.1 {status}"
+        return response
+    propstat = etree.SubElement(response, dav.PropStat.tag)
+    prop = etree.SubElement(propstat, dav.Prop.tag)
+    for tag, value in props.items():
+        element = etree.SubElement(prop, tag)
+        if tag in (dav.CurrentUserPrincipal.tag, cdav.CalendarHomeSet.tag):
+            etree.SubElement(element, dav.Href.tag).text = value
+        else:
+            element.text = value
+    etree.SubElement(propstat, dav.Status.tag).text = f"HTTP/1.1 {status}"
+    return response
+
+
+class FakeCalDAV:
+    """WSGI app serving one calendar with a delay before each response.
+
+    ``latency`` is the delay in seconds, varied by up to ``jitter``
+    times itself in either direction.
+    """
+
+    def __init__(
+        self, name: str, latency: float = 0.0, jitter: float = 0.0
+    ) -> None:
+        self.name = name
+        self.latency = latency
+        self.jitter = jitter
+        self.path = urljoin(PRINCIPAL, f"{name}/")
+        self.events: Dict[str, StoredEvent] = {}
+        # version of the calendar when each object last changed
+        self.changed: Dict[str, int] = {}
+        self.requests = 0
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def _delay(self) -> None:
+        delay = self.latency
+        if self.jitter:
+            delay *= 1 + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def __call__(self, environ: dict, start_response: Response):
+        with self._lock:
+            self.requests += 1
+        self._delay()
+        method = environ["REQUEST_METHOD"]
+        path = environ.get("PATH_INFO") or "/"
+        length = int(environ.get("CONTENT_LENGTH") or 0)
+        body = environ["wsgi.input"].read(length) if length else b""
+        handler = getattr(self, f"_{method.lower()}", None)
+        if handler is None:
+            return self._reply(start_response, "405 Method Not Allowed")
+        return handler(environ, start_response, path, body)
+
+    @staticmethod
+    def _reply(
+        start_response: Response,
+        status: str,
+        body: bytes = b"",
+        content_type: str = "text/plain",
+        headers: Optional[List] = None,
+    ):
+        start_response(
+            status,
+            [
+                ("Content-Type", content_type),
+                ("Content-Length", str(len(body))),
+                *(headers or []),
+            ],
+        )
+        return [body]
+
+    def _xml(self, start_response: Response, body: bytes):
+        return self._reply(
+            start_response,
+            "207 Multi-Status",
+            body,
+            "application/xml; charset=utf-8",
+        )
+
+    def _uid(self, path: str) -> Optional[str]:
+        if path.startswith(self.path) and path.endswith(".ics"):
+            return path[len(self.path) : -len(".ics")]
+        return None
+
+    def _propfind(self, environ, start_response, path, body):
+        values = {
+            dav.CurrentUserPrincipal.tag: PRINCIPAL,
+            cdav.CalendarHomeSet.tag: PRINCIPAL,
+            GetCTag.tag: f"ctag-{self._version}",
+            dav.SyncToken.tag: f"sync-{self._version}",
+        }
+        requested = [
+            element.tag
+            for element in etree.fromstring(body).iter()
+            if element.tag in values
+        ]
+        props = {tag: values[tag] for tag in requested}
+        return self._xml(
+            start_response, _multistatus([_response(path, props)])
+        )
+
+    def _calendar_data(self, uid: str) -> etree._Element:
+        event = self.events.get(uid)
+        href = f"{self.path}{uid}.ics"
+        if event is None:
+            return _response(href, status="404 Not Found")
+        return _response(
+            href,
+            {
+                dav.GetEtag.tag: event.etag,
+                cdav.CalendarData.tag: event.data.decode(),
+            },
+        )
+
+    def _sync(self, start_response, token: Optional[str]):
+        since = 0
+        if token:
+            try:
+                since = int(token.rpartition("-")[2])
+            except ValueError:
+                return self._reply(start_response, "403 Forbidden")
+        with self._lock:
+            version = self._version
+            changed = [
+                uid for uid, changed in self.changed.items() if changed > since
+            ]
+            events = dict(self.events)
+        responses = []
+        for uid in changed:
+            href = f"{self.path}{uid}.ics"
+            event = events.get(uid)
+            if event is not None:
+                responses.append(
+                    _response(href, {dav.GetEtag.tag: event.etag})
+                )
+            elif since:
+                responses.append(_response(href, status="404 Not Found"))
+        root = etree.fromstring(_multistatus(responses))
+        etree.SubElement(root, dav.SyncToken.tag).text = f"sync-{version}"
+        return self._xml(start_response, etree.tostring(root))
+
+    def _report(self, environ, start_response, path, body):
+        if path != self.path:
+            return self._reply(start_response, "404 Not Found")
+        query = etree.fromstring(body)
+        if query.tag == dav.SyncCollection.tag:
+            return self._sync(
+                start_response, query.findtext(dav.SyncToken.tag)
+            )
+        if query.tag == cdav.CalendarMultiGet.tag:
+            uids = [
+                self._uid(urlparse(href.text).path)
+                for href in query.iter(dav.Href.tag)
+            ]
+        else:
+            time_range = query.find(f".//{cdav.TimeRange.tag}")
+            start = end = None
+            if time_range is not None:
+                start = _parse_time(time_range.get("start"))
+                end = _parse_time(time_range.get("end"))
+            properties = {
+                prop.get("name"): prop.findtext(cdav.TextMatch.tag) or ""
+                for prop in query.iter(cdav.PropFilter.tag)
+            }
+            events = list(self.events.items())
+            uids = [
+                uid
+                for uid, event in events
+                if event.matches(start, end, properties)
+            ]
+        responses = [self._calendar_data(uid) for uid in uids if uid]
+        return self._xml(start_response, _multistatus(responses))
+
+    def _get(self, environ, start_response, path, body):
+        if path == self.path:
+            return self._reply(
+                start_response,
+                "200 OK",
+                self.ics(),
+                "text/calendar; charset=utf-8",
+            )
+        event = self.events.get(self._uid(path) or "")
+        if event is None:
+            return self._reply(start_response, "404 Not Found")
+        return self._reply(
+            start_response,
+            "200 OK",
+            event.data,
+            "text/calendar; charset=utf-8",
+            [("ETag", event.etag)],
+        )
+
+    def _put(self, environ, start_response, path, body):
+        uid = self._uid(path)
+        if uid is None:
+            return self._reply(start_response, "403 Forbidden")
+        try:
+            event = StoredEvent.parse(body)
+        except (ValueError, IndexError, KeyError):
+            return self._reply(start_response, "400 Bad Request")
+        with self._lock:
+            current = self.events.get(uid)
+            if environ.get("HTTP_IF_NONE_MATCH") == "*" and current:
+                return self._reply(start_response, "412 Precondition Failed")
+            etag = environ.get("HTTP_IF_MATCH")
+            if etag and (current is None or etag not in ("*", current.etag)):
+                return self._reply(start_response, "412 Precondition Failed")
+            self.events[uid] = event
+            self._version += 1
+            self.changed[uid] = self._version
+        status = "204 No Content" if current else "201 Created"
+        return self._reply(
+            start_response, status, headers=[("ETag", event.etag)]
+        )
+
+    def _delete(self, environ, start_response, path, body):
+        uid = self._uid(path) or ""
+        with self._lock:
+            current = self.events.get(uid)
+            if current is None:
+                return self._reply(start_response, "404 Not Found")
+            etag = environ.get("HTTP_IF_MATCH")
+            if etag and etag not in ("*", current.etag):
+                return self._reply(start_response, "412 Precondition Failed")
+            del self.events[uid]
+            self._version += 1
+            self.changed[uid] = self._version
+        return self._reply(start_response, "204 No Content")
+
+    def add(self, data: bytes) -> None:
+        """Stores an event without a request, e.g. to fill the calendar."""
+
+        event = StoredEvent.parse(data)
+        with self._lock:
+            self.events[event.uid] = event
+            self._version += 1
+            self.changed[event.uid] = self._version
+
+    def ics(self) -> bytes:
+        """Returns all events as a single iCalendar object."""
+
+        calendar = icalendar.Calendar()
+        calendar.add("prodid", "-//emishows//loadtest//EN")
+        calendar.add("version", "2.0")
+        for event in list(self.events.values()):
+            for component in icalendar.Calendar.from_ical(event.data).walk(
+                "vevent"
+            ):
+                calendar.add_component(component)
+        return calendar.to_ical()
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeCalDAVServer:
+    """Runs FakeCalDAV on a local port in a background thread."""
+
+    def __init__(
+        self,
+        name: str = "emitimes",
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        self.app = FakeCalDAV(name, latency, jitter)
+        self._server = make_server(
+            host,
+            port,
+            self.app,
+            server_class=_ThreadingWSGIServer,
+            handler_class=_QuietHandler,
+        )
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="caldav", daemon=True
+        )
+
+    @property
+    def host(self) -> str:
+        return self._server.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self._server.server_port
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def __enter__(self) -> "FakeCalDAVServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.shutdown()
+        self._server.server_close()
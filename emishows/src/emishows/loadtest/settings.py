@@ -0,0 +1,16 @@
+"""Settings for load tests, with a local SQLite database."""
+
+import os
+import tempfile
+
+from emishows.settings import *  # noqa: F401,F403
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.getenv(
+            "EMISHOWS_LOADTEST_DB",
+            os.path.join(tempfile.gettempdir(), "emishows", "loadtest.db"),
+        ),
+    }
+}
@@ -0,0 +1,179 @@
+"""Mixed read traffic against a running server and its latency report."""
+
+import asyncio
+import math
+import random
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, NamedTuple, Sequence
+from uuid import UUID
+
+import httpx
+
+
+class Seeded(NamedTuple):
+    """What was stored before the test, so requests can refer to it."""
+
+    start: datetime
+    days: int
+    shows: List[int]
+    events: List[UUID]
+
+
+def _timetable(rng: random.Random, seeded: Seeded) -> str:
+    # clients ask for whole days, so many ask for the same window
+    start = seeded.start + timedelta(days=rng.randrange(seeded.days))
+    end = start + timedelta(days=1)
+    return "/timetable/?from={}&to={}".format(
+        *(dt.replace(tzinfo=None).isoformat() for dt in (start, end))
+    )
+
+
+def _events(rng: random.Random, seeded: Seeded) -> str:
+    return "/events/"
+
+
+def _event(rng: random.Random, seeded: Seeded) -> str:
+    return f"/events/{rng.choice(seeded.events)}/"
+
+
+def _shows(rng: random.Random, seeded: Seeded) -> str:
+    if rng.random() < 0.5:
+        return "/shows/"
+    return f"/shows/{rng.choice(seeded.shows)}/"
+
+
+def _ics(rng: random.Random, seeded: Seeded) -> str:
+    return "/ics"
+
+
+ENDPOINTS: Dict[str, Callable[[random.Random, Seeded], str]] = {
+    "timetable": _timetable,
+    "events": _events,
+    "event": _event,
+    "shows": _shows,
+    "ics": _ics,
+}
+
+DEFAULT_MIX: Dict[str, float] = {
+    "timetable": 5,
+    "events": 2,
+    "event": 2,
+    "shows": 2,
+    "ics": 1,
+}
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """Parses weights like "timetable=5,ics=1"."""
+
+    mix = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, weight = item.partition("=")
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint: {name}.")
+        mix[name] = float(weight or 1)
+    if not mix or not any(mix.values()):
+        raise ValueError("Mix must give some endpoint a weight.")
+    return mix
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Returns the nearest-rank percentile of sorted values."""
+
+    index = max(math.ceil(q / 100 * len(values)) - 1, 0)
+    return values[index]
+
+
+class Sample(NamedTuple):
+    endpoint: str
+    status: int
+    latency: float
+
+
+def summarize(samples: List[Sample], duration: float) -> dict:
+    """Returns throughput and latency in milliseconds per endpoint."""
+
+    by_endpoint: Dict[str, List[Sample]] = defaultdict(list)
+    for sample in samples:
+        by_endpoint[sample.endpoint].append(sample)
+
+    def stats(samples: List[Sample]) -> dict:
+        latencies = sorted(sample.latency * 1000 for sample in samples)
+        errors = sum(1 for sample in samples if sample.status >= 400)
+        out = {
+            "requests": len(samples),
+            "errors": errors,
+            "throughput": len(samples) / duration if duration else 0.0,
+        }
+        if latencies:
+            out["latency_ms"] = {
+                "mean": sum(latencies) / len(latencies),
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99),
+                "max": latencies[-1],
+            }
+        return out
+
+    return {
+        "total": stats(samples),
+        "endpoints": {
+            name: stats(by_endpoint[name]) for name in sorted(by_endpoint)
+        },
+    }
+
+
+async def drive(
+    url: str,
+    seeded: Seeded,
+    duration: float,
+    concurrency: int,
+    mix: Dict[str, float] = DEFAULT_MIX,
+    warmup: float = 0.0,
+    seed: int = 0,
+    timeout: float = 30.0,
+) -> dict:
+    """Sends requests from ``concurrency`` clients for ``duration`` seconds.
+
+    Requests sent during the first ``warmup`` seconds aren't reported.
+    Failed connections are reported with status 0.
+    """
+
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    samples: List[Sample] = []
+    limits = httpx.Limits(max_connections=concurrency)
+    started = time.perf_counter()
+    measured = started + warmup
+    deadline = measured + duration
+
+    async def client(rng: random.Random) -> None:
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            path = ENDPOINTS[name](rng, seeded)
+            sent = time.perf_counter()
+            try:
+                response = await http.get(path)
+                status = response.status_code
+            except httpx.HTTPError:
+                status = 0
+            if sent >= measured:
+                samples.append(
+                    Sample(name, status, time.perf_counter() - sent)
+                )
+
+    async with httpx.AsyncClient(
+        base_url=url, limits=limits, timeout=timeout
+    ) as http:
+        await asyncio.gather(
+            *(client(random.Random(seed + i)) for i in range(concurrency))
+        )
+    elapsed = time.perf_counter() - measured
+    return {
+        "duration": elapsed,
+        "concurrency": concurrency,
+        "mix": mix,
+        **summarize(samples, elapsed),
+    }
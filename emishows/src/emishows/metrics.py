@@ -0,0 +1,286 @@
+"""Prometheus metrics and per-request timings.
+
+Every timed step is observed in a histogram and, while a request is being
+handled, also added to that request's timings, which are reported in the
+Server-Timing header.
+
+"""
+
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+from prometheus_client import Counter, Histogram
+
+REQUEST_DURATION = Histogram(
+    "emishows_request_duration_seconds",
+    "Time spent handling API requests.",
+    ["method", "route", "status"],
+)
+CALDAV_REQUESTS = Counter(
+    "emishows_caldav_requests_total",
+    "Requests sent to the CalDAV server.",
+    ["method", "status"],
+)
+CALDAV_DURATION = Histogram(
+    "emishows_caldav_request_duration_seconds",
+    "Time until CalDAV response headers are received.",
+    ["method"],
+)
+CALENDAR_DURATION = Histogram(
+    "emishows_calendar_call_duration_seconds",
+    "Time spent in calendar methods.",
+    ["method"],
+)
+CACHE_LOOKUPS = Counter(
+    "emishows_cache_lookups_total",
+    "Lookups of expanded occurrences in local caches.",
+    ["cache", "result"],
+)
+OCCURRENCES_EXPANDED = Counter(
+    "emishows_occurrences_expanded_total",
+    "Occurrences produced by recurrence expansion.",
+)
+EXPANSION_DURATION = Histogram(
+    "emishows_expansion_duration_seconds",
+    "Time spent expanding recurrences.",
+)
+DB_DURATION = Histogram(
+    "emishows_db_query_duration_seconds",
+    "Time spent executing database queries.",
+)
+SERIALIZATION_DURATION = Histogram(
+    "emishows_serialization_duration_seconds",
+    "Time spent serializing and rendering API data.",
+    ["step"],
+)
+
+
+class Timings:
+    """Accumulated durations of named steps within one request."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self._steps: Dict[str, List[float]] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        step = self._steps.setdefault(name, [0.0, 0])
+        step[0] += seconds
+        step[1] += 1
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def items(self) -> List[Tuple[str, float, int]]:
+        return [(name, total, n) for name, (total, n) in self._steps.items()]
+
+    def header(self) -> str:
+        """Formats the timings as a Server-Timing header value."""
+
+        metrics = [
+            f'{name};dur={total * 1000:.3f};desc="{n}x"'
+            for name, total, n in self.items()
+        ]
+        metrics.append(f"total;dur={self.elapsed() * 1000:.3f}")
+        return ", ".join(metrics)
+
+
+_timings: ContextVar[Optional[Timings]] = ContextVar("timings", default=None)
+
+
+def start_timings() -> Timings:
+    timings = Timings()
+    _timings.set(timings)
+    return timings
+
+
+def stop_timings() -> Optional[Timings]:
+    timings = _timings.get()
+    _timings.set(None)
+    return timings
+
+
+def record(name: str, seconds: float, histogram) -> None:
+    histogram.observe(seconds)
+    timings = _timings.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+@contextmanager
+def timer(name: str, histogram) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start, histogram)
+
+
+def timed(name: str) -> Callable:
+    """Times calls of a calendar method, sync or async."""
+
+    histogram = CALENDAR_DURATION.labels(name)
+    step = f"calendar.{name}"
+
+    def decorator(function: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(function):
+
+            @wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with timer(step, histogram):
+                    return await function(*args, **kwargs)
+
+            return async_wrapper
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with timer(step, histogram):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class TimedIterator:
+    """Iterator that adds the time spent producing items to a step.
+
+    The step is recorded once, when the iterator is exhausted, fails or
+    is dropped, so lazy calls are timed by all the work that they do.
+    """
+
+    def __init__(
+        self,
+        iterator: Iterator[Any],
+        name: str,
+        histogram,
+        elapsed: float = 0.0,
+    ) -> None:
+        self.iterator = iterator
+        self.name = name
+        self.histogram = histogram
+        self.elapsed = elapsed
+        self._recorded = False
+
+    def __iter__(self) -> "TimedIterator":
+        return self
+
+    def __next__(self) -> Any:
+        start = time.perf_counter()
+        try:
+            item = next(self.iterator)
+        except BaseException:
+            self.elapsed += time.perf_counter() - start
+            self.close()
+            raise
+        self.elapsed += time.perf_counter() - start
+        return item
+
+    def close(self) -> None:
+        if not self._recorded:
+            self._recorded = True
+            record(self.name, self.elapsed, self.histogram)
+
+    def __del__(self) -> None:
+        self.close()
+
+
+def timed_iter(name: str) -> Callable:
+    """Times calls of a calendar method that returns a lazy iterator.
+
+    Time spent consuming the iterator is added to the call, so the step
+    is recorded only when the iterator is done, e.g. after a streamed
+    response was sent.
+    """
+
+    histogram = CALENDAR_DURATION.labels(name)
+    step = f"calendar.{name}"
+
+    def decorator(function: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(function):
+
+            @wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    iterator = await function(*args, **kwargs)
+                except BaseException:
+                    record(step, time.perf_counter() - start, histogram)
+                    raise
+                elapsed = time.perf_counter() - start
+                return TimedIterator(iterator, step, histogram, elapsed)
+
+            return async_wrapper
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                iterator = function(*args, **kwargs)
+            except BaseException:
+                record(step, time.perf_counter() - start, histogram)
+                raise
+            elapsed = time.perf_counter() - start
+            return TimedIterator(iterator, step, histogram, elapsed)
+
+        return wrapper
+
+    return decorator
+
+
+def time_query(execute, sql, params, many, context):
+    """Database execute wrapper that times every query."""
+
+    with timer("db", DB_DURATION):
+        return execute(sql, params, many, context)
+
+
+def _record_caldav(
+    request: httpx.Request, status: Optional[int], seconds: float
+) -> None:
+    record("caldav", seconds, CALDAV_DURATION.labels(request.method))
+    CALDAV_REQUESTS.labels(request.method, status or "error").inc()
+
+
+class InstrumentedTransport(httpx.BaseTransport):
+    """Transport that measures requests sent through another one."""
+
+    def __init__(self, transport: httpx.BaseTransport) -> None:
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        start, status = time.perf_counter(), None
+        try:
+            response = self.transport.handle_request(request)
+            status = response.status_code
+            return response
+        finally:
+            _record_caldav(request, status, time.perf_counter() - start)
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class AsyncInstrumentedTransport(httpx.AsyncBaseTransport):
+    """Async counterpart of InstrumentedTransport."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport) -> None:
+        self.transport = transport
+
+    async def handle_async_request(
+        self, request: httpx.Request
+    ) -> httpx.Response:
+        start, status = time.perf_counter(), None
+        try:
+            response = await self.transport.handle_async_request(request)
+            status = response.status_code
+            return response
+        finally:
+            _record_caldav(request, status, time.perf_counter() - start)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
@@ -0,0 +1,112 @@
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from emishows import metrics
+from emishows.compression import compress, compress_sequence, negotiate
+from emishows.events import resilience
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """Compress content with the best encoding accepted by the client.
+
+    Works like Django's GZipMiddleware, but also offers zstd and brotli.
+    Responses that already have a Content-Encoding are left untouched,
+    so views can serve pre-compressed content.
+    """
+
+    min_length = 200
+
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < self.min_length:
+            return response
+
+        if response.has_header("Content-Encoding"):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+        encoding = negotiate(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compress_sequence(
+                response.streaming_content, encoding
+            )
+            del response.headers["Content-Length"]
+        else:
+            compressed_content = compress(response.content, encoding)
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response.headers["Content-Length"] = str(len(response.content))
+
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = encoding
+
+        return response
+
+
+class ServerTimingMiddleware(MiddlewareMixin):
+    """Time requests and report the breakdown in a Server-Timing header.
+
+    Streaming responses only report steps finished before the response
+    was returned; the rest still goes to the metrics.
+    """
+
+    def process_request(self, request):
+        metrics.start_timings()
+
+    def process_response(self, request, response):
+        timings = metrics.stop_timings()
+        if timings is None:
+            return response
+        match = request.resolver_match
+        route = match.route if match is not None else "unmatched"
+        metrics.REQUEST_DURATION.labels(
+            request.method, route, response.status_code
+        ).observe(timings.elapsed())
+        response.headers["Server-Timing"] = timings.header()
+        return response
+
+
+class StaleMiddleware(MiddlewareMixin):
+    """Flag responses built from stale calendar data.
+
+    The X-Calendar-Stale header holds the age of the oldest data used,
+    in seconds.
+    """
+
+    def process_request(self, request):
+        resilience.reset_stale()
+
+    def process_response(self, request, response):
+        age = resilience.stale_age()
+        if age is not None:
+            response.headers["X-Calendar-Stale"] = str(int(age))
+        return response
+
+
+class StaticFilesMiddleware(MiddlewareMixin):
+    """Serve static files with WhiteNoise.
+
+    WhiteNoise's own middleware is synchronous only, and Django runs
+    async views behind such a middleware in a thread, so it's used from
+    a middleware that supports both here.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.whitenoise = WhiteNoiseMiddleware(get_response)
+
+    def process_request(self, request):
+        whitenoise = self.whitenoise
+        if whitenoise.autorefresh:
+            static_file = whitenoise.find_file(request.path_info)
+        else:
+            static_file = whitenoise.files.get(request.path_info)
+        if static_file is not None:
+            return whitenoise.serve(static_file, request)
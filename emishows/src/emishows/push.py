@@ -0,0 +1,161 @@
+"""Push of timetable changes over server-sent events and WebSockets.
+
+Django 4.0 can't stream from async iterators and doesn't speak
+WebSocket, so these are plain ASGI apps routed in front of Django.
+Every client subscribes to the same change feed, which is filled by the
+calendar mirror, so clients don't cause any upstream requests.
+
+"""
+
+import asyncio
+import json
+from typing import Optional
+from urllib.parse import parse_qs
+
+from emishows.app.serializers import DateTimeField
+from emishows.events import Change, feeds
+
+PATH = "/timetable/changes"
+
+# seconds between comments that keep idle connections open
+KEEPALIVE = 15
+
+
+def message(sequence: int, change: Change) -> dict:
+    return {
+        "sequence": sequence,
+        "type": change.kind,
+        "id": str(change.uid) if change.uid is not None else None,
+        "occurrences": [
+            {
+                "start": DateTimeField._format(occurrence.start),
+                "end": DateTimeField._format(occurrence.end),
+            }
+            for occurrence in change.occurrences
+        ],
+    }
+
+
+def _last(scope) -> Optional[int]:
+    """Returns the sequence number of the last change a client saw."""
+
+    headers = dict(scope["headers"])
+    query = parse_qs(scope["query_string"].decode())
+    value = headers.get(b"last-event-id", b"").decode()
+    value = value or query.get("last", [""])[0]
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+async def _wait_for(receive, kind: str) -> None:
+    while (await receive())["type"] != kind:
+        pass
+
+
+async def _respond(send, status: int, body: bytes) -> None:
+    headers = [(b"content-type", b"text/plain; charset=utf-8")]
+    await send(
+        {"type": "http.response.start", "status": status, "headers": headers}
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+async def events(scope, receive, send) -> None:
+    """Streams changes as server-sent events."""
+
+    feed = feeds.get("emitimes")
+    if feed is None:
+        await _respond(send, 503, b"Changes are not available.")
+        return
+    subscription = feed.subscribe(_last(scope))
+    disconnected = asyncio.ensure_future(_wait_for(receive, "http.disconnect"))
+    try:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream"),
+                    (b"cache-control", b"no-cache"),
+                    # proxies must not buffer the stream
+                    (b"x-accel-buffering", b"no"),
+                ],
+            }
+        )
+        chunk = b"retry: 3000\n\n"
+        while not disconnected.done():
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": chunk,
+                    "more_body": True,
+                }
+            )
+            getter = asyncio.ensure_future(subscription.get())
+            await asyncio.wait(
+                {getter, disconnected},
+                timeout=KEEPALIVE,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not getter.done():
+                getter.cancel()
+                chunk = b": keepalive\n\n"
+                continue
+            sequence, change = getter.result()
+            data = json.dumps(message(sequence, change))
+            chunk = f"id: {sequence}\nevent: {change.kind}\ndata: {data}\n\n"
+            chunk = chunk.encode()
+    finally:
+        disconnected.cancel()
+        feed.unsubscribe(subscription)
+
+
+async def websocket(scope, receive, send) -> None:
+    """Sends changes as JSON messages over a WebSocket."""
+
+    await _wait_for(receive, "websocket.connect")
+    feed = feeds.get("emitimes")
+    if feed is None:
+        await send({"type": "websocket.close", "code": 1011})
+        return
+    await send({"type": "websocket.accept"})
+    subscription = feed.subscribe(_last(scope))
+    closed = asyncio.ensure_future(_wait_for(receive, "websocket.disconnect"))
+    try:
+        while not closed.done():
+            getter = asyncio.ensure_future(subscription.get())
+            await asyncio.wait(
+                {getter, closed}, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not getter.done():
+                getter.cancel()
+                continue
+            data = json.dumps(message(*getter.result()))
+            await send({"type": "websocket.send", "text": data})
+    finally:
+        closed.cancel()
+        feed.unsubscribe(subscription)
+
+
+class PushRouter:
+    """Serves change feeds and passes everything else to the app."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        path = scope.get("path", "").rstrip("/")
+        if scope["type"] == "websocket":
+            if path == PATH:
+                await websocket(scope, receive, send)
+            else:
+                await _wait_for(receive, "websocket.connect")
+                await send({"type": "websocket.close", "code": 1000})
+            return
+        if scope["type"] == "http" and path == PATH:
+            if scope["method"] in ("GET", "HEAD"):
+                await events(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
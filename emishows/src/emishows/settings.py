@@ -20,7 +20,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "emishows.middleware.ServerTimingMiddleware",
+    "emishows.middleware.StaleMiddleware",
+    "emishows.middleware.CompressionMiddleware",
+    "emishows.middleware.StaticFilesMiddleware",
     "django.middleware.common.CommonMiddleware",
 ]
 
@@ -50,6 +53,30 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    # local memory is per process, use Redis to share between workers
+    "default": (
+        {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": config.cache_url,
+            "KEY_PREFIX": "emishows",
+        }
+        if config.cache_url
+        else {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "emishows",
+            "OPTIONS": {"MAX_ENTRIES": config.cache_size},
+        }
+    )
+}
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "filters": {"probes": {"()": "emishows.app.health.ProbeLogFilter"}},
+    "loggers": {"django.request": {"filters": ["probes"]}},
+}
+
 LANGUAGE_CODE = "en-us"
 TIME_ZONE = "UTC"
 USE_TZ = True
@@ -65,4 +92,10 @@ REST_FRAMEWORK = {
     "DEFAULT_FILTER_BACKENDS": [
         "django_filters.rest_framework.DjangoFilterBackend"
     ],
+    "DEFAULT_RENDERER_CLASSES": [
+        "emishows.app.renderers.JSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PAGINATION_CLASS": "emishows.app.pagination.IdCursorPagination",
+    "PAGE_SIZE": config.page_size,
 }
@@ -3,7 +3,7 @@ from django.conf.urls.static import static
 from django.urls import include, path
 from rest_framework import routers
 
-from emishows.app import views
+from emishows.app import async_views, views
 
 router = routers.DefaultRouter()
 router.register("shows", views.ShowViewSet)
@@ -11,6 +11,17 @@ router.register("events", views.EventViewSet)
 router.register("timetable", views.TimetableViewSet, basename="Timetable")
 
 urlpatterns = [
+    # the hottest read paths wait for the calendar without holding a thread
+    path(
+        "timetable/",
+        async_views.timetable,
+        # named like the router's list routes, so the API root links to it
+        name="Timetable-list",
+    ),
+    path("events/<uuid:id>/params", async_views.event_params),
     path("", include(router.urls)),
+    # served from snapshots, which the synchronous calendar keeps
     path("ics", views.ICSView.as_view()),
+    path("metrics", views.metrics),
+    path("ready", views.ready, name="ready"),
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
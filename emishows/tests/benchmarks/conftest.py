@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta
+from typing import List
+from uuid import uuid4
+from zoneinfo import ZoneInfo
+
+import caldav
+
+from emishows.events import Calendar
+
+START = datetime(2022, 1, 3, 10, tzinfo=ZoneInfo("Europe/Warsaw"))
+
+RULES = [None, {"freq": "daily"}, {"freq": "weekly", "byday": ["MO", "TH"]}]
+
+
+def synthetic_events(count: int) -> List[dict]:
+    """Events spread over a week, two thirds of them recurring."""
+
+    events = []
+    for i in range(count):
+        start = START + timedelta(hours=i % (7 * 24))
+        events.append(
+            {
+                "uid": uuid4(),
+                "start": start,
+                "end": start + timedelta(hours=1),
+                "rules": RULES[i % len(RULES)],
+            }
+        )
+    return events
+
+
+def synthetic_resources(count: int) -> List[caldav.Event]:
+    return [
+        caldav.Event(data=Calendar._new_calendar(**kwargs).to_ical())
+        for kwargs in synthetic_events(count)
+    ]
@@ -0,0 +1,99 @@
+import json
+from datetime import timedelta
+
+import pytest
+
+from emishows.app.models import Event, Show
+from emishows.app.renderers import StreamingJSONRenderer
+from emishows.app.views import TimetableViewSet
+from emishows.events import (
+    AsyncCalendar,
+    Calendar,
+    async_calendars,
+    calendars,
+    mirrors,
+)
+from emishows.events import Event as CalendarEvent
+from tests.benchmarks.conftest import START, synthetic_events
+from tests.conftest import new_calendar
+
+EVENTS = 30
+
+
+@pytest.fixture(scope="module")
+def stored_events(caldav_url):
+    calendar = new_calendar(caldav_url)
+    events = synthetic_events(EVENTS)
+    result = calendar.add_many(events)
+    assert not result.failed
+    return calendar, events
+
+
+@pytest.fixture
+def emitimes(stored_events, monkeypatch, db):
+    calendar, events = stored_events
+    monkeypatch.setitem(calendars, "emitimes", calendar)
+    async_calendar = AsyncCalendar(
+        calendar.url, calendar.name, calendar.user, calendar.password
+    )
+    monkeypatch.setitem(async_calendars, "emitimes", async_calendar)
+    monkeypatch.delitem(mirrors, "emitimes", raising=False)
+    shows = Show.objects.bulk_create(
+        Show(label=f"show-{i}", title=f"Show {i}") for i in range(3)
+    )
+    Event.objects.bulk_create(
+        Event(id=event["uid"], show=shows[i % 3], type=Event.Type.LIVE)
+        for i, event in enumerate(events)
+    )
+    return calendar
+
+
+def get_json(client, url):
+    response = client.get(url)
+    assert response.status_code == 200
+    if response.streaming:
+        return json.loads(b"".join(response.streaming_content))
+    return response.json()
+
+
+@pytest.mark.parametrize("days", [1, 7, 30])
+def test_timetable(benchmark, client, emitimes, days):
+    to_date = START + timedelta(days=days)
+    url = (
+        f"/timetable/?from={START.replace(tzinfo=None).isoformat()}"
+        f"&to={to_date.replace(tzinfo=None).isoformat()}"
+    )
+
+    assert len(benchmark(get_json, client, url)) > 0
+
+
+@pytest.mark.parametrize("page_size", [10, 100])
+def test_events(benchmark, client, emitimes, page_size):
+    url = f"/events/?page_size={page_size}"
+
+    data = benchmark(get_json, client, url)
+
+    assert len(data["results"]) == min(page_size, EVENTS)
+
+
+def render_timetable(occurrences):
+    items = TimetableViewSet.iter_serialize(occurrences)
+    return b"".join(StreamingJSONRenderer().render_stream(items))
+
+
+def test_render_timetable(benchmark, emitimes, stored_events):
+    to_date = START + timedelta(days=7)
+    occurrences = sorted(
+        (
+            occurrence
+            for event in stored_events[1]
+            for occurrence in Calendar.expand(
+                CalendarEvent(**event), START, to_date
+            )
+        ),
+        key=lambda occurrence: occurrence.start,
+    )
+
+    content = benchmark(render_timetable, occurrences)
+
+    assert len(json.loads(content)) == len(occurrences)
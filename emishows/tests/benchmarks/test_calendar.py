@@ -0,0 +1,64 @@
+from datetime import timedelta
+
+import pytest
+
+from emishows.events import Calendar, codec
+from emishows.utils import parse_datetime_with_timezone
+from tests.benchmarks.conftest import (
+    START,
+    synthetic_events,
+    synthetic_resources,
+)
+
+
+@pytest.mark.parametrize("count", [10, 100, 1000])
+def test_expand_events(benchmark, count):
+    resources = synthetic_resources(count)
+    window = START, START + timedelta(days=7)
+
+    events = benchmark(Calendar._expand_events, resources, *window)
+
+    assert len(events) >= count
+
+
+@pytest.mark.parametrize("count", [10, 100, 1000])
+def test_iter_search_first_page(benchmark, count):
+    calendars = [
+        resource.icalendar_instance for resource in synthetic_resources(count)
+    ]
+    window = START, START + timedelta(days=30)
+
+    def first_page():
+        merged = Calendar._merge_calendars(calendars, *window)
+        return [event for _, event in zip(range(20), merged)]
+
+    assert len(benchmark(first_page)) == 20
+
+
+@pytest.mark.parametrize("rules", [None, {"freq": "weekly", "count": 10}])
+def test_vevent_round_trip(benchmark, rules):
+    kwargs = {**synthetic_events(1)[0], "rules": rules}
+
+    def round_trip():
+        calendar = Calendar._new_calendar(**kwargs)
+        data = Calendar._parse(calendar.to_ical())
+        return Calendar._map_vevent(Calendar._retrieve_vevent(data))
+
+    assert benchmark(round_trip).uid == kwargs["uid"]
+
+
+@pytest.mark.parametrize("rules", [None, {"freq": "weekly", "count": 10}])
+def test_codec_round_trip(benchmark, rules):
+    kwargs = {**synthetic_events(1)[0], "rules": rules}
+
+    def round_trip():
+        return codec.decode(codec.encode(Calendar._validate(**kwargs)))
+
+    assert benchmark(round_trip).uid == kwargs["uid"]
+
+
+@pytest.mark.parametrize(
+    "value", ["2022-01-03T10:00:00", "2022-01-03T10:00:00 Europe/Warsaw"]
+)
+def test_parse_datetime_with_timezone(benchmark, value):
+    assert benchmark(parse_datetime_with_timezone, value).hour == 10
@@ -0,0 +1,43 @@
+import pytest
+
+from emishows.events import AsyncCalendar, Calendar, URLStore
+
+
+def connect(calendar: Calendar, store=None) -> Calendar:
+    return Calendar(
+        calendar.url,
+        calendar.name,
+        calendar.user,
+        calendar.password,
+        store=store,
+    )
+
+
+def test_create_calendars(benchmark, calendar):
+    """What starting a process costs now that discovery is lazy."""
+
+    def create():
+        connect(calendar).close()
+        AsyncCalendar(
+            calendar.url, calendar.name, calendar.user, calendar.password
+        )
+
+    benchmark(create)
+
+
+@pytest.mark.parametrize("stored", [False, True])
+def test_first_request(benchmark, calendar, tmp_path, stored):
+    """Discovery and one request, with and without a stored URL."""
+
+    store = URLStore(tmp_path / "calendars.json")
+    if stored:
+        connect(calendar, store).resolve()
+
+    def first_request():
+        connected = connect(calendar, store if stored else None)
+        try:
+            return connected.ctag()
+        finally:
+            connected.close()
+
+    assert benchmark(first_request) == calendar.ctag()
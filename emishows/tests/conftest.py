@@ -1,9 +1,69 @@
 import os
+import threading
 from pathlib import Path
+from typing import Iterator
+from uuid import uuid4
+from wsgiref.simple_server import WSGIRequestHandler, make_server
 
+import caldav
 import pytest
 
+from emishows.events import AsyncCalendar, Calendar
+
 
 @pytest.fixture(scope="session")
 def resources_dir() -> Path:
     return Path(os.path.dirname(__file__)) / "resources"
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope="session")
+def caldav_url(tmp_path_factory) -> Iterator[str]:
+    radicale = pytest.importorskip("radicale")
+    from radicale import config
+
+    configuration = config.load()
+    configuration.update(
+        {
+            "storage": {
+                "filesystem_folder": str(tmp_path_factory.mktemp("radicale"))
+            },
+            "auth": {"type": "none"},
+        },
+        "test",
+        privileged=True,
+    )
+    server = make_server(
+        "127.0.0.1",
+        0,
+        radicale.Application(configuration),
+        handler_class=QuietHandler,
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def new_calendar(caldav_url: str) -> Calendar:
+    name = uuid4().hex
+    caldav.DAVClient(
+        url=caldav_url, username="user", password="password"
+    ).principal().make_calendar(cal_id=name)
+    return Calendar(caldav_url, name, "user", "password")
+
+
+@pytest.fixture
+def calendar(caldav_url) -> Calendar:
+    return new_calendar(caldav_url)
+
+
+@pytest.fixture
+def async_calendar(calendar) -> AsyncCalendar:
+    return AsyncCalendar(
+        calendar.url, calendar.name, calendar.user, calendar.password
+    )
@@ -0,0 +1,226 @@
+import json
+from datetime import timedelta
+from uuid import uuid4
+
+import pytest
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.db import transaction
+
+from emishows.app.models import Event, Occurrence, Show
+from emishows.app.occurrences import OccurrenceMaterializer, materializers
+from emishows.events import CalendarError, async_calendars, calendars, mirrors
+from emishows.utils import utcnow
+
+
+@pytest.fixture
+def now():
+    return utcnow().replace(minute=0, second=0, microsecond=0)
+
+
+@pytest.fixture
+def emitimes(calendar, async_calendar, monkeypatch):
+    monkeypatch.setitem(calendars, "emitimes", calendar)
+    monkeypatch.setitem(async_calendars, "emitimes", async_calendar)
+    monkeypatch.delitem(mirrors, "emitimes", raising=False)
+    monkeypatch.delitem(materializers, "emitimes", raising=False)
+    return calendar
+
+
+@pytest.fixture
+def materializer(emitimes, monkeypatch):
+    materializer = OccurrenceMaterializer(emitimes)
+    monkeypatch.setitem(materializers, "emitimes", materializer)
+    return materializer
+
+
+@pytest.fixture
+def events(emitimes, now):
+    shows = [
+        Show.objects.create(label=f"show-{i}", title=f"Show {i}")
+        for i in range(2)
+    ]
+    events = []
+    for i, (show, type) in enumerate(
+        [(shows[0], 1), (shows[1], 1), (shows[1], 2)]
+    ):
+        event = Event.objects.create(id=uuid4(), show=show, type=type)
+        start = now + timedelta(hours=i)
+        emitimes.add(
+            uid=event.id,
+            start=start,
+            end=start + timedelta(minutes=30),
+            rules={"freq": "daily"} if i == 0 else None,
+            show=show.id,
+            type=type,
+        )
+        events.append(event)
+    # stored only in the calendar
+    emitimes.add(uid=uuid4(), start=now, end=now + timedelta(hours=1))
+    return events
+
+
+def timetable(client, now, query=""):
+    window = (now - timedelta(days=1), now + timedelta(days=3))
+    url = "/timetable/?from={}&to={}".format(
+        *(dt.replace(tzinfo=None).isoformat() for dt in window)
+    )
+    response = client.get(url + query)
+    assert response.status_code == 200
+    return json.loads(b"".join(response.streaming_content))
+
+
+def key(item):
+    return item["params"]["start"], item["id"]
+
+
+@pytest.mark.django_db
+def test_refresh_materializes_events_in_database(materializer, events):
+    assert materializer.refresh()
+
+    # the daily event has four occurrences before the horizon ends
+    assert Occurrence.objects.count() > len(events)
+    assert set(Occurrence.objects.values_list("event_id", flat=True)) == {
+        event.id for event in events
+    }
+    assert not materializer.refresh()
+
+
+@pytest.mark.django_db
+def test_timetable_from_occurrences_matches_calendar(
+    client, emitimes, events, now, monkeypatch
+):
+    expected = timetable(client, now)
+
+    materializer = OccurrenceMaterializer(emitimes)
+    materializer.refresh()
+    monkeypatch.setitem(materializers, "emitimes", materializer)
+
+    data = timetable(client, now)
+    assert data == sorted(data, key=lambda item: item["params"]["start"])
+    assert sorted(data, key=key) == sorted(expected, key=key)
+
+
+@pytest.mark.django_db
+def test_writes_are_materialized_before_reads(
+    client, materializer, events, now
+):
+    materializer.refresh()
+    uid = events[1].id
+
+    calendars["emitimes"].update(
+        uid,
+        start=now + timedelta(days=1),
+        end=now + timedelta(days=1, hours=1),
+    )
+
+    assert materializer.pending
+    starts = [
+        item["params"]["start"]
+        for item in timetable(client, now)
+        if item["id"] == str(uid)
+    ]
+    start = now + timedelta(days=1)
+    assert starts == [f"{start.strftime('%Y-%m-%dT%H:%M:%S')} {now.tzinfo}"]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("materialized", [False, True])
+def test_timetable_filters(client, materializer, events, now, materialized):
+    if materialized:
+        materializer.refresh()
+
+    by_show = timetable(client, now, f"&show={events[1].show_id}")
+    by_type = timetable(client, now, "&type=2&limit=1")
+
+    assert {item["id"] for item in by_show} == {
+        str(events[1].id),
+        str(events[2].id),
+    }
+    assert [item["id"] for item in by_type] == [str(events[2].id)]
+
+
+@pytest.mark.django_db
+def test_timetable_rejects_invalid_filters(client, emitimes):
+    assert client.get("/timetable/?show=abc").status_code == 400
+    assert client.get("/timetable/?type=7").status_code == 400
+
+
+@pytest.mark.django_db
+def test_stamp_events_makes_old_events_filterable(
+    client, emitimes, events, now
+):
+    show = events[0].show
+    event = Event.objects.create(id=uuid4(), show=show, type=2)
+    # saved before events were stamped
+    emitimes.add(uid=event.id, start=now, end=now + timedelta(hours=1))
+    query = f"&show={show.id}&type=2"
+    assert timetable(client, now, query) == []
+
+    call_command("stamp_events", batch_size=2)
+
+    assert [item["id"] for item in timetable(client, now, query)] == [
+        str(event.id)
+    ]
+
+
+@pytest.mark.django_db
+def test_one_process_rebuilds_shared_table(emitimes, events):
+    backend = LocMemCache(uuid4().hex, {})
+    first, second = (
+        OccurrenceMaterializer(emitimes, backend=backend) for _ in range(2)
+    )
+    assert first.refresh()
+    assert not second.refresh(force=True)
+    # state of the table is shared, so the other process can read it
+    assert second.search(utcnow(), utcnow() + timedelta(days=1)).exists()
+
+
+@pytest.mark.django_db
+def test_failed_bulk_delete_keeps_occurrences(
+    client, materializer, events, monkeypatch
+):
+    materializer.refresh()
+    kept, deleted = events[0].id, events[1].id
+    delete = calendars["emitimes"]._delete
+
+    def failing_delete(uid, *args):
+        if uid == kept:
+            raise CalendarError("Can't delete event.")
+        return delete(uid, *args)
+
+    monkeypatch.setattr(calendars["emitimes"], "_delete", failing_delete)
+
+    response = client.delete(
+        "/events/bulk/",
+        [str(kept), str(deleted)],
+        content_type="application/json",
+    )
+
+    assert response.status_code == 207
+    assert Occurrence.objects.filter(event_id=kept).exists()
+    assert not Event.objects.filter(id=deleted).exists()
+
+
+@pytest.mark.django_db
+def test_events_committed_after_a_flush_are_materialized(
+    materializer, events, now, django_capture_on_commit_callbacks
+):
+    materializer.refresh()
+    ctag = materializer.ctag
+    uid = uuid4()
+    window = (now, now + timedelta(days=1))
+
+    with django_capture_on_commit_callbacks(execute=True):
+        with transaction.atomic():
+            calendars["emitimes"].add(
+                uid=uid, start=now, end=now + timedelta(hours=1)
+            )
+            # the flush races the transaction that creates the row
+            materializer.flush()
+            assert materializer.ctag == ctag
+            Event.objects.create(id=uid, show=events[0].show, type=1)
+
+    assert materializer.pending
+    occurrences = materializer.search(*window)
+    assert occurrences.filter(event_id=uid).exists()
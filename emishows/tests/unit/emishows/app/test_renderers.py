@@ -0,0 +1,75 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from uuid import uuid4
+from zoneinfo import ZoneInfo
+
+import pytest
+from rest_framework import renderers
+
+from emishows.app.encoders import encode_params, format_datetime
+from emishows.app.renderers import JSONRenderer, StreamingJSONRenderer
+from emishows.app.serializers import BaseEventParamsSerializer
+from emishows.events import Event as CalendarEvent
+
+DATA = [
+    None,
+    [],
+    {},
+    {"id": uuid4(), "show": {"title": "Zażółć   gęślą   jaźń"}},
+    {"text": '\x00\x1f\x7f"\\/\t\n', "emoji": "\U0001f4fb"},
+    {1: True, "none": None, "list": [1, -2, 2**63 - 1], "nested": {"a": []}},
+    {"date": date(2022, 1, 1), "delta": timedelta(hours=1)},
+    {"datetime": datetime(2022, 1, 1, 10, 0, 0, 123456, ZoneInfo("UTC"))},
+    {"decimal": Decimal("1.25"), "float": 0.5},
+    [2**64],
+]
+
+
+@pytest.mark.parametrize("data", DATA)
+def test_render_matches_drf(data):
+    expected = renderers.JSONRenderer().render(data)
+
+    assert JSONRenderer().render(data) == expected
+
+
+def test_indented_render_matches_drf():
+    data = {"a": [1, 2]}
+    media_type = "application/json; indent=4"
+
+    assert JSONRenderer().render(data, media_type) == (
+        renderers.JSONRenderer().render(data, media_type)
+    )
+
+
+def test_streamed_render_matches_drf():
+    items = [data for data in DATA if data is not None]
+
+    content = b"".join(StreamingJSONRenderer().render_stream(items))
+
+    assert content == renderers.JSONRenderer().render(items)
+
+
+@pytest.mark.parametrize(
+    "dt",
+    [
+        datetime(2022, 3, 27, 1, 30, 15, 999, ZoneInfo("Europe/Warsaw")),
+        datetime(2022, 12, 31, 23, 59, 59, tzinfo=ZoneInfo("UTC")),
+        datetime(999, 1, 1, tzinfo=ZoneInfo("Etc/UTC")),
+    ],
+)
+def test_format_datetime_matches_strftime(dt):
+    expected = f"{dt.strftime('%Y-%m-%dT%H:%M:%S')} {dt.tzinfo}"
+
+    assert format_datetime(dt) == expected
+
+
+def test_encode_params_matches_serializer():
+    start = datetime(2022, 1, 1, 10, tzinfo=ZoneInfo("America/New_York"))
+    event = CalendarEvent(
+        uid=uuid4(),
+        start=start,
+        end=start + timedelta(hours=1),
+        rules={"freq": "weekly", "byday": ["MO"]},
+    )
+
+    assert encode_params(event) == BaseEventParamsSerializer(event).data
@@ -0,0 +1,788 @@
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta
+from uuid import UUID, uuid4
+from zoneinfo import ZoneInfo
+
+import httpx
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from emishows.app.models import Event, Show
+from emishows.app.occurrences import OccurrenceMaterializer, materializers
+from emishows.app.views import TimetableViewSet
+from emishows.events import (
+    AsyncCalendar,
+    Calendar,
+    CalendarError,
+    CircuitBreaker,
+    ICSCache,
+    SearchCache,
+    StaleResults,
+    async_calendars,
+    calendars,
+    ics_caches,
+    mirrors,
+)
+from emishows.events.sync import CalendarMirror
+from emishows.handlers import StreamingASGIHandler
+from emishows.utils import utcnow
+
+START = datetime(2022, 1, 1, 10, tzinfo=ZoneInfo("Europe/Warsaw"))
+
+
+@pytest.fixture
+def emitimes(calendar, async_calendar, monkeypatch):
+    monkeypatch.setitem(calendars, "emitimes", calendar)
+    monkeypatch.setitem(async_calendars, "emitimes", async_calendar)
+    monkeypatch.delitem(mirrors, "emitimes", raising=False)
+    return calendar
+
+
+def create_events(calendar, count):
+    shows = [
+        Show.objects.get_or_create(label=f"show-{i}", title=f"Show {i}")[0]
+        for i in range(3)
+    ]
+    for i in range(count):
+        event = Event.objects.create(
+            id=uuid4(), show=shows[i % len(shows)], type=Event.Type.LIVE
+        )
+        start = START + timedelta(hours=i)
+        calendar.add(uid=event.id, start=start, end=start + timedelta(1 / 24))
+
+
+def read_json(response):
+    assert response.status_code == 200
+    if response.streaming:
+        return json.loads(b"".join(response.streaming_content))
+    data = response.json()
+    return data["results"] if "results" in data else data
+
+
+def count_queries(client, url):
+    with CaptureQueriesContext(connection) as context:
+        data = read_json(client.get(url))
+    return len(context.captured_queries), data
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("url", ["/events/", "/timetable/?from={}&to={}"])
+def test_show_queries_dont_grow_with_page_size(client, emitimes, url):
+    url = url.format("2022-01-01T00:00:00", "2022-01-03T00:00:00")
+
+    create_events(emitimes, 2)
+    queries, data = count_queries(client, url)
+    assert len(data) == 2
+
+    create_events(emitimes, 10)
+    assert count_queries(client, url)[0] == queries
+    assert all("title" in event["show"] for event in data)
+
+
+@pytest.mark.django_db
+def test_event_list_matches_single_events(client, emitimes):
+    create_events(emitimes, 3)
+    show = Show.objects.first()
+    # parameters are missing from the calendar
+    missing = Event.objects.create(
+        id=uuid4(), show=show, type=Event.Type.REPLAY
+    )
+
+    data = read_json(client.get("/events/"))
+
+    assert len(data) == 4
+    for item in data:
+        if item["id"] == str(missing.id):
+            assert item["params"] is None
+            assert item["errors"] == {
+                "params": ["Event parameters not found."]
+            }
+            assert item["type"] == Event.Type.REPLAY
+            continue
+        response = client.get(f"/events/{item['id']}/")
+        assert item == response.json()
+
+
+@pytest.mark.django_db
+def test_event_list_fetches_params_at_once(client, emitimes, monkeypatch):
+    create_events(emitimes, 5)
+    sent = []
+    send = emitimes.http.send
+
+    def counting_send(request, *args, **kwargs):
+        sent.append(request.method)
+        return send(request, *args, **kwargs)
+
+    monkeypatch.setattr(emitimes.http, "send", counting_send)
+
+    assert len(read_json(client.get("/events/"))) == 5
+    assert sent == ["REPORT"]
+
+
+@pytest.mark.django_db
+def test_events_are_paginated_with_cursor(client, emitimes):
+    create_events(emitimes, 5)
+
+    ids = []
+    url = "/events/?page_size=2"
+    while url is not None:
+        response = client.get(url)
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page["results"]) <= 2
+        ids.extend(event["id"] for event in page["results"])
+        url = page["next"]
+
+    assert len(ids) == len(set(ids)) == 5
+
+
+@pytest.mark.django_db
+def test_timetable_is_streamed_in_batches(client, emitimes, monkeypatch):
+    monkeypatch.setattr(TimetableViewSet, "batch_size", 2)
+    create_events(emitimes, 5)
+
+    response = client.get("/timetable/?from=2022-01-01&to=2022-01-03")
+    assert response.streaming
+    events = read_json(response)
+    assert sorted(event["params"]["start"] for event in events) == [
+        f"2022-01-01T{10 + i}:00:00 Europe/Warsaw" for i in range(5)
+    ]
+
+    response = client.get("/timetable/?from=2021-01-01&to=2021-01-03")
+    assert read_json(response) == []
+
+
+async def asgi_get(*urls):
+    """Requests the URLs at once from a new ASGI application."""
+
+    app = StreamingASGIHandler()
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        requests = asyncio.gather(*(client.get(url) for url in urls))
+        return await asyncio.wait_for(requests, timeout=10)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_timetable_is_streamed_under_asgi(emitimes, monkeypatch):
+    monkeypatch.setattr(TimetableViewSet, "batch_size", 2)
+    create_events(emitimes, 5)
+
+    # events are loaded from the database while the body is sent
+    [response] = asyncio.run(
+        asgi_get("/timetable/?from=2022-01-01&to=2022-01-03")
+    )
+    assert response.status_code == 200
+    assert len(response.json()) == 5
+
+
+@pytest.mark.django_db
+def test_timetable_is_expanded_while_streaming(
+    client, emitimes, async_calendar, monkeypatch
+):
+    monkeypatch.setattr(TimetableViewSet, "batch_size", 2)
+    create_events(emitimes, 5)
+    iter_search = async_calendar.iter_search
+    pulled = []
+
+    async def counting_iter_search(*args, **kwargs):
+        events = await iter_search(*args, **kwargs)
+
+        def counting():
+            for event in events:
+                pulled.append(event)
+                yield event
+
+        return counting()
+
+    async def search(*args, **kwargs):
+        raise AssertionError("The whole window is expanded at once.")
+
+    monkeypatch.setattr(async_calendar, "iter_search", counting_iter_search)
+    monkeypatch.setattr(async_calendar, "search", search)
+
+    response = client.get("/timetable/?from=2022-01-01&to=2022-01-03")
+    assert pulled == []
+    content = iter(response.streaming_content)
+    first = next(content)
+    assert len(pulled) == TimetableViewSet.batch_size
+    assert len(json.loads(b"".join([first, *content]))) == 5
+    assert len(pulled) == 5
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_timetable_requests_share_one_report(
+    emitimes, async_calendar, monkeypatch
+):
+    create_events(emitimes, 2)
+    monkeypatch.setattr(async_calendar, "cache", SearchCache())
+    request = async_calendar._request
+    sent = []
+
+    async def slow_request(method, *args, **kwargs):
+        sent.append(method)
+        if method == "REPORT":
+            # so that the concurrent requests overlap
+            await asyncio.sleep(0.2)
+        return await request(method, *args, **kwargs)
+
+    monkeypatch.setattr(async_calendar, "_request", slow_request)
+    url = "/timetable/?from=2022-01-01&to=2022-01-03"
+
+    responses = asyncio.run(asgi_get(*[url] * 10))
+    assert all(len(response.json()) == 2 for response in responses)
+    assert sent.count("REPORT") == 1
+
+    # repeated requests are served from the cache
+    [response] = asyncio.run(asgi_get(url))
+    assert len(response.json()) == 2
+    assert sent.count("REPORT") == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_async_views_use_the_async_calendar(emitimes, monkeypatch):
+    create_events(emitimes, 2)
+    first = min(
+        emitimes.search(START, START + timedelta(days=1)),
+        key=lambda event: event.start,
+    )
+
+    def blocking(*args, **kwargs):
+        raise AssertionError("The calendar blocks the event loop.")
+
+    for name in ("search", "iter_search", "get"):
+        monkeypatch.setattr(emitimes, name, blocking)
+
+    window = "from=2022-01-01&to=2022-01-03"
+    timetable, limited, params = asyncio.run(
+        asgi_get(
+            f"/timetable/?{window}",
+            f"/timetable/?{window}&limit=1",
+            f"/events/{first.uid}/params",
+        )
+    )
+    assert len(timetable.json()) == 2
+    assert len(limited.json()) == 1
+    assert params.json()["start"] == "2022-01-01T10:00:00 Europe/Warsaw"
+
+
+def test_api_root_links_to_the_timetable(client):
+    response = client.get("/", HTTP_ACCEPT="application/json")
+    assert response.json()["timetable"].endswith("/timetable/")
+
+
+def test_static_files_are_served(client):
+    response = client.get("/static/rest_framework/js/default.js")
+    assert response.status_code == 200
+
+
+def test_async_views_are_not_adapted_by_middleware(settings, caplog):
+    # adapted handlers are only logged in debug mode
+    settings.DEBUG = True
+    with caplog.at_level(logging.DEBUG, logger="django.request"):
+        StreamingASGIHandler()
+    # a synchronous middleware would hold a thread for each request
+    assert not [r for r in caplog.records if "adapted" in r.getMessage()]
+
+
+@pytest.mark.django_db
+def test_timetable_limit_returns_earliest_occurrences(client, emitimes):
+    create_events(emitimes, 5)
+
+    response = client.get("/timetable/?from=2022-01-01&to=2022-02-01&limit=2")
+    assert [event["params"]["start"] for event in read_json(response)] == [
+        "2022-01-01T10:00:00 Europe/Warsaw",
+        "2022-01-01T11:00:00 Europe/Warsaw",
+    ]
+
+    response = client.get("/timetable/?limit=0")
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_timetable_paths_agree_on_time_zones(client, emitimes, monkeypatch):
+    show = Show.objects.create(label="show", title="Show")
+    event = Event.objects.create(id=uuid4(), show=show, type=Event.Type.LIVE)
+    today = utcnow().astimezone(START.tzinfo).date()
+    start = datetime.combine(today, START.timetz())
+    emitimes.add(
+        uid=event.id,
+        start=start,
+        end=start + timedelta(hours=1),
+        rules={"freq": "daily"},
+        show=show.id,
+        type=event.type,
+    )
+    window = f"from={today}&to={today + timedelta(days=3)}"
+
+    def starts(query=""):
+        response = client.get(f"/timetable/?{window}{query}")
+        return [item["params"]["start"] for item in read_json(response)]
+
+    expected = [
+        f"{today + timedelta(days=i)}T10:00:00 Europe/Warsaw" for i in range(3)
+    ]
+    assert starts() == expected
+    assert starts("&limit=3") == expected
+    assert starts(f"&show={show.id}") == expected
+    assert starts(f"&type={event.type}") == expected
+
+    mirror = CalendarMirror(emitimes)
+    mirror.sync()
+    monkeypatch.setitem(mirrors, "emitimes", mirror)
+    assert starts() == expected
+    monkeypatch.delitem(mirrors, "emitimes")
+
+    materializer = OccurrenceMaterializer(emitimes)
+    materializer.refresh()
+    monkeypatch.setitem(materializers, "emitimes", materializer)
+    assert starts() == expected
+
+
+def event_data(show, hour, **kwargs):
+    return {
+        "show": show.id,
+        "type": Event.Type.LIVE,
+        "params": {
+            "start": f"2022-01-01T{hour:02}:00:00 Europe/Warsaw",
+            "end": f"2022-01-01T{hour + 1:02}:00:00 Europe/Warsaw",
+        },
+        **kwargs,
+    }
+
+
+@pytest.mark.django_db
+def test_bulk_create_reports_and_compensates_failures(
+    client, emitimes, monkeypatch
+):
+    show = Show.objects.create(label="show", title="Show")
+    put = emitimes._put
+
+    def failing_put(uid, data, *args):
+        hour = Calendar._decode(data).start.hour
+        if hour == 11:
+            raise ValueError("Unexpected.")
+        if hour == 13:
+            raise CalendarError("Can't save event.")
+        return put(uid, data, *args)
+
+    monkeypatch.setattr(emitimes, "_put", failing_put)
+
+    response = client.post(
+        "/events/bulk/",
+        [event_data(show, hour) for hour in range(10, 15)],
+        content_type="application/json",
+    )
+
+    assert response.status_code == 207
+    results = response.json()
+    # results are in the order of the items
+    assert [result.get("index") for result in results] == [
+        None,
+        1,
+        None,
+        3,
+        None,
+    ]
+    assert results[1] == {
+        "index": 1,
+        "errors": {"params": ["Unexpected calendar error."]},
+    }
+    assert results[3] == {
+        "index": 3,
+        "errors": {"params": ["Can't save event."]},
+    }
+    assert [results[i]["params"]["start"] for i in (0, 2, 4)] == [
+        f"2022-01-01T{hour}:00:00 Europe/Warsaw" for hour in (10, 12, 14)
+    ]
+    assert Event.objects.count() == 3
+    saved = emitimes.get_many(Event.objects.values_list("id", flat=True))
+    assert len(saved) == 3
+
+
+@pytest.mark.django_db
+def test_bulk_update_and_delete(client, emitimes):
+    show = Show.objects.create(label="show", title="Show")
+    other = Show.objects.create(label="other", title="Other")
+    response = client.post(
+        "/events/bulk/",
+        [event_data(show, hour) for hour in range(10, 13)],
+        content_type="application/json",
+    )
+    assert response.status_code == 201
+    ids = [event["id"] for event in response.json()]
+
+    response = client.patch(
+        "/events/bulk/",
+        [
+            {"id": ids[0], "show": other.id},
+            {
+                "id": ids[1],
+                "params": {"end": "2022-01-01T13:00:00 Europe/Warsaw"},
+            },
+        ],
+        content_type="application/json",
+    )
+    assert response.status_code == 200, response.json()
+    first, second = response.json()
+    assert first["show"]["id"] == other.id
+    assert first["params"]["start"] == "2022-01-01T10:00:00 Europe/Warsaw"
+    assert second["params"] == {
+        "start": "2022-01-01T11:00:00 Europe/Warsaw",
+        "end": "2022-01-01T13:00:00 Europe/Warsaw",
+        "rules": None,
+    }
+    stamped = emitimes.get_many(UUID(i) for i in ids[:2])
+    assert stamped[UUID(ids[0])].show == other.id
+    assert stamped[UUID(ids[1])].show == show.id
+
+    missing = str(uuid4())
+    response = client.delete(
+        "/events/bulk/",
+        [ids[0], ids[1], missing],
+        content_type="application/json",
+    )
+    assert response.status_code == 207
+    assert response.json() == [
+        {"id": ids[0]},
+        {"id": ids[1]},
+        {"index": 2, "id": missing, "errors": {"id": ["Event not found."]}},
+    ]
+    assert list(Event.objects.values_list("id", flat=True)) == [UUID(ids[2])]
+    assert len(emitimes.get_many(UUID(i) for i in ids)) == 1
+
+
+@pytest.mark.django_db
+def test_show_and_type_are_stamped_into_calendar(client, emitimes):
+    show = Show.objects.create(label="show", title="Show")
+    other = Show.objects.create(label="other", title="Other")
+    response = client.post(
+        "/events/", event_data(show, 10), content_type="application/json"
+    )
+    assert response.status_code == 201
+    uid = UUID(response.json()["id"])
+    assert emitimes.get(uid).show == show.id
+
+    response = client.patch(
+        f"/events/{uid}/",
+        {"show": other.id, "type": Event.Type.REPLAY},
+        content_type="application/json",
+    )
+    assert response.status_code == 200
+    event = emitimes.get(uid)
+    assert (event.show, event.type) == (other.id, Event.Type.REPLAY)
+    assert event.start == START
+
+
+@pytest.mark.django_db
+def test_writes_are_conditional_on_if_match(client, emitimes):
+    show = Show.objects.create(label="show", title="Show")
+    other = Show.objects.create(label="other", title="Other")
+    response = client.post(
+        "/events/", event_data(show, 10), content_type="application/json"
+    )
+    url = f"/events/{response.json()['id']}/"
+    etag = client.get(url).headers["ETag"]
+
+    response = client.patch(
+        url,
+        event_data(show, 12),
+        content_type="application/json",
+        HTTP_IF_MATCH=etag,
+    )
+    assert response.status_code == 200
+    assert client.get(url).headers["ETag"] != etag
+
+    # the tag is outdated by the previous update
+    response = client.patch(
+        url,
+        {"show": other.id},
+        content_type="application/json",
+        HTTP_IF_MATCH=etag,
+    )
+    assert response.status_code == 412
+    assert client.get(url).json()["show"]["id"] == show.id
+    response = client.delete(url, HTTP_IF_MATCH=etag)
+    assert response.status_code == 412
+    assert client.get(url).status_code == 200
+
+    etag = client.get(url).headers["ETag"]
+    response = client.delete(url, HTTP_IF_MATCH=etag)
+    assert response.status_code == 204
+
+
+@pytest.mark.django_db
+def test_updates_return_the_saved_event(client, emitimes, monkeypatch):
+    show = Show.objects.create(label="show", title="Show")
+    other = Show.objects.create(label="other", title="Other")
+    response = client.post(
+        "/events/", event_data(show, 10), content_type="application/json"
+    )
+    url = f"/events/{response.json()['id']}/"
+    etag = client.get(url).headers["ETag"]
+    sent = []
+    send = emitimes.http.send
+
+    def recording_send(request, *args, **kwargs):
+        sent.append(request.method)
+        return send(request, *args, **kwargs)
+
+    monkeypatch.setattr(emitimes.http, "send", recording_send)
+
+    # the new show is stamped into the fetched event
+    response = client.patch(
+        url,
+        {"show": other.id},
+        content_type="application/json",
+        HTTP_IF_MATCH=etag,
+    )
+    assert response.status_code == 200
+    assert sent == ["GET", "PUT"]
+    assert response.json()["params"]["start"] == (
+        "2022-01-01T10:00:00 Europe/Warsaw"
+    )
+
+    # the returned tag is current, so it can make the next write
+    response = client.put(
+        url,
+        event_data(other, 12),
+        content_type="application/json",
+        HTTP_IF_MATCH=response.headers["ETag"],
+    )
+    assert response.status_code == 200
+    assert sent == ["GET", "PUT", "PUT"]
+    assert response.json()["params"]["start"] == (
+        "2022-01-01T12:00:00 Europe/Warsaw"
+    )
+    assert response.headers["ETag"] == client.get(url).headers["ETag"]
+
+
+@pytest.mark.django_db
+def test_weak_etags_of_compressed_responses_match(client, emitimes):
+    show = Show.objects.create(label="show", title="Show")
+    response = client.post(
+        "/events/", event_data(show, 10), content_type="application/json"
+    )
+    url = f"/events/{response.json()['id']}/"
+
+    def get_etag():
+        response = client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert response.headers["ETag"].startswith("W/")
+        return response.headers["ETag"]
+
+    response = client.patch(
+        url,
+        event_data(show, 12),
+        content_type="application/json",
+        HTTP_ACCEPT_ENCODING="gzip",
+        HTTP_IF_MATCH=get_etag(),
+    )
+    assert response.status_code == 200
+    response = client.delete(
+        url, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_MATCH=get_etag()
+    )
+    assert response.status_code == 204
+
+
+@pytest.mark.django_db
+def test_ready_reports_dependencies(client, emitimes, monkeypatch, caplog):
+    response = client.get("/ready")
+    assert response.status_code == 200
+    assert response.json()["ready"]
+
+    unreachable = Calendar("http://127.0.0.1:9", "missing")
+    monkeypatch.setitem(calendars, "emitimes", unreachable)
+    response = client.get("/ready")
+    assert response.status_code == 503
+    checks = response.json()["checks"]
+    assert checks["database"]["ok"]
+    assert not checks["calendar"]["ok"]
+    # failing probes are expected while starting, not server errors
+    assert not [r for r in caplog.records if r.name == "django.request"]
+
+
+@pytest.mark.django_db
+def test_timetable_conflicts_and_free_slots(client, emitimes):
+    create_events(emitimes, 3)
+    show = Show.objects.get(label="show-0")
+    event = Event.objects.create(id=uuid4(), show=show, type=Event.Type.LIVE)
+    start = START + timedelta(minutes=30)
+    emitimes.add(uid=event.id, start=start, end=start + timedelta(hours=1))
+    window = "from=2022-01-01T09:00:00 Europe/Warsaw&to=2022-01-01T15:00:00 Europe/Warsaw"
+
+    response = client.get(f"/timetable/conflicts/?{window}")
+    assert response.status_code == 200
+    conflicts = response.json()
+    assert [(item["start"], item["end"]) for item in conflicts] == [
+        (
+            "2022-01-01T10:30:00 Europe/Warsaw",
+            "2022-01-01T11:00:00 Europe/Warsaw",
+        ),
+        (
+            "2022-01-01T11:00:00 Europe/Warsaw",
+            "2022-01-01T11:30:00 Europe/Warsaw",
+        ),
+    ]
+    assert all(
+        str(event.id) in {item["id"] for item in conflict["events"]}
+        for conflict in conflicts
+    )
+    # each event is shown with its own occurrence
+    assert [
+        sorted(
+            (item["id"] == str(event.id), item["params"]["start"][11:16])
+            for item in conflict["events"]
+        )
+        for conflict in conflicts
+    ] == [
+        [(False, "10:00"), (True, "10:30")],
+        [(False, "11:00"), (True, "10:30")],
+    ]
+
+    response = client.get(f"/timetable/free/?{window}&duration=01:30:00")
+    assert response.status_code == 200
+    assert response.json() == [
+        {
+            "start": "2022-01-01T13:00:00 Europe/Warsaw",
+            "end": "2022-01-01T15:00:00 Europe/Warsaw",
+        }
+    ]
+
+    response = client.get(f"/timetable/free/?{window}&duration=-1")
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_overlapping_events_can_be_rejected(client, emitimes):
+    show = Show.objects.create(label="show", title="Show")
+    response = client.post(
+        "/events/", event_data(show, 10), content_type="application/json"
+    )
+    assert response.status_code == 201
+    uid = response.json()["id"]
+
+    url = "/events/?reject_conflicts=true"
+    response = client.post(
+        url, event_data(show, 10), content_type="application/json"
+    )
+    assert response.status_code == 400
+    assert uid in response.json()["params"][0]
+    response = client.post(
+        url, event_data(show, 11), content_type="application/json"
+    )
+    assert response.status_code == 201
+
+    # moving an event doesn't conflict with its own occurrences
+    response = client.patch(
+        f"/events/{uid}/?reject_conflicts=true",
+        {"params": {"start": "2022-01-01T09:30:00 Europe/Warsaw"}},
+        content_type="application/json",
+    )
+    assert response.status_code == 200
+
+    response = client.patch(
+        f"/events/{uid}/?reject_conflicts=true",
+        {"params": {"start": "2022-01-01T12:00:00 Europe/Warsaw"}},
+        content_type="application/json",
+    )
+    assert response.status_code == 400
+    assert response.json()["params"] == ["Start must be before end."]
+
+    # bulk updates check each event against its own occurrences too
+    response = client.patch(
+        "/events/bulk/?reject_conflicts=true",
+        [
+            {
+                "id": uid,
+                "params": {"start": "2022-01-01T09:00:00 Europe/Warsaw"},
+            }
+        ],
+        content_type="application/json",
+    )
+    assert response.status_code == 200
+    response = client.patch(
+        "/events/bulk/?reject_conflicts=true",
+        [
+            {
+                "id": uid,
+                "params": {"end": "2022-01-01T11:30:00 Europe/Warsaw"},
+            }
+        ],
+        content_type="application/json",
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_stale_reads_are_flagged(client, emitimes, monkeypatch):
+    resilient = Calendar(
+        emitimes.url,
+        emitimes.name,
+        emitimes.user,
+        emitimes.password,
+        breaker=CircuitBreaker(),
+        stale=StaleResults(),
+    )
+    monkeypatch.setitem(calendars, "emitimes", resilient)
+    monkeypatch.setitem(
+        async_calendars,
+        "emitimes",
+        AsyncCalendar(
+            emitimes.url,
+            emitimes.name,
+            emitimes.user,
+            emitimes.password,
+            breaker=CircuitBreaker(),
+            stale=StaleResults(),
+        ),
+    )
+    create_events(resilient, 2)
+    urls = [
+        "/events/",
+        "/timetable/?from=2022-01-01T00:00&to=2022-01-02T00:00",
+    ]
+    expected = [read_json(client.get(url)) for url in urls]
+
+    def unreachable(request):
+        raise httpx.ConnectError("Connection refused.", request=request)
+
+    async def unreachable_async(self, request):
+        unreachable(request)
+
+    transport = resilient.http._transport.transport
+    monkeypatch.setattr(transport, "handle_request", unreachable)
+    # async clients are created for each event loop
+    monkeypatch.setattr(
+        httpx.AsyncHTTPTransport, "handle_async_request", unreachable_async
+    )
+    for url, data in zip(urls, expected):
+        response = client.get(url)
+        assert read_json(response) == data
+        assert float(response["X-Calendar-Stale"]) >= 0
+    assert "X-Calendar-Stale" not in client.get("/shows/")
+
+
+@pytest.mark.django_db
+def test_ics_is_revalidated_with_etags(client, emitimes, monkeypatch):
+    monkeypatch.setitem(ics_caches, "emitimes", ICSCache(emitimes, ttl=3600))
+    create_events(emitimes, 1)
+
+    response = client.get("/ics")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert "Last-Modified" in response.headers
+    response = client.get("/ics", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    response = client.get(
+        "/ics", HTTP_IF_NONE_MATCH=f"W/{etag}", HTTP_ACCEPT_ENCODING="gzip"
+    )
+    assert response.status_code == 304
+
+    # writes through the calendar client replace the snapshot at once
+    create_events(emitimes, 1)
+    response = client.get("/ics", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.content.count(b"BEGIN:VEVENT") == 2
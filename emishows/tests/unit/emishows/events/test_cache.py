@@ -0,0 +1,135 @@
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+from django.core.cache.backends.locmem import LocMemCache
+
+from emishows.events import (
+    Calendar,
+    CalendarMirror,
+    ICSCache,
+    SearchCache,
+    SharedCounter,
+    SharedSearchCache,
+)
+from emishows.utils import utcnow
+
+
+@pytest.fixture
+def now() -> datetime:
+    return utcnow().replace(minute=0, second=0, microsecond=0)
+
+
+@pytest.fixture
+def backend() -> LocMemCache:
+    return LocMemCache(uuid4().hex, {})
+
+
+@pytest.fixture
+def changes(backend) -> SharedCounter:
+    return SharedCounter(backend, "changes")
+
+
+def worker(calendar: Calendar, backend, changes) -> Calendar:
+    """Returns a calendar like the one a separate worker process uses."""
+
+    cache = SharedSearchCache(backend, name=calendar.name)
+    worker = Calendar(
+        calendar.url, calendar.name, calendar.user, calendar.password, cache
+    )
+    worker.listeners.append(changes.notify)
+    return worker
+
+
+def test_writes_drop_only_windows_with_the_event(calendar, now):
+    cached = Calendar(
+        calendar.url,
+        calendar.name,
+        calendar.user,
+        calendar.password,
+        SearchCache(),
+    )
+    uid = uuid4()
+    cached.add(uid=uid, start=now, end=now + timedelta(hours=1))
+    today = (now - timedelta(hours=1), now + timedelta(hours=2))
+    later = (now + timedelta(days=3), now + timedelta(days=4))
+    assert len(cached.search(*today)) == 1
+    assert cached.search(*later) == []
+
+    cached.update(uid, end=now + timedelta(hours=2))
+    assert cached.cache.get(*today) is None
+    assert cached.cache.get(*later) == []
+
+    # moving an event drops the windows it moves into too
+    cached.update(uid, start=later[0], end=later[0] + timedelta(hours=1))
+    assert cached.cache.get(*later) is None
+    assert [event.uid for event in cached.search(*later)] == [uid]
+
+
+def test_results_fetched_before_a_write_are_not_cached(now):
+    cache = SearchCache()
+    window = cache.window(now, now + timedelta(hours=1))
+    generation = cache.generation
+    cache.invalidate(uuid4())
+
+    cache.set(window, [], generation)
+    assert cache.get(now, now + timedelta(hours=1)) is None
+    cache.set(window, [], cache.generation)
+    assert cache.get(now, now + timedelta(hours=1)) == []
+
+
+def test_shared_counter(backend):
+    counter = SharedCounter(backend, "counter")
+    assert counter.value() == 0
+    assert counter.bump() == 1
+    counter.notify(uuid4())
+    assert SharedCounter(backend, "counter").value() == 2
+
+
+def test_search_cache_is_shared_between_workers(
+    calendar, backend, changes, now
+):
+    first = worker(calendar, backend, changes)
+    second = worker(calendar, backend, changes)
+    first.add(uid=uuid4(), start=now, end=now + timedelta(hours=1))
+    window = (now - timedelta(hours=1), now + timedelta(hours=2))
+    assert len(first.search(*window)) == 1
+    assert second.cache.get(*window) is not None
+
+    # a write in one worker drops windows cached by all of them
+    second.add(uid=uuid4(), start=now, end=now + timedelta(hours=1))
+    assert first.cache.get(*window) is None
+    assert len(first.search(*window)) == 2
+
+
+def test_ics_snapshot_is_shared_between_workers(
+    calendar, backend, changes, now
+):
+    first, second = (
+        ICSCache(worker(calendar, backend, changes), backend=backend)
+        for _ in range(2)
+    )
+    first.calendar.add(uid=uuid4(), start=now, end=now + timedelta(hours=1))
+    snapshot = first.get()
+
+    downloads = []
+    second._download = lambda *args: downloads.append(args)
+    assert second.get().content == snapshot.content
+    assert not downloads
+
+
+def test_writes_in_other_workers_expire_local_state(
+    calendar, backend, changes, now
+):
+    ics = ICSCache(calendar, ttl=3600, changes=changes)
+    mirror = CalendarMirror(calendar, changes=changes)
+    ics.get()
+    mirror.sync()
+    assert ics.fresh() is not None
+
+    other = worker(calendar, backend, changes)
+    other.add(uid=uuid4(), start=now, end=now + timedelta(hours=1))
+    assert ics.fresh() is None
+    # the mirror pulls the change before answering
+    window = (now - timedelta(hours=1), now + timedelta(hours=2))
+    assert len(mirror.search(*window)) == 1
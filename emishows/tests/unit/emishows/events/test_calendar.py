@@ -0,0 +1,352 @@
+import asyncio
+import threading
+from datetime import datetime, timedelta
+from itertools import islice
+from uuid import uuid4
+
+import pytest
+from caldav.elements import cdav
+
+from emishows.events import (
+    AsyncCalendar,
+    Calendar,
+    CalendarConflictError,
+    CalendarError,
+    SearchCache,
+)
+from emishows.events.dav import DAVResource
+from emishows.utils import utcnow
+
+
+@pytest.fixture
+def now() -> datetime:
+    return utcnow().replace(minute=0, second=0, microsecond=0)
+
+
+@pytest.fixture
+def series(calendar, now):
+    calendar.add(
+        uid=uuid4(),
+        start=now,
+        end=now + timedelta(hours=1),
+        rules={"freq": "daily"},
+    )
+    calendar.add(
+        uid=uuid4(),
+        start=now + timedelta(hours=2),
+        end=now + timedelta(hours=3),
+        rules={"freq": "weekly"},
+    )
+    calendar.add(
+        uid=uuid4(),
+        start=now - timedelta(minutes=30),
+        end=now + timedelta(minutes=30),
+    )
+    return calendar
+
+
+def starts(events):
+    return [event.start for event in events]
+
+
+def test_iter_search_merges_occurrences_by_start(series, now):
+    from_date, to_date = now, now + timedelta(days=30)
+
+    events = list(series.iter_search(from_date, to_date))
+
+    assert sorted(starts(events)) == starts(events)
+    assert sorted(starts(series.search(from_date, to_date))) == starts(events)
+
+
+def test_iter_search_stops_early(series, now):
+    events = series.iter_search(now, now + timedelta(days=365), limit=4)
+
+    assert starts(events) == [
+        now - timedelta(minutes=30),
+        now,
+        now + timedelta(hours=2),
+        now + timedelta(days=1),
+    ]
+
+
+def test_upcoming(series, now):
+    events = series.upcoming(3, from_date=now + timedelta(hours=1))
+
+    assert starts(events) == [
+        now + timedelta(hours=2),
+        now + timedelta(days=1),
+        now + timedelta(days=2),
+    ]
+
+
+def test_async_iter_search_matches_sync(series, now):
+    calendar = AsyncCalendar(
+        series.url, series.name, series.user, series.password
+    )
+    from_date, to_date = now, now + timedelta(days=30)
+
+    async def search():
+        try:
+            return await calendar.iter_search(from_date, to_date)
+        finally:
+            await calendar.aclose()
+
+    events = asyncio.run(search())
+    expected = series.iter_search(from_date, to_date)
+    assert starts(islice(events, 10)) == starts(islice(expected, 10))
+
+
+def test_async_search_skips_malformed_objects(
+    calendar, async_calendar, now, monkeypatch
+):
+    uid = uuid4()
+    calendar.add(uid=uid, start=now, end=now + timedelta(hours=1))
+    report = async_calendar._report
+
+    async def malformed_report(query):
+        resources = await report(query)
+        data = {cdav.CalendarData.tag: "BEGIN:VCALENDAR\nnot a property"}
+        return [*resources, DAVResource("/malformed.ics", None, data)]
+
+    monkeypatch.setattr(async_calendar, "_report", malformed_report)
+
+    async def search():
+        try:
+            return await async_calendar.search(now, now + timedelta(days=1))
+        finally:
+            await async_calendar.aclose()
+
+    assert [event.uid for event in asyncio.run(search())] == [uid]
+
+
+def test_async_search_expands_off_the_event_loop(series, now, monkeypatch):
+    calendar = AsyncCalendar(
+        series.url,
+        series.name,
+        series.user,
+        series.password,
+        cache=SearchCache(),
+    )
+    window = (now, now + timedelta(days=7))
+    expected = series.search(*window)
+    threads = []
+    expand = Calendar._expand_calendars
+
+    def recording_expand(*args):
+        threads.append(threading.current_thread())
+        return expand(*args)
+
+    monkeypatch.setattr(
+        Calendar, "_expand_calendars", staticmethod(recording_expand)
+    )
+
+    async def search():
+        try:
+            return [
+                await calendar.search(*window),
+                await calendar.search(*window, filters={"show": 1}),
+            ]
+        finally:
+            await calendar.aclose()
+
+    cached, filtered = asyncio.run(search())
+    assert len(cached) == len(expected)
+    assert filtered == []
+    # the second search is served from the cache
+    assert len(threads) == 1
+    assert threading.current_thread() not in threads
+
+
+def test_async_writes_encode_off_the_event_loop(
+    async_calendar, now, monkeypatch
+):
+    uid = uuid4()
+    threads = []
+    encode, parse = Calendar._encode, Calendar._parse
+
+    def recording(function):
+        def record(*args):
+            threads.append(threading.current_thread())
+            return function(*args)
+
+        return staticmethod(record)
+
+    monkeypatch.setattr(Calendar, "_encode", recording(encode))
+    monkeypatch.setattr(Calendar, "_parse", recording(parse))
+
+    async def write():
+        try:
+            await async_calendar.add(
+                uid=uid, start=now, end=now + timedelta(hours=1)
+            )
+            await async_calendar.update(
+                uid, start=now, end=now + timedelta(hours=2), rules=None
+            )
+            return await async_calendar.update(
+                uid, end=now + timedelta(hours=3)
+            )
+        finally:
+            await async_calendar.aclose()
+
+    assert asyncio.run(write()).end == now + timedelta(hours=3)
+    assert len(threads) == 3
+    assert threading.current_thread() not in threads
+
+
+@pytest.fixture
+def stamped(calendar, now):
+    for show, type in [(1, 1), (12, 1), (2, 2)]:
+        calendar.add(
+            uid=uuid4(),
+            start=now + timedelta(hours=show),
+            end=now + timedelta(hours=show, minutes=30),
+            rules={"freq": "daily"},
+            show=show,
+            type=type,
+        )
+    return calendar
+
+
+def test_search_filters_on_server(stamped, now):
+    from_date, to_date = now, now + timedelta(days=7)
+
+    # the server matches substrings, so show 12 is sent too
+    objects = stamped._search(from_date, to_date, filters={"show": 1})
+    assert len(objects) == 2
+    objects = stamped._search(from_date, to_date, filters={"type": 2})
+    assert len(objects) == 1
+
+    events = stamped.search(from_date, to_date, filters={"show": 1})
+    assert len(events) == 7
+    assert {event.show for event in events} == {1}
+    events = stamped.iter_search(from_date, to_date, 3, {"type": 1})
+    assert [(event.show, event.type) for event in events] == [
+        (1, 1),
+        (12, 1),
+        (1, 1),
+    ]
+
+
+def test_async_search_filters_like_sync(stamped, now):
+    calendar = AsyncCalendar(
+        stamped.url, stamped.name, stamped.user, stamped.password
+    )
+    from_date, to_date = now, now + timedelta(days=7)
+
+    async def search():
+        try:
+            return await calendar.search(from_date, to_date, {"show": 12})
+        finally:
+            await calendar.aclose()
+
+    expected = stamped.search(from_date, to_date, filters={"show": 12})
+    assert sorted(starts(asyncio.run(search()))) == sorted(starts(expected))
+
+
+@pytest.fixture
+def requests(calendar, monkeypatch):
+    sent = []
+    send = calendar.http.send
+
+    def counting_send(request, *args, **kwargs):
+        sent.append(request.method)
+        return send(request, *args, **kwargs)
+
+    monkeypatch.setattr(calendar.http, "send", counting_send)
+    return sent
+
+
+def test_dav_requests_and_ics_share_the_http_client(calendar, requests, now):
+    uid = uuid4()
+    calendar.add(uid=uid, start=now, end=now + timedelta(hours=1))
+    calendar.chunk_size = 64
+    requests.clear()
+
+    assert len(calendar.search(now, now + timedelta(hours=1))) == 1
+    chunks = list(calendar.ics())
+
+    # no login probes, everything goes through the pooled client
+    assert requests == ["REPORT", "GET"]
+    assert all(len(chunk) <= 64 for chunk in chunks)
+    assert str(uid).encode() in b"".join(chunks)
+
+
+def test_get_many_is_a_single_multiget(calendar, requests, now):
+    uids = [uuid4() for _ in range(3)]
+    for i, uid in enumerate(uids):
+        start = now + timedelta(hours=i)
+        calendar.add(uid=uid, start=start, end=start + timedelta(hours=1))
+    requests.clear()
+
+    events = calendar.get_many([*uids, uuid4(), uids[0]])
+
+    assert requests == ["REPORT"]
+    assert set(events) == set(uids)
+    assert [events[uid].start for uid in uids] == [
+        now + timedelta(hours=i) for i in range(3)
+    ]
+    assert calendar.get_many([]) == {}
+
+
+def test_update_is_a_single_put(calendar, requests, now):
+    uid = uuid4()
+    calendar.add(uid=uid, start=now, end=now + timedelta(hours=1))
+    _, etag = calendar.get_tagged(uid)
+    requests.clear()
+
+    event = calendar.update(
+        uid, etag, start=now, end=now + timedelta(hours=2), rules=None
+    )
+
+    assert requests == ["PUT"]
+    assert event.end == now + timedelta(hours=2)
+    assert calendar.get(uid).end == now + timedelta(hours=2)
+
+
+def test_update_needs_an_existing_event(calendar, async_calendar, now):
+    uid = uuid4()
+    params = {"start": now, "end": now + timedelta(hours=1), "rules": None}
+    calendar.add(uid=uid, **params)
+    calendar.delete(uid)
+
+    for missing in (uid, uuid4()):
+        with pytest.raises(CalendarError) as e:
+            calendar.update(missing, **params)
+        assert not isinstance(e.value, CalendarConflictError)
+        result = calendar.update_many([{"uid": missing, **params}])
+        assert set(result.failed) == {missing}
+        with pytest.raises(CalendarError):
+            asyncio.run(async_calendar.update(missing, **params))
+        assert calendar.get_many([missing]) == {}
+
+    # existing events are still updated without an ETag
+    calendar.add(uid=uid, **params)
+    calendar.update(uid, **{**params, "end": now + timedelta(hours=2)})
+    assert calendar.get(uid).end == now + timedelta(hours=2)
+
+
+def test_partial_update_is_conditional(calendar, requests, now):
+    uid = uuid4()
+    calendar.add(uid=uid, start=now, end=now + timedelta(hours=1))
+    requests.clear()
+
+    calendar.update(uid, end=now + timedelta(hours=2))
+
+    assert requests == ["GET", "PUT"]
+    assert calendar.get(uid).start == now
+
+
+def test_stale_etag_is_a_conflict(calendar, now):
+    uid = uuid4()
+    calendar.add(uid=uid, start=now, end=now + timedelta(hours=1))
+    _, etag = calendar._get(uid)
+    calendar.update(uid, end=now + timedelta(hours=2))
+
+    with pytest.raises(CalendarConflictError):
+        calendar.update(uid, etag=etag, end=now + timedelta(hours=3))
+    with pytest.raises(CalendarConflictError):
+        calendar.delete(uid, etag=etag)
+
+    calendar.delete(uid)
+    with pytest.raises(CalendarError):
+        calendar.get(uid)
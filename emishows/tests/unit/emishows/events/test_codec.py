@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta
+from uuid import uuid4
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from emishows.events import Calendar, CalendarError
+from emishows.events import codec
+
+RULES = [
+    None,
+    {"freq": "daily"},
+    {"freq": "weekly", "byday": ["MO", "WE"], "count": 10},
+    {
+        "freq": "monthly",
+        "bymonthday": [1, 15],
+        "until": datetime(2030, 1, 1, tzinfo=ZoneInfo("UTC")),
+    },
+]
+
+ZONES = ["Europe/Warsaw", "Etc/UTC", "UTC", "America/New_York"]
+
+
+def event_kwargs(zone: str, rules) -> dict:
+    start = datetime(2022, 3, 27, 1, 30, tzinfo=ZoneInfo(zone))
+    return {
+        "uid": uuid4(),
+        "start": start,
+        "end": start + timedelta(hours=2),
+        "rules": rules,
+    }
+
+
+@pytest.mark.parametrize("zone", ZONES)
+@pytest.mark.parametrize("rules", RULES)
+def test_encode_matches_icalendar(zone, rules):
+    kwargs = event_kwargs(zone, rules)
+    event = Calendar._validate(**kwargs)
+
+    assert codec.encode(event) == Calendar._new_calendar(**kwargs).to_ical()
+
+
+@pytest.mark.parametrize("zone", ZONES)
+@pytest.mark.parametrize("rules", RULES)
+def test_decode_matches_icalendar(zone, rules):
+    data = Calendar._new_calendar(**event_kwargs(zone, rules)).to_ical()
+    calendar = Calendar._parse(data)
+
+    expected = Calendar._map_vevent(Calendar._retrieve_vevent(calendar))
+
+    assert codec.decode(data) == expected
+    assert codec.decode(data).start.tzinfo == expected.start.tzinfo
+
+
+def test_stamps_match_icalendar():
+    kwargs = {**event_kwargs("Europe/Warsaw", None), "show": 12, "type": 2}
+    data = Calendar._new_calendar(**kwargs).to_ical()
+
+    assert codec.encode(Calendar._validate(**kwargs)) == data
+    assert codec.decode(data) == Calendar._validate(**kwargs)
+
+
+def test_decode_without_timezone_uses_utc():
+    uid = uuid4()
+    data = (
+        "BEGIN:VCALENDAR\r\nBEGIN:VEVENT\r\n"
+        "DTSTART:20220101T100000\r\nDTEND:20220101T110000\r\n"
+        f"UID:{uid}\r\nEND:VEVENT\r\nEND:VCALENDAR\r\n"
+    )
+
+    event = codec.decode(data)
+
+    assert event.uid == uid
+    assert event.start == datetime(2022, 1, 1, 10, tzinfo=ZoneInfo("UTC"))
+    assert event.end.tzinfo.key == "Etc/UTC"
+
+
+def vevent_data(uid, *lines: str) -> str:
+    return "\r\n".join(
+        [
+            "BEGIN:VCALENDAR",
+            "BEGIN:VEVENT",
+            f"UID:{uid}",
+            *lines,
+            "END:VEVENT",
+            "END:VCALENDAR",
+            "",
+        ]
+    )
+
+
+def test_unsupported_content_falls_back_to_icalendar():
+    uid = uuid4()
+    data = vevent_data(
+        uid,
+        "DTSTART:20220101T100000Z",
+        "DTEND:20220101T110000Z",
+        "RECURRENCE-ID:20220101T100000Z",
+    )
+
+    with pytest.raises(codec.UnsupportedContent):
+        codec.decode(data)
+    assert Calendar._decode(data).uid == uid
+
+
+@pytest.mark.parametrize(
+    "lines",
+    [
+        ["DTSTART;VALUE=DATE:20220101", "DTEND;VALUE=DATE:20220102"],
+        ["DTSTART:20220101T100000Z", "DURATION:PT1H"],
+    ],
+)
+def test_fallback_rejects_events_outside_schema(lines):
+    data = vevent_data(uuid4(), *lines)
+
+    with pytest.raises(codec.UnsupportedContent):
+        codec.decode(data)
+    with pytest.raises(CalendarError):
+        Calendar._decode(data)
+
+
+def test_invalid_timezone():
+    data = (
+        "BEGIN:VCALENDAR\r\nBEGIN:VEVENT\r\n"
+        "DTSTART;TZID=Mars/Olympus:20220101T100000\r\n"
+        "DTEND;TZID=Mars/Olympus:20220101T110000\r\n"
+        f"UID:{uuid4()}\r\nEND:VEVENT\r\nEND:VCALENDAR\r\n"
+    )
+
+    with pytest.raises(CalendarError):
+        Calendar._decode(data)
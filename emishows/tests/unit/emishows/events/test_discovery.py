@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from emishows.events import AsyncCalendar, Calendar, CalendarError, URLStore
+from emishows.events.discovery import Retry
+
+
+@pytest.fixture
+def store(tmp_path) -> URLStore:
+    return URLStore(tmp_path / "calendars.json")
+
+
+def connect(calendar: Calendar, store: URLStore, **kwargs) -> Calendar:
+    return Calendar(
+        calendar.url,
+        calendar.name,
+        calendar.user,
+        calendar.password,
+        store=store,
+        **kwargs,
+    )
+
+
+def propfinds(calendar: Calendar, monkeypatch) -> list:
+    sent = []
+    send = calendar.http.send
+
+    def counting_send(request, *args, **kwargs):
+        if request.method == "PROPFIND":
+            sent.append(str(request.url))
+        return send(request, *args, **kwargs)
+
+    monkeypatch.setattr(calendar.http, "send", counting_send)
+    return sent
+
+
+def test_calendar_is_discovered_on_first_use(calendar, store, monkeypatch):
+    connected = connect(calendar, store)
+    sent = propfinds(connected, monkeypatch)
+    assert not connected.ready
+    assert not sent
+
+    connected.ctag()
+    assert connected.ready
+    assert len(sent) == 3
+    assert store.get(connected.discovery.key) == str(calendar.calendar.url)
+
+
+def test_discovered_url_is_reused_after_restart(calendar, store, monkeypatch):
+    connect(calendar, store).resolve()
+
+    restarted = connect(calendar, store)
+    sent = propfinds(restarted, monkeypatch)
+    restarted.ctag()
+    assert sent == [str(calendar.calendar.url)]
+
+
+def test_outdated_url_is_discovered_again(calendar, store):
+    connected = connect(calendar, store)
+    store.set(connected.discovery.key, f"{calendar.url}/user/missing/")
+
+    with pytest.raises(CalendarError):
+        connected.ctag()
+    assert connected.ctag() == calendar.ctag()
+
+
+def test_discovery_is_retried(calendar, store, monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+    connected = connect(calendar, store, retry=Retry(attempts=3))
+    failures = []
+    propfind = connected._propfind
+
+    def flaky_propfind(url, query):
+        if len(failures) < 2:
+            failures.append(url)
+            raise CalendarError("Can't connect to calendar server.")
+        return propfind(url, query)
+
+    monkeypatch.setattr(connected, "_propfind", flaky_propfind)
+    connected.resolve()
+    assert len(failures) == 2
+
+    unreachable = Calendar("http://127.0.0.1:9", "missing", store=store)
+    with pytest.raises(CalendarError):
+        unreachable.resolve()
+    assert not unreachable.ready
+
+
+def test_async_calendar_shares_stored_url(calendar, store):
+    connect(calendar, store).resolve()
+    connected = AsyncCalendar(
+        calendar.url,
+        calendar.name,
+        calendar.user,
+        calendar.password,
+        store=URLStore(store.path),
+    )
+
+    async def search():
+        try:
+            return await connected.calendar_url()
+        finally:
+            await connected.aclose()
+
+    assert asyncio.run(search()) == str(calendar.calendar.url)
+    assert connected.discovery.stored
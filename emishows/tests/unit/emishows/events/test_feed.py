@@ -0,0 +1,60 @@
+import asyncio
+import threading
+from uuid import uuid4
+
+from emishows.events import Change, ChangeFeed
+from emishows.events.feed import RESET
+
+
+def created() -> Change:
+    return Change("created", uuid4(), [])
+
+
+def test_changes_are_delivered_to_all_subscribers():
+    feed = ChangeFeed()
+    changes = [created(), created()]
+
+    async def consume():
+        subscriptions = [feed.subscribe() for _ in range(3)]
+        # published from another thread, like the mirror does
+        thread = threading.Thread(target=feed.publish, args=(changes,))
+        thread.start()
+        thread.join()
+        received = []
+        for subscription in subscriptions:
+            received.append([await subscription.get() for _ in changes])
+        return received
+
+    received = asyncio.run(consume())
+    assert received == [[(1, changes[0]), (2, changes[1])]] * 3
+
+
+def test_missed_changes_are_replayed():
+    feed = ChangeFeed(history=2)
+    changes = [created() for _ in range(3)]
+    feed.publish(changes)
+
+    async def replay(last):
+        subscription = feed.subscribe(last)
+        messages = []
+        while not subscription.queue.empty():
+            messages.append(await subscription.get())
+        return messages
+
+    assert asyncio.run(replay(3)) == []
+    assert asyncio.run(replay(2)) == [(3, changes[2])]
+    # forgotten or unknown changes can't be replayed
+    assert asyncio.run(replay(0)) == [(3, RESET)]
+    assert asyncio.run(replay(7)) == [(3, RESET)]
+
+
+def test_slow_subscriber_is_reset():
+    feed = ChangeFeed(maxsize=2)
+
+    async def consume():
+        subscription = feed.subscribe()
+        feed.publish([created() for _ in range(3)])
+        await asyncio.sleep(0)
+        return [await subscription.get()] + [subscription.queue.qsize() == 0]
+
+    assert asyncio.run(consume()) == [(3, RESET), True]
@@ -0,0 +1,161 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+
+from emishows.events import AsyncCalendar
+from emishows.events.flight import SingleFlight
+from emishows.utils import utcnow
+
+CALLERS = 10
+
+
+@pytest.fixture
+def now() -> datetime:
+    return utcnow().replace(minute=0, second=0, microsecond=0)
+
+
+def slow(handle, sent: list, delay: float = 0.2):
+    """Counts requests and delays them, so concurrent callers overlap."""
+
+    def handle_request(request):
+        sent.append(request.method)
+        time.sleep(delay)
+        return handle(request)
+
+    return handle_request
+
+
+def concurrently(function, callers: int = CALLERS) -> list:
+    barrier = threading.Barrier(callers)
+
+    def call():
+        barrier.wait()
+        return function()
+
+    with ThreadPoolExecutor(callers) as executor:
+        futures = [executor.submit(call) for _ in range(callers)]
+    return [future.result() for future in futures]
+
+
+def test_concurrent_reads_share_one_request(calendar, now, monkeypatch):
+    uid = uuid4()
+    calendar.add(uid=uid, start=now, end=now + timedelta(hours=1))
+    calendar.resolve()
+    sent = []
+    transport = calendar.http._transport
+    monkeypatch.setattr(
+        transport, "handle_request", slow(transport.handle_request, sent)
+    )
+    window = (now - timedelta(days=1), now + timedelta(days=1))
+
+    searches = concurrently(lambda: calendar.search(*window))
+    assert sent == ["REPORT"]
+    assert all(events == searches[0] for events in searches)
+    assert len(searches[0]) == 1
+    # every caller gets a list of its own
+    assert len({id(events) for events in searches}) == CALLERS
+
+    events = concurrently(lambda: calendar.get(uid))
+    assert sent == ["REPORT", "GET"]
+    assert {event.uid for event in events} == {uid}
+
+    content = concurrently(calendar.download)
+    assert sent == ["REPORT", "GET", "GET"]
+    assert len(set(content)) == 1
+
+
+def test_concurrent_lazy_searches_share_one_request(
+    calendar, now, monkeypatch
+):
+    calendar.add(uid=uuid4(), start=now, end=now + timedelta(hours=1))
+    calendar.resolve()
+    sent = []
+    transport = calendar.http._transport
+    monkeypatch.setattr(
+        transport, "handle_request", slow(transport.handle_request, sent)
+    )
+    window = (now - timedelta(days=1), now + timedelta(days=1))
+
+    searches = concurrently(lambda: list(calendar.iter_search(*window)))
+    assert sent == ["REPORT"]
+    assert len(searches[0]) == 1
+    assert all(events == searches[0] for events in searches)
+
+
+def test_reads_after_writes_are_not_shared():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def first():
+        started.set()
+        release.wait()
+        return "before"
+
+    with ThreadPoolExecutor(1) as executor:
+        future = executor.submit(flights.do, (0, "search"), first)
+        started.wait()
+        # a write bumped the counter in the key
+        assert flights.do((1, "search"), lambda: "after") == "after"
+        release.set()
+    assert future.result() == "before"
+
+
+def test_errors_are_shared():
+    flights = SingleFlight()
+
+    def fail():
+        time.sleep(0.2)
+        raise ValueError("failed")
+
+    calls = []
+
+    def call():
+        try:
+            flights.do("key", lambda: calls.append(1) or fail())
+        except ValueError as e:
+            return e
+
+    errors = concurrently(call, 4)
+    assert len(calls) == 1
+    assert all(isinstance(error, ValueError) for error in errors)
+
+
+def test_concurrent_async_searches_share_one_request(calendar, now):
+    calendar.add(uid=uuid4(), start=now, end=now + timedelta(hours=1))
+    client = AsyncCalendar(
+        calendar.url, calendar.name, calendar.user, calendar.password
+    )
+    window = (now - timedelta(days=1), now + timedelta(days=1))
+    sent = []
+
+    async def search():
+        await client.calendar_url()
+        transport = client._client()._transport
+        handle = transport.handle_async_request
+
+        async def handle_async_request(request):
+            sent.append(request.method)
+            await asyncio.sleep(0.2)
+            return await handle(request)
+
+        transport.handle_async_request = handle_async_request
+        try:
+            searches = await asyncio.gather(
+                *(client.search(*window) for _ in range(CALLERS))
+            )
+            lazy = await asyncio.gather(
+                *(client.iter_search(*window) for _ in range(CALLERS))
+            )
+            return searches, [list(events) for events in lazy]
+        finally:
+            await client.aclose()
+
+    searches, lazy = asyncio.run(search())
+    assert sent == ["REPORT", "REPORT"]
+    assert len(searches[0]) == 1
+    assert all(events == searches[0] for events in searches + lazy)
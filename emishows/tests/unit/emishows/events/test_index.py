@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from emishows.events import Event
+from emishows.events.index import conflicts, gaps
+from emishows.utils import utczone
+
+START = datetime(2022, 1, 1, tzinfo=utczone())
+
+
+def event(start: int, end: int, uid=None) -> Event:
+    return Event(
+        uid=uid or uuid4(),
+        start=START + timedelta(hours=start),
+        end=START + timedelta(hours=end),
+    )
+
+
+def test_conflicts_pairs_overlapping_events():
+    a, b, c, d = event(0, 3), event(1, 2), event(2, 4), event(4, 5)
+    pairs = conflicts([d, c, b, a])
+    assert {(x.uid, y.uid) for x, y in pairs} == {
+        (a.uid, b.uid),
+        (a.uid, c.uid),
+    }
+
+
+def test_conflicts_with_other_events():
+    uid = uuid4()
+    mine = [event(0, 2, uid), event(24, 26, uid)]
+    theirs = [event(1, 3), event(2, 24), event(25, 25), event(0, 1, uid)]
+    pairs = conflicts(mine, theirs)
+    assert [(x, y) for x, y in pairs] == [
+        (mine[0], theirs[0]),
+        (mine[1], theirs[2]),
+    ]
+
+
+def test_gaps_between_busy_intervals():
+    busy = [event(1, 3), event(2, 4), event(6, 7), event(8, 12)]
+    slots = gaps(busy, START, START + timedelta(hours=10))
+    assert [(s.hour, e.hour) for s, e in slots] == [(0, 1), (4, 6), (7, 8)]
+
+    slots = gaps(busy, START, START + timedelta(hours=10), timedelta(hours=2))
+    assert [(s.hour, e.hour) for s, e in slots] == [(4, 6)]
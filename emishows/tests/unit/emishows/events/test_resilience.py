@@ -0,0 +1,156 @@
+import asyncio
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import httpx
+import pytest
+
+from emishows.events import (
+    AsyncCalendar,
+    Calendar,
+    CalendarError,
+    CalendarUnavailableError,
+    CircuitBreaker,
+    StaleResults,
+)
+from emishows.events import resilience
+from emishows.utils import utcnow
+
+
+@pytest.fixture
+def now() -> datetime:
+    return utcnow().replace(minute=0, second=0, microsecond=0)
+
+
+@pytest.fixture
+def resilient(calendar) -> Calendar:
+    return Calendar(
+        calendar.url,
+        calendar.name,
+        calendar.user,
+        calendar.password,
+        breaker=CircuitBreaker(threshold=2, reset=60),
+        stale=StaleResults(),
+    )
+
+
+def fail(sent: list):
+    def handle_request(request):
+        sent.append(request)
+        raise httpx.ConnectError("Connection refused.", request=request)
+
+    return handle_request
+
+
+def outage(calendar: Calendar, monkeypatch) -> list:
+    """Makes the server unreachable, returning requests that were sent."""
+
+    sent = []
+    # the breaker wraps the transport that would send the request
+    transport = calendar.http._transport.transport
+    monkeypatch.setattr(transport, "handle_request", fail(sent))
+    return sent
+
+
+def test_breaker_opens_after_threshold_and_probes(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: clock[0])
+    breaker = CircuitBreaker(threshold=2, reset=10)
+
+    breaker.failure()
+    assert breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    clock[0] = 10
+    assert breaker.state == "half-open"
+    # only one request probes the server
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open"
+
+    clock[0] = 20
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_reads_are_served_stale_during_outage(resilient, now, monkeypatch):
+    uid = uuid4()
+    resilient.add(uid=uid, start=now, end=now + timedelta(hours=1))
+    found = resilient.search(now - timedelta(days=1), now + timedelta(days=1))
+    event = resilient.get(uid)
+
+    sent = outage(resilient, monkeypatch)
+    resilience.reset_stale()
+    assert resilience.stale_age() is None
+    assert resilient.search(now, now + timedelta(hours=2)) == found
+    assert resilient.get(uid) == event
+    assert resilient.get_many([uid]) == {uid: event}
+    assert resilience.stale_age() is not None
+
+    with pytest.raises(CalendarUnavailableError):
+        resilient.get_many([uid], allow_stale=False)
+    # the circuit opened, so later reads don't wait for the server
+    assert len(sent) == 2
+    assert resilient.breaker.state == "open"
+
+
+def test_uncovered_reads_fail_fast(resilient, now, monkeypatch):
+    resilient.search(now, now + timedelta(days=1))
+
+    sent = outage(resilient, monkeypatch)
+    for _ in range(3):
+        with pytest.raises(CalendarUnavailableError):
+            resilient.search(now, now + timedelta(days=2))
+        with pytest.raises(CalendarUnavailableError):
+            resilient.get(uuid4())
+    assert len(sent) == 2
+
+
+def test_deleted_events_are_not_served_stale(resilient, now):
+    uid = uuid4()
+    resilient.add(uid=uid, start=now, end=now + timedelta(hours=1))
+    resilient.get(uid)
+
+    # deleted by another client, so the server answers 404
+    other = Calendar(
+        resilient.url, resilient.name, resilient.user, resilient.password
+    )
+    other.delete(uid)
+    with pytest.raises(CalendarError) as info:
+        resilient.get(uid)
+    assert not isinstance(info.value, CalendarUnavailableError)
+
+
+def test_async_search_is_served_stale(resilient, now):
+    calendar = AsyncCalendar(
+        resilient.url,
+        resilient.name,
+        resilient.user,
+        resilient.password,
+        breaker=CircuitBreaker(threshold=2, reset=60),
+        stale=StaleResults(),
+    )
+    resilient.add(uid=uuid4(), start=now, end=now + timedelta(hours=1))
+    window = (now - timedelta(days=1), now + timedelta(days=1))
+
+    async def search():
+        found = await calendar.search(*window)
+        sent = []
+        transport = calendar._client()._transport.transport
+        transport.handle_async_request = fail(sent)
+        resilience.reset_stale()
+        try:
+            stale = await calendar.search(*window)
+            return found, stale, sent, resilience.stale_age()
+        finally:
+            await calendar.aclose()
+
+    found, stale, sent, age = asyncio.run(search())
+    assert stale == found
+    assert len(sent) == 1
+    assert age is not None
@@ -0,0 +1,151 @@
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+from django.core.cache.backends.locmem import LocMemCache
+
+from emishows.events import CalendarMirror
+from emishows.utils import utcnow
+
+
+@pytest.fixture
+def now() -> datetime:
+    return utcnow().replace(minute=0, second=0, microsecond=0)
+
+
+def test_mirror_indexes_occurrences(calendar, now):
+    daily = uuid4()
+    calendar.add(
+        uid=daily,
+        start=now,
+        end=now + timedelta(hours=1),
+        rules={"freq": "daily"},
+    )
+    calendar.add(
+        uid=uuid4(),
+        start=now + timedelta(hours=2),
+        end=now + timedelta(hours=3),
+    )
+    mirror = CalendarMirror(calendar)
+    mirror.sync()
+
+    events = mirror.search(now, now + timedelta(days=3))
+    assert len(events) == 4
+    assert [event.start for event in events] == sorted(
+        event.start for event in events
+    )
+    assert mirror.search(now, now + timedelta(days=365)) is None
+
+
+def test_mirror_pulls_only_changes(calendar, now, monkeypatch):
+    uids = [uuid4() for _ in range(3)]
+    for i, uid in enumerate(uids):
+        start = now + timedelta(days=i)
+        calendar.add(uid=uid, start=start, end=start + timedelta(hours=1))
+    mirror = CalendarMirror(calendar)
+    mirror.sync()
+
+    fetched = []
+    multiget = calendar.calendar.calendar_multiget
+
+    def spy(urls):
+        fetched.extend(urls)
+        return multiget(urls)
+
+    monkeypatch.setattr(calendar.calendar, "calendar_multiget", spy)
+    calendar.update(uids[0], start=now - timedelta(hours=1))
+    calendar.delete(uids[1])
+    assert mirror.sync()
+    assert len(fetched) == 1
+
+    events = mirror.search(now - timedelta(days=1), now + timedelta(days=3))
+    assert [event.uid for event in events] == [uids[0], uids[2]]
+
+
+def test_mirror_skips_malformed_objects(calendar, now, monkeypatch):
+    uid = uuid4()
+    calendar.add(uid=uid, start=now, end=now + timedelta(hours=1))
+    mirror = CalendarMirror(calendar)
+    fetch = mirror._fetch
+
+    def malformed(urls):
+        fetched = fetch(urls)
+        fetched["/malformed.ics"] = "BEGIN:VCALENDAR\nnot a property"
+        return fetched
+
+    monkeypatch.setattr(mirror, "_fetch", malformed)
+    mirror.sync()
+
+    events = mirror.search(now, now + timedelta(days=1))
+    assert [event.uid for event in events] == [uid]
+
+
+def test_mirror_search_needs_no_network(calendar, now, monkeypatch):
+    calendar.add(uid=uuid4(), start=now, end=now + timedelta(hours=1))
+    mirror = CalendarMirror(calendar)
+    mirror.sync()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("Unexpected request.")
+
+    monkeypatch.setattr(calendar.calendar.client, "request", fail)
+    assert len(mirror.search(now, now + timedelta(days=1))) == 1
+
+
+def test_mirror_publishes_changes(calendar, now):
+    mirror = CalendarMirror(calendar)
+    published = []
+    mirror.listeners.append(published.extend)
+    kept, deleted = uuid4(), uuid4()
+    for uid in (kept, deleted):
+        calendar.add(uid=uid, start=now, end=now + timedelta(hours=1))
+    mirror.sync()
+    assert published == []
+
+    created = uuid4()
+    calendar.add(
+        uid=created,
+        start=now,
+        end=now + timedelta(hours=1),
+        rules={"freq": "daily", "count": 2},
+    )
+    calendar.update(kept, end=now + timedelta(hours=2))
+    calendar.delete(deleted)
+    mirror.sync()
+
+    changes = {change.uid: change for change in published}
+    assert changes[created].kind == "created"
+    assert len(changes[created].occurrences) == 2
+    assert changes[kept].kind == "updated"
+    assert changes[kept].occurrences[0].end == now + timedelta(hours=2)
+    assert changes[deleted].kind == "deleted"
+    assert len(published) == 3
+
+
+def test_only_one_mirror_syncs_with_the_server(calendar, now, monkeypatch):
+    backend = LocMemCache(uuid4().hex, {})
+    leader = CalendarMirror(calendar, backend=backend)
+    follower = CalendarMirror(calendar, backend=backend)
+    published = []
+    follower.listeners.append(published.extend)
+    calendar.add(uid=uuid4(), start=now, end=now + timedelta(hours=1))
+    leader.sync()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("Unexpected request.")
+
+    request = calendar.calendar.client.request
+    monkeypatch.setattr(calendar.calendar.client, "request", fail)
+    follower.sync()
+    assert len(follower.search(now, now + timedelta(days=1))) == 1
+
+    monkeypatch.setattr(calendar.calendar.client, "request", request)
+    created = uuid4()
+    calendar.add(uid=created, start=now, end=now + timedelta(hours=1))
+    leader.sync()
+    monkeypatch.setattr(calendar.calendar.client, "request", fail)
+    assert follower.sync()
+    assert len(follower.search(now, now + timedelta(days=1))) == 2
+    assert [(change.kind, change.uid) for change in published] == [
+        ("created", created)
+    ]
@@ -0,0 +1,116 @@
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+
+from emishows.events import Calendar, CalendarConflictError, CalendarError
+from emishows.events.sync import CalendarMirror
+from emishows.loadtest.runner import Options, run
+from emishows.loadtest.server import FakeCalDAVServer
+from emishows.loadtest.traffic import (
+    ENDPOINTS,
+    Sample,
+    parse_mix,
+    percentile,
+    summarize,
+)
+from emishows.utils import utcnow
+
+
+@pytest.fixture
+def now() -> datetime:
+    return utcnow().replace(minute=0, second=0, microsecond=0)
+
+
+@pytest.fixture
+def caldav():
+    with FakeCalDAVServer() as server:
+        yield server
+
+
+@pytest.fixture
+def calendar(caldav):
+    calendar = Calendar(caldav.url, caldav.app.name, "user", "password")
+    yield calendar
+    calendar.close()
+
+
+def test_percentiles_and_summary():
+    values = list(range(1, 101))
+    assert [percentile(values, q) for q in (50, 95, 99, 100)] == [
+        50,
+        95,
+        99,
+        100,
+    ]
+    assert percentile([7], 99) == 7
+
+    samples = [Sample("ics", 200, 0.01), Sample("ics", 500, 0.03)]
+    report = summarize(samples, duration=2)
+    assert report["total"]["throughput"] == 1
+    assert report["endpoints"]["ics"]["errors"] == 1
+    assert report["endpoints"]["ics"]["latency_ms"]["p99"] == 30
+
+
+def test_parse_mix():
+    assert parse_mix("timetable=3, ics") == {"timetable": 3, "ics": 1}
+    with pytest.raises(ValueError):
+        parse_mix("unknown=1")
+    with pytest.raises(ValueError):
+        parse_mix("ics=0")
+
+
+def test_fake_server_serves_calendar_clients(calendar, now):
+    uid, other = uuid4(), uuid4()
+    calendar.add(
+        uid=uid,
+        start=now,
+        end=now + timedelta(hours=1),
+        rules={"freq": "daily"},
+        show=1,
+    )
+    calendar.add(uid=other, start=now, end=now + timedelta(hours=1), show=2)
+    window = (now + timedelta(days=1), now + timedelta(days=3))
+
+    assert {event.uid for event in calendar.search(*window)} == {uid}
+    assert calendar.search(*window, filters={"show": 2}) == []
+    assert calendar.get(other).show == 2
+    assert set(calendar.get_many([uid, uuid4()])) == {uid}
+    with pytest.raises(CalendarConflictError):
+        calendar.add(uid=uid, start=now, end=now + timedelta(hours=1))
+
+    mirror = CalendarMirror(calendar)
+    assert mirror.sync()
+    hour = (now, now + timedelta(hours=1))
+    assert {event.uid for event in mirror.search(*hour)} == {uid, other}
+    ctag = calendar.ctag()
+    calendar.delete(other)
+    assert calendar.ctag() != ctag
+    assert mirror.sync()
+    assert {event.uid for event in mirror.search(*hour)} == {uid}
+    with pytest.raises(CalendarError):
+        calendar.get(other)
+    assert str(uid).encode() in calendar.download()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_run_reports_every_endpoint():
+    report = run(
+        Options(
+            duration=1,
+            warmup=0.2,
+            concurrency=4,
+            events=20,
+            shows=3,
+            latency=0.001,
+        ),
+        migrate=False,
+    )
+
+    assert set(report["endpoints"]) == set(ENDPOINTS)
+    assert report["total"]["requests"] > 0
+    assert report["total"]["errors"] == 0
+    assert report["calendar"]["requests"] > 0
+    for stats in report["endpoints"].values():
+        latency = stats["latency_ms"]
+        assert latency["p50"] <= latency["p95"] <= latency["p99"]
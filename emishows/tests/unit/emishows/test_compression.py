@@ -0,0 +1,60 @@
+import gzip
+
+import brotli
+import pytest
+import zstandard
+
+from emishows.compression import compress, compress_sequence, negotiate
+
+DECOMPRESSORS = {
+    "gzip": gzip.decompress,
+    "br": brotli.decompress,
+    "zstd": lambda data: zstandard.ZstdDecompressor()
+    .decompressobj()
+    .decompress(data),
+}
+
+
+@pytest.mark.parametrize(
+    "header,expected",
+    [
+        ("", None),
+        ("identity", None),
+        ("gzip, deflate", "gzip"),
+        ("gzip, br", "br"),
+        ("gzip, br, zstd", "zstd"),
+        ("gzip;q=1.0, br;q=0.5, zstd;q=0", "gzip"),
+        ("*", "zstd"),
+    ],
+)
+def test_negotiate(header, expected):
+    assert negotiate(header) == expected
+
+
+@pytest.mark.parametrize("encoding", DECOMPRESSORS)
+def test_compress_roundtrip(encoding):
+    data = b"BEGIN:VEVENT\r\nEND:VEVENT\r\n" * 100
+    decompress = DECOMPRESSORS[encoding]
+
+    assert decompress(compress(data, encoding)) == data
+    chunks = compress_sequence([data[:1000], data[1000:]], encoding)
+    assert decompress(b"".join(chunks)) == data
+
+
+@pytest.mark.parametrize("encoding", DECOMPRESSORS)
+def test_streamed_content_compresses_like_whole_content(encoding):
+    # like timetable entries, which are streamed one at a time
+    items = [
+        b'{"id":"%04d","show":{"id":1,"title":"Show"},"params":{"start":'
+        b'"2022-01-01T10:00:00 Europe/Warsaw","end":'
+        b'"2022-01-01T11:00:00 Europe/Warsaw","rules":null}},' % i
+        for i in range(2000)
+    ]
+    data = b"".join(items)
+
+    chunks = list(compress_sequence(items, encoding))
+
+    assert DECOMPRESSORS[encoding](b"".join(chunks)) == data
+    assert len(b"".join(chunks)) < 2 * len(compress(data, encoding))
+    # large bodies are still sent in parts
+    assert len([chunk for chunk in chunks if chunk]) > 1
@@ -0,0 +1,77 @@
+import os
+
+import pytest
+from typer.testing import CliRunner
+
+from emishows import __main__ as main
+from emishows.config import config
+from emishows.events import SearchCache, SharedSearchCache
+
+
+@pytest.mark.parametrize(
+    "url, cache", [("", SearchCache), ("redis://cache", SharedSearchCache)]
+)
+def test_search_cache_is_shared_only_with_shared_backend(
+    monkeypatch, url, cache
+):
+    monkeypatch.setattr(config, "cache_url", url)
+    assert type(main.search_cache()) is cache
+
+
+def test_failed_migrations_stop_the_server(monkeypatch):
+    started = []
+
+    def failing_migrate(*args, **kwargs):
+        raise RuntimeError("Database is gone.")
+
+    monkeypatch.setattr(main, "call_command", failing_migrate)
+    monkeypatch.setattr(main.uvicorn, "run", lambda *a, **k: started.append(a))
+
+    result = CliRunner().invoke(main.cli, ["--migrate"])
+
+    assert result.exit_code == 1
+    assert started == []
+
+
+def test_migrations_are_applied_before_workers_start(monkeypatch):
+    calls = []
+    monkeypatch.setattr(main, "call_command", lambda *a: calls.append(a[0]))
+    monkeypatch.setattr(
+        main.uvicorn, "run", lambda *a, **k: calls.append("run")
+    )
+
+    result = CliRunner().invoke(main.cli, ["--workers", "2", "--migrate"])
+
+    assert result.exit_code == 0
+    assert calls == ["migrate", "run"]
+
+
+def test_startup_does_not_wait_for_migrations(monkeypatch):
+    calls = []
+    monkeypatch.setattr(main, "call_command", lambda *a: calls.append(a[0]))
+    monkeypatch.setattr(
+        main.uvicorn, "run", lambda *a, **k: calls.append("run")
+    )
+
+    result = CliRunner().invoke(main.cli, [])
+
+    assert result.exit_code == 0
+    assert calls == ["run"]
+
+
+def test_workers_share_metrics(monkeypatch):
+    monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR", raising=False)
+    paths = []
+
+    def run(*args, **kwargs):
+        path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+        assert os.path.isdir(path)
+        paths.append(path)
+
+    monkeypatch.setattr(main.uvicorn, "run", run)
+
+    result = CliRunner().invoke(main.cli, ["--workers", "2"])
+
+    assert result.exit_code == 0
+    assert "PROMETHEUS_MULTIPROC_DIR" not in os.environ
+    assert not os.path.exists(paths[0])
@@ -0,0 +1,129 @@
+from datetime import datetime, timedelta
+from uuid import uuid4
+from zoneinfo import ZoneInfo
+
+import pytest
+from prometheus_client import REGISTRY
+from prometheus_client.values import MultiProcessValue
+
+from emishows.app.models import Event, Show
+from emishows.events import SearchCache, async_calendars, calendars, mirrors
+from emishows.metrics import Timings
+
+START = datetime(2022, 1, 1, 10, tzinfo=ZoneInfo("Europe/Warsaw"))
+
+
+@pytest.fixture
+def emitimes(calendar, async_calendar, monkeypatch):
+    monkeypatch.setitem(calendars, "emitimes", calendar)
+    monkeypatch.setitem(async_calendars, "emitimes", async_calendar)
+    monkeypatch.delitem(mirrors, "emitimes", raising=False)
+    show = Show.objects.create(label="show", title="Show")
+    event = Event.objects.create(id=uuid4(), show=show, type=Event.Type.LIVE)
+    calendar.add(
+        uid=event.id,
+        start=START,
+        end=START + timedelta(hours=1),
+        rules={"freq": "daily"},
+    )
+    return calendar
+
+
+def server_timing(response) -> dict:
+    steps = {}
+    for metric in response.headers["Server-Timing"].split(", "):
+        name, duration, *_ = metric.split(";")
+        steps[name] = float(duration.removeprefix("dur="))
+    return steps
+
+
+def test_timings_header():
+    timings = Timings()
+    timings.add("db", 0.002)
+    timings.add("db", 0.001)
+
+    header = timings.header()
+
+    assert header.startswith('db;dur=3.000;desc="2x", total;dur=')
+
+
+@pytest.mark.django_db
+def test_events_report_server_timing(client, emitimes):
+    response = client.get("/events/")
+
+    assert response.status_code == 200
+    steps = server_timing(response)
+    assert {"db", "caldav", "calendar.get_many", "serialize"} <= set(steps)
+    assert {"render", "total"} <= set(steps)
+    assert steps["total"] >= steps["calendar.get_many"] >= steps["caldav"]
+
+
+@pytest.mark.django_db
+def test_timetable_reports_calendar_and_expansion(client, emitimes):
+    def sample(name, **labels):
+        return REGISTRY.get_sample_value(f"emishows_{name}", labels) or 0
+
+    def samples():
+        return (
+            sample("occurrences_expanded_total"),
+            sample("expansion_duration_seconds_sum"),
+            sample(
+                "calendar_call_duration_seconds_count", method="iter_search"
+            ),
+            sample("calendar_call_duration_seconds_sum", method="iter_search"),
+        )
+
+    before = samples()
+
+    response = client.get(
+        "/timetable/?from=2022-01-01T00:00:00&to=2022-01-04T00:00:00"
+    )
+
+    assert response.status_code == 200
+    assert "caldav" in server_timing(response)
+    # occurrences are expanded while the body is sent, after the headers,
+    # and the search is recorded once it is done
+    assert samples()[2] == before[2]
+    assert len(b"".join(response.streaming_content)) > 2
+    expanded, expansion, calls, duration = (
+        after - value for after, value in zip(samples(), before)
+    )
+    assert expanded == 3
+    assert calls == 1
+    assert duration >= expansion > 0
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint(client, emitimes, monkeypatch):
+    monkeypatch.setattr(emitimes, "cache", SearchCache())
+    window = START, START + timedelta(days=1)
+    emitimes.search(*window)
+    emitimes.search(*window)
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    content = response.content.decode()
+    assert 'emishows_caldav_requests_total{method="PUT",status="201"}' in (
+        content
+    )
+    assert (
+        'emishows_cache_lookups_total{cache="search",result="hit"}' in content
+    )
+    assert "emishows_db_query_duration_seconds_count" in content
+
+
+def test_metrics_of_all_workers_are_exposed(client, monkeypatch, tmp_path):
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    # values like the ones that worker processes write to files
+    for pid in (1, 2):
+        name = "emishows_test_total"
+        value = MultiProcessValue(lambda: pid)(
+            "counter", name, name, (), (), "Test."
+        )
+        value.inc(1)
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert "emishows_test_total 2.0" in response.content.decode()
@@ -0,0 +1,95 @@
+import asyncio
+import json
+from datetime import timedelta
+from uuid import uuid4
+
+import pytest
+
+from emishows.events import Change, ChangeFeed, Event, feeds
+from emishows.push import PushRouter
+from emishows.utils import utcnow
+
+
+@pytest.fixture
+def feed(monkeypatch) -> ChangeFeed:
+    feed = ChangeFeed()
+    monkeypatch.setitem(feeds, "emitimes", feed)
+    return feed
+
+
+def change() -> Change:
+    now = utcnow().replace(microsecond=0)
+    event = Event(uid=uuid4(), start=now, end=now + timedelta(hours=1))
+    return Change("updated", event.uid, [event])
+
+
+async def fallback(scope, receive, send):
+    await send({"type": "fallback"})
+
+
+def scope(kind: str, path: str = "/timetable/changes", **kwargs) -> dict:
+    return {
+        "type": kind,
+        "path": path,
+        "method": "GET",
+        "headers": [],
+        "query_string": b"",
+        **kwargs,
+    }
+
+
+async def serve(scope, incoming, count):
+    """Runs the router until it sent ``count`` messages."""
+
+    sent, received = [], asyncio.Queue()
+    for message in incoming:
+        received.put_nowait(message)
+
+    async def send(message):
+        sent.append(message)
+        if len(sent) == count:
+            received.put_nowait({"type": f"{scope['type']}.disconnect"})
+
+    await asyncio.wait_for(
+        PushRouter(fallback)(scope, received.get, send), timeout=5
+    )
+    return sent
+
+
+def test_changes_are_streamed_as_server_sent_events(feed):
+    published = change()
+
+    async def run():
+        task = asyncio.ensure_future(serve(scope("http"), [], 3))
+        while not feed.subscribers:
+            await asyncio.sleep(0.01)
+        feed.publish([published])
+        return await task
+
+    start, retry, event = asyncio.run(run())
+    assert start["status"] == 200
+    assert (b"content-type", b"text/event-stream") in start["headers"]
+    assert retry["body"].startswith(b"retry:")
+    lines = event["body"].decode().splitlines()
+    assert lines[:2] == ["id: 1", "event: updated"]
+    data = json.loads(lines[2].removeprefix("data: "))
+    assert data["id"] == str(published.uid)
+    assert len(data["occurrences"]) == 1
+    assert not feed.subscribers
+
+
+def test_missed_changes_are_sent_over_websocket(feed):
+    published = [change(), change()]
+    feed.publish(published)
+    connection = scope("websocket", query_string=b"last=1")
+    incoming = [{"type": "websocket.connect"}]
+
+    accept, message = asyncio.run(serve(connection, incoming, 2))
+    assert accept["type"] == "websocket.accept"
+    data = json.loads(message["text"])
+    assert (data["sequence"], data["id"]) == (2, str(published[1].uid))
+
+
+def test_other_paths_are_passed_on(feed):
+    sent = asyncio.run(serve(scope("http", path="/timetable/"), [], 1))
+    assert sent == [{"type": "fallback"}]